@@ -0,0 +1 @@
+@"%GRASS_PYTHON%" "%GISBASE%/scripts/bbo.phenips_ensemble.py" %*
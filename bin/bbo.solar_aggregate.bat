@@ -0,0 +1 @@
+@"%GRASS_PYTHON%" "%GISBASE%/scripts/bbo.solar_aggregate.py" %*
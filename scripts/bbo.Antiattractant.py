@@ -19,80 +19,163 @@
 #%option G_OPT_R_INPUT
 #% key: forest_edge_buffer
 #% description: Input raster with forest edge buffer
-#% required: yes
+#% required: no
 #%end
 #%option G_OPT_R_INPUT
 #% key: bb_spot_merged
 #% description: Name of raster to use as forest loss (binary: 1 or no-data)
-#% required: yes
+#% required: no
 #%end
 #%option G_OPT_R_OUTPUT
 #% key: antiattractant
 #% description: Output raster with antiattractant placement (binary)
 #% answer: antiattractant
-#% required: yes
+#% required: no
+#%end
+#%option
+#% key: directions
+#% type: string
+#% multiple: yes
+#% options: N,NE,E,SE,S,SW,W,NW
+#% answer: N
+#% description: Directions of forest loss neighbours excluding the buffer pixel
+#% required: no
+#%end
+#%option
+#% key: wind
+#% type: double
+#% description: Prevailing wind direction (degrees clockwise from north, direction the wind blows from) added to directions
+#% required: no
+#%end
+#%option G_OPT_R_INPUT
+#% key: aspect
+#% description: Aspect raster (degrees counterclockwise from east), the neighbour in the aspect direction is added to directions
+#% required: no
+#%end
+#%flag
+#% key: b
+#% description: Benchmark the placement on a synthetic 10000x10000 mask and exit
 #%end
 
 import grass.script as gs
 import numpy as np
 import tempfile
+import time
 import os
 
 
+# row and column offsets of the neighbour in each direction, clockwise from north
+DIRECTIONS = [('N', -1, 0), ('NE', -1, 1), ('E', 0, 1), ('SE', 1, 1),
+              ('S', 1, 0), ('SW', 1, -1), ('W', 0, -1), ('NW', -1, -1)]
+BENCHMARK_SIZE = 10000
+
+
 def read_grass_raster(raster_name):
-    
-    # Create a unique temporary file
+    # binary export, null cells as 0
+    region = gs.region()
     fd, temp_file_path = tempfile.mkstemp()
     os.close(fd)
-
-    # Export the raster to the temporary ASCII file
-    gs.run_command('r.out.ascii', input=raster_name, output=temp_file_path)
-
-    # Read the ASCII file into a numpy array
-    raster_array = np.loadtxt(temp_file_path)
-
-    # Remove the temporary file
+    gs.run_command('r.out.bin', flags='f', input=raster_name, output=temp_file_path, null=0, bytes=4,
+                   overwrite=True, quiet=True)
+    raster_array = np.fromfile(temp_file_path, dtype=np.float32).reshape((region['rows'], region['cols']))
     os.remove(temp_file_path)
-
     return raster_array
 
+
 def write_grass_raster(raster_name, data):
-    # Create a unique temporary file
+    region = gs.region()
     fd, temp_file_path = tempfile.mkstemp()
     os.close(fd)
+    data.astype(np.uint8).tofile(temp_file_path)
+    gs.run_command('r.in.bin', input=temp_file_path, output=raster_name, bytes=1,
+                   rows=region['rows'], cols=region['cols'],
+                   north=region['n'], south=region['s'], east=region['e'], west=region['w'],
+                   overwrite=True, quiet=True)
+    os.remove(temp_file_path)
 
-    # Save the numpy array to the temporary ASCII file
-    np.savetxt(temp_file_path, data, fmt='%d')
 
-    # Import the data from the temporary ASCII file into a new GRASS raster
-    gs.run_command('r.in.ascii', input=temp_file_path, output=raster_name, overwrite=True)
+def neighbour(mask, row_offset, col_offset):
+    # value of the neighbour at (row + row_offset, col + col_offset), False outside the array
+    shifted = np.zeros_like(mask)
+    rows, cols = mask.shape
+    target_rows = slice(max(0, -row_offset), rows - max(0, row_offset))
+    target_cols = slice(max(0, -col_offset), cols - max(0, col_offset))
+    source_rows = slice(max(0, row_offset), rows - max(0, -row_offset))
+    source_cols = slice(max(0, col_offset), cols - max(0, -col_offset))
+    shifted[target_rows, target_cols] = mask[source_rows, source_cols]
+    return shifted
+
+
+def direction_index(azimuth):
+    # nearest of the 8 directions to the azimuth (degrees clockwise from north)
+    return np.round(np.asarray(azimuth) / 45.0).astype(int) % 8
+
+
+def antiattractant_mask(forest_edge_buffer, bb_spot_merged, directions=('N',), aspect=None):
+    # buffer pixels without forest loss in any of the directions (and in the aspect direction of the pixel)
+    excluded = np.zeros(forest_edge_buffer.shape, dtype=bool)
+    names = [d[0] for d in DIRECTIONS]
+    for name in directions:
+        _, row_offset, col_offset = DIRECTIONS[names.index(name)]
+        excluded |= neighbour(bb_spot_merged, row_offset, col_offset)
+    if aspect is not None:
+        aspect_direction = direction_index(90.0 - aspect)
+        valid = np.isfinite(aspect) & (0 < aspect)
+        for k, (_, row_offset, col_offset) in enumerate(DIRECTIONS):
+            excluded |= valid & (aspect_direction == k) & neighbour(bb_spot_merged, row_offset, col_offset)
+    return forest_edge_buffer & ~excluded
+
+
+def antiattractant_mask_loop(forest_edge_buffer, bb_spot_merged):
+    # former north neighbour test, reference for the benchmark
+    mask = np.copy(forest_edge_buffer)
+    for row in range(1, forest_edge_buffer.shape[0]):
+        for col in range(forest_edge_buffer.shape[1]):
+            if forest_edge_buffer[row, col] and bb_spot_merged[row-1, col]:
+                mask[row, col] = False
+    return mask
 
-    # Remove the temporary file
-    os.remove(temp_file_path)
 
-def process_antiattractant(forest_edge_buffer_layer, bb_spot_merged_layer, output_layer):
+def benchmark():
+    rng = np.random.default_rng(0)
+    forest_edge_buffer = rng.random((BENCHMARK_SIZE, BENCHMARK_SIZE), dtype=np.float32) < 0.1
+    bb_spot_merged = rng.random((BENCHMARK_SIZE, BENCHMARK_SIZE), dtype=np.float32) < 0.05
+
+    small = (slice(0, 500), slice(0, 500))
+    start = time.perf_counter()
+    expected = antiattractant_mask_loop(forest_edge_buffer[small], bb_spot_merged[small])
+    loop_time = time.perf_counter() - start
+    same = np.array_equal(expected, antiattractant_mask(forest_edge_buffer[small], bb_spot_merged[small]))
+
+    start = time.perf_counter()
+    mask = antiattractant_mask(forest_edge_buffer, bb_spot_merged)
+    array_time = time.perf_counter() - start
+    start = time.perf_counter()
+    antiattractant_mask(forest_edge_buffer, bb_spot_merged, [d[0] for d in DIRECTIONS])
+    all_time = time.perf_counter() - start
+
+    print(f"Synthetic mask {BENCHMARK_SIZE}x{BENCHMARK_SIZE}, {int(np.sum(mask))} antiattractant pixels")
+    print(f"Loop on 500x500: {loop_time:.3f} s (estimated {loop_time * (BENCHMARK_SIZE / 500.0) ** 2:.0f} s for the mask)")
+    print(f"Array shifts, N: {array_time:.3f} s, all 8 directions: {all_time:.3f} s")
+    print(f"Array result equals the loop: {same}")
+
+
+def process_antiattractant(forest_edge_buffer_layer, bb_spot_merged_layer, output_layer,
+                           directions=('N',), aspect_layer=None):
     # Import rasters into numpy arrays
     forest_edge_buffer = read_grass_raster(forest_edge_buffer_layer).astype(bool)
     bb_spot_merged = read_grass_raster(bb_spot_merged_layer).astype(bool)
+    aspect = None
+    if aspect_layer:
+        aspect = read_grass_raster(aspect_layer)
 
-    # Initialize the output mask with the current forest edge buffer
-    antiattractant_mask = np.copy(forest_edge_buffer)
-
-    # Iterate over each pixel, skipping the first row to avoid index errors
-    for row in range(1, forest_edge_buffer.shape[0]):
-        for col in range(forest_edge_buffer.shape[1]):
-            # If the pixel in forest_edge_buffer is True and the pixel to the north in bb_spot_merged is also True
-            if forest_edge_buffer[row, col] and bb_spot_merged[row-1, col]:
-                antiattractant_mask[row, col] = False
-
-    # Convert the boolean mask back to an integer type suitable for writing to a TIFF
-    antiattractant = antiattractant_mask.astype(np.uint8)
+    antiattractant = antiattractant_mask(forest_edge_buffer, bb_spot_merged, directions, aspect).astype(np.uint8)
 
     # Export the result back into GRASS GIS
     write_grass_raster(output_layer, antiattractant)
 
     # Count pixels with value of 1
-    num_pixels = np.sum(antiattractant == 1)
+    num_pixels = int(np.sum(antiattractant == 1))
 
     # Calculate length of treated forest edges
     length_of_edges = num_pixels * 30
@@ -112,6 +195,16 @@ def process_antiattractant(forest_edge_buffer_layer, bb_spot_merged_layer, outpu
 
 def main():
     options, flags = gs.parser()
-    process_antiattractant(options['forest_edge_buffer'], options['bb_spot_merged'], options['antiattractant'])
+    if flags['b']:
+        benchmark()
+        return
+    for key in ['forest_edge_buffer', 'bb_spot_merged', 'antiattractant']:
+        if not options[key]:
+            gs.fatal(f"Required parameter <{key}> not set")
+    directions = [d for d in options['directions'].split(',') if d]
+    if options['wind']:
+        directions.append(DIRECTIONS[int(direction_index(float(options['wind'])))][0])
+    process_antiattractant(options['forest_edge_buffer'], options['bb_spot_merged'], options['antiattractant'],
+                           directions, options['aspect'])
 if __name__ == "__main__":
     main()
@@ -31,59 +31,116 @@
 #% answer: forest_edge
 #% required: yes
 #%end
+#%option
+#% key: width
+#% type: double
+#% description: Edge width (meters), one pixel if empty
+#% required: no
+#%end
+#%option G_OPT_R_OUTPUT
+#% key: orientation
+#% description: Output raster with aspect of the exposed forest edge, direction the forest wall faces (degrees clockwise from north)
+#% required: no
+#%end
 
 import grass.script as gs
-import rasterio
 import numpy as np
-from scipy.ndimage import binary_erosion, label
+import tempfile
+import os
+from scipy.ndimage import distance_transform_edt, gaussian_filter, label
 
-def process_forest_edge(s50mask, bb_spot_merged, forest_edge):
-    # Export rasters from GRASS GIS for processing
-    gs.run_command('r.out.gdal', input=s50mask, output="temp_forest_mask.tif", format='GTiff', createopt='COMPRESS=LZW', overwrite=True)
-    gs.run_command('r.out.gdal', input=bb_spot_merged, output="temp_object_mask.tif", format='GTiff', createopt='COMPRESS=LZW', overwrite=True)
+# sectors of the edge orientation summary, clockwise from north
+SECTORS = ['N', 'NE', 'E', 'SE', 'S', 'SW', 'W', 'NW']
 
-    # Read the rasters using rasterio
-    with rasterio.open("temp_forest_mask.tif") as forest_src:
-        forest_mask = forest_src.read(1).astype(bool)
-        profile = forest_src.profile
 
-    with rasterio.open("temp_object_mask.tif") as object_src:
-        object_mask = object_src.read(1).astype(bool)
+def read_grass_raster(raster_name):
+    # binary export, null cells as 0
+    region = gs.region()
+    fd, temp_file_path = tempfile.mkstemp()
+    os.close(fd)
+    gs.run_command('r.out.bin', flags='f', input=raster_name, output=temp_file_path, null=0, bytes=4,
+                   overwrite=True, quiet=True)
+    raster_array = np.fromfile(temp_file_path, dtype=np.float32).reshape((region['rows'], region['cols']))
+    os.remove(temp_file_path)
+    return raster_array
 
-    # Label the objects in the object mask
-    labeled_array, _ = label(object_mask)
 
-    # Identify edges of each object
-    edge_mask = np.zeros_like(labeled_array, dtype=np.bool_)
-    for i in range(1, labeled_array.max() + 1):
-        object_slice = (labeled_array == i)
-        object_border = object_slice & np.logical_not(binary_erosion(object_slice))
-        edge_mask = np.logical_or(edge_mask, object_border)
+def write_grass_raster(raster_name, data, null_value):
+    # integer raster, null_value cells as no-data
+    region = gs.region()
+    fd, temp_file_path = tempfile.mkstemp()
+    os.close(fd)
+    data.astype(np.int16).tofile(temp_file_path)
+    gs.run_command('r.in.bin', flags='s', input=temp_file_path, output=raster_name, bytes=2, anull=null_value,
+                   rows=region['rows'], cols=region['cols'],
+                   north=region['n'], south=region['s'], east=region['e'], west=region['w'],
+                   overwrite=True, quiet=True)
+    os.remove(temp_file_path)
 
-    # Filter edges to keep only those adjacent to forest areas
-    forest_edge_mask = edge_mask & forest_mask
 
-    # Count the number of edge pixels
-    num_edge_pixels = np.sum(forest_edge_mask)
+def label_change_edges(labels):
+    # pixels of a labelled object with a 4-neighbour of another label (or outside the raster)
+    padded = np.pad(labels, 1)
+    centre = padded[1:-1, 1:-1]
+    changed = ((centre != padded[:-2, 1:-1]) | (centre != padded[2:, 1:-1]) |
+               (centre != padded[1:-1, :-2]) | (centre != padded[1:-1, 2:]))
+    return (centre != 0) & changed
+
+
+def distance_edges(object_mask, width, sampling):
+    # object pixels not farther than width from a pixel outside the objects (outside the raster included)
+    distance = distance_transform_edt(np.pad(object_mask, 1), sampling=sampling)[1:-1, 1:-1]
+    return object_mask & (distance <= width)
 
-    # Calculate the length of the treated forest edges
-    length_of_edges = num_edge_pixels * 30  # Assuming each pixel represents 30 meters
 
-    # Write the result to a file
-    profile.update(dtype=rasterio.uint8, count=1)
-    with rasterio.open("temp_forest_edge.tif", 'w', **profile) as dst:
-        dst.write(forest_edge_mask.astype(rasterio.uint8) * 255, 1)
+def edge_orientation(object_mask, sampling, sigma):
+    # aspect of the exposed forest edge: the forest wall faces into the object,
+    # the inward normal of the objects (degrees clockwise from north)
+    smooth = gaussian_filter(object_mask.astype(np.float64), sigma)
+    d_row, d_col = np.gradient(smooth)
+    north = -d_row / sampling[0]
+    east = d_col / sampling[1]
+    return np.degrees(np.arctan2(east, north)) % 360.0
 
-    # Import the processed data back into GRASS GIS
-    gs.run_command('r.in.gdal', input="temp_forest_edge.tif", output=forest_edge, overwrite=True)
 
-    # Print the desired information
+def process_forest_edge(s50mask, bb_spot_merged, forest_edge, width=None, orientation=None):
+    region = gs.region()
+    sampling = (region['nsres'], region['ewres'])
+    forest_mask = read_grass_raster(s50mask).astype(bool)
+    object_mask = read_grass_raster(bb_spot_merged).astype(bool)
+
+    # Edges of all objects at once: one pixel from label changes, wider edges by distance
+    labeled_array, num_objects = label(object_mask)
+    if width is None or width <= min(sampling):
+        edge_mask = label_change_edges(labeled_array)
+    else:
+        edge_mask = distance_edges(object_mask, width, sampling)
+
+    # Filter edges to keep only those adjacent to forest areas
+    forest_edge_mask = edge_mask & forest_mask
+    write_grass_raster(forest_edge, forest_edge_mask, 0)
+
+    # Count the number of edge pixels
+    num_edge_pixels = int(np.sum(forest_edge_mask))
+    edge_width_pixels = 1 if width is None else max(1.0, width / min(sampling))
+    length_of_edges = num_edge_pixels * region['ewres'] / edge_width_pixels
+
     print("Forest edge processing complete.")
+    print(f"The number of objects is {num_objects}.")
     print(f"The number of pixels is {num_edge_pixels}.")
-    print(f"Length of treated forest edges equals {length_of_edges} meters.")
+    print(f"Length of treated forest edges equals {length_of_edges:.0f} meters.")
+
+    if orientation:
+        azimuth = edge_orientation(object_mask, sampling, edge_width_pixels)
+        write_grass_raster(orientation, np.where(forest_edge_mask, np.round(azimuth) % 360, -1), -1)
+        sectors = np.round(azimuth[forest_edge_mask] / 45.0).astype(int) % 8
+        for k, name in enumerate(SECTORS):
+            print(f"Forest edge facing {name}: {np.sum(sectors == k) * region['ewres'] / edge_width_pixels:.0f} meters.")
 
 def main():
     options, flags = gs.parser()
-    process_forest_edge(options['s50mask'], options['bb_spot_merged'], options['forest_edge'])
+    width = float(options['width']) if options['width'] else None
+    process_forest_edge(options['s50mask'], options['bb_spot_merged'], options['forest_edge'],
+                        width, options['orientation'])
 if __name__ == "__main__":
     main()
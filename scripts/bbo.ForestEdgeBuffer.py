@@ -27,59 +27,120 @@
 #%end
 #%option G_OPT_R_OUTPUT
 #% key: forest_edge_buffer
-#% description: Output raster with forest edge buffer
+#% description: Output raster with forest edge buffer (ring number, inner rings negative)
 #% answer: forest_edge_buffer
 #% required: yes
 #%end
+#%option
+#% key: rings
+#% type: double
+#% multiple: yes
+#% description: Outer distances of buffer rings (meters, e.g. 30,60,100), one pixel if empty
+#% required: no
+#%end
+#%option
+#% key: side
+#% type: string
+#% options: outer,inner,both
+#% answer: outer
+#% description: Buffer in the forest (outer), in the forest loss (inner) or both
+#% required: yes
+#%end
 
 import grass.script as gs
-import rasterio
 import numpy as np
-from scipy.ndimage import binary_dilation
+import tempfile
+import os
+from scipy.ndimage import distance_transform_edt
 
-def process_forest_edge(s50mask_upd, bb_spot_merged, forest_edge_buffer):
-    # Export rasters from GRASS GIS for processing
-    gs.run_command('r.out.gdal', input=s50mask_upd, output="temp_forest_mask.tif", format='GTiff', createopt='COMPRESS=LZW', overwrite=True)
-    gs.run_command('r.out.gdal', input=bb_spot_merged, output="temp_loss_mask.tif", format='GTiff', createopt='COMPRESS=LZW', overwrite=True)
 
-    # Read the rasters using rasterio
-    with rasterio.open("temp_forest_mask.tif") as forest_src:
-        forest_mask = forest_src.read(1).astype(bool)
-        forest_profile = forest_src.profile
+def read_grass_raster(raster_name):
+    # binary export, null cells as 0
+    region = gs.region()
+    fd, temp_file_path = tempfile.mkstemp()
+    os.close(fd)
+    gs.run_command('r.out.bin', flags='f', input=raster_name, output=temp_file_path, null=0, bytes=4,
+                   overwrite=True, quiet=True)
+    raster_array = np.fromfile(temp_file_path, dtype=np.float32).reshape((region['rows'], region['cols']))
+    os.remove(temp_file_path)
+    return raster_array
 
-    with rasterio.open("temp_loss_mask.tif") as loss_src:
-        loss_mask = loss_src.read(1).astype(bool)
 
-    # Create a dilation of the loss mask
-    dilated_loss_mask = binary_dilation(loss_mask, iterations=1)
+def write_grass_raster(raster_name, data):
+    region = gs.region()
+    fd, temp_file_path = tempfile.mkstemp()
+    os.close(fd)
+    data.astype(np.int16).tofile(temp_file_path)
+    gs.run_command('r.in.bin', flags='s', input=temp_file_path, output=raster_name, bytes=2,
+                   rows=region['rows'], cols=region['cols'],
+                   north=region['n'], south=region['s'], east=region['e'], west=region['w'],
+                   overwrite=True, quiet=True)
+    os.remove(temp_file_path)
 
-    # Find the edge pixels: pixels that are in the dilated loss mask AND in the updated forest mask
-    edge_pixels = np.logical_and(dilated_loss_mask, forest_mask)
 
-    # Count the number of edge pixels
-    num_edge_pixels = np.sum(edge_pixels)
+def ring_numbers(distance, candidates, rings, include_zero):
+    # ring k holds distances in (rings[k-1], rings[k]], the first ring from 0
+    numbers = np.searchsorted(np.asarray(rings), distance, side='left') + 1
+    inside = candidates & (distance <= rings[-1])
+    if not include_zero:
+        inside &= (0 < distance)
+    return np.where(inside, numbers, 0)
+
+
+def distance_to(mask, sampling):
+    # distance of every pixel to the nearest mask pixel, infinite without mask pixels
+    if not np.any(mask):
+        return np.full(mask.shape, np.inf)
+    return distance_transform_edt(~mask, sampling=sampling)
 
-    # Calculate the length of the treated forest edges
-    length_of_edges = num_edge_pixels * 30  # Assuming each pixel represents 30 meters
 
-    # Convert the edge pixels mask back to uint8 for raster output
-    # Edge pixels are marked as 1, others as 0
-    edge_pixels_uint8 = edge_pixels.astype(np.uint8) * 255
+def edge_buffer_rings(forest_mask, loss_mask, rings, sampling, side='outer'):
+    # outer rings: forest pixels by distance to forest loss, inner rings (negative): forest loss pixels by distance to forest
+    buffer = np.zeros(forest_mask.shape, dtype=np.int16)
+    if side in ('outer', 'both'):
+        distance = distance_to(loss_mask, sampling)
+        buffer = ring_numbers(distance, forest_mask, rings, True).astype(np.int16)
+    if side in ('inner', 'both'):
+        distance = distance_to(forest_mask & ~loss_mask, sampling)
+        inner = ring_numbers(distance, loss_mask, rings, False)
+        buffer = np.where((buffer == 0) & (0 < inner), -inner, buffer).astype(np.int16)
+    return buffer
 
-    # Write the result to a temporary file
-    forest_profile.update(dtype=rasterio.uint8, count=1)
-    with rasterio.open("temp_forest_edge_buffer.tif", 'w', **forest_profile) as dst:
-        dst.write(edge_pixels.astype(rasterio.uint8), 1)
 
-    # Import the processed data back into GRASS GIS
-    gs.run_command('r.in.gdal', input="temp_forest_edge_buffer.tif", output=forest_edge_buffer, overwrite=True)
-    
+def process_forest_edge(s50mask_upd, bb_spot_merged, forest_edge_buffer, rings=None, side='outer'):
+    region = gs.region()
+    sampling = (region['nsres'], region['ewres'])
+    forest_mask = read_grass_raster(s50mask_upd).astype(bool)
+    loss_mask = read_grass_raster(bb_spot_merged).astype(bool)
+
+    # One pixel buffer (4-neighbours of the forest loss) unless rings are given,
+    # the longer cell side keeps both orthogonal neighbours and no diagonal one
+    if not rings:
+        rings = [max(sampling)]
+    rings = sorted(rings)
+
+    buffer = edge_buffer_rings(forest_mask, loss_mask, rings, sampling, side)
+    write_grass_raster(forest_edge_buffer, buffer)
+
     print("Forest edge buffer processing complete.")
-    print(f"The number of pixels is {num_edge_pixels}.")
-    print(f"Length of treated forest edges is {length_of_edges} meters.")
+    ring_from = 0.0
+    for k, ring_to in enumerate(rings):
+        for sign, name in [(1, 'outer'), (-1, 'inner')]:
+            num_pixels = int(np.sum(buffer == sign * (k + 1)))
+            if side in (name, 'both'):
+                print(f"{name.capitalize()} ring {ring_from:g} - {ring_to:g} m: {num_pixels} pixels, "
+                      f"{num_pixels * region['ewres'] * region['nsres'] / 10000.0:.2f} ha.")
+        ring_from = ring_to
+
+    # Calculate the length of the treated forest edges
+    num_edge_pixels = int(np.sum(buffer == 1))
+    length_of_edges = num_edge_pixels * region['ewres'] * region['nsres'] / rings[0]
+    print(f"Length of treated forest edges is {length_of_edges:.0f} meters.")
 
 def main():
     options, flags = gs.parser()
-    process_forest_edge(options['s50mask_upd'], options['bb_spot_merged'], options['forest_edge_buffer'])
+    rings = [float(r) for r in options['rings'].split(',') if r]
+    process_forest_edge(options['s50mask_upd'], options['bb_spot_merged'], options['forest_edge_buffer'],
+                        rings, options['side'])
 if __name__ == "__main__":
     main()
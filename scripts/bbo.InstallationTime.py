@@ -53,15 +53,14 @@ import string
 sys.path.append(os.path.join(os.environ["GISBASE"], "scripts"))
 import bboLib
 import bboPhenipsLib
+import bboTemperatureLib
 
 def main():   
     targetMapset = bboLib.atMapset
     solarMapset = bboLib.solarMapset
     demName = "dem@dem"
 
-    shpMapset = bboLib.shpMapset
     meteostationName = bboLib.shpMeteostation + "@" + bboLib.shpMapset
-    valFieldName = bboLib.shpMeteostationValField
 
     demName = bboLib.checkInputRaster(options, "dem")
     meteostationName = options["meteo"]
@@ -82,11 +81,7 @@ def main():
         grass.run_command("g.mapset", mapset=targetMapset)
 
     # meteo station parameters
-    grass.run_command("g.mapset", mapset=shpMapset)
-   # grass.run_command("v.what.rast", map=meteostationName, raster=demName, column=valFieldName)
-    grass.run_command("g.mapset", mapset=targetMapset)
-  #  params = grass.parse_command("v.db.select", map=meteostationName, columns=valFieldName, flags="v", separator="=", quiet=True)
-    msElev = 1050 #float(params["val"].strip())
+    msElev = bboTemperatureLib.stationElevation(meteostationName, demName)
 
     dayTo += 1
     for iDay in range(dayFrom, dayTo):
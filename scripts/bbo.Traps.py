@@ -30,98 +30,176 @@
 #% description: Raster for forest edge (binary: 1 or no-data)
 #% required: yes
 #%end
-#%option G_OPT_F_INPUT
+#%option
 #% key: distance
 #% type: double
 #% description: Distance between traps (meters)
 #% answer: 50
 #% required: yes
 #%end
+#%option
+#% key: order
+#% type: string
+#% options: scan,exposure,priority
+#% answer: scan
+#% description: Placement order of edge pixels: raster rows, edge exposure (forest loss neighbours) or priority raster (descending)
+#% required: yes
+#%end
+#%option G_OPT_R_INPUT
+#% key: priority
+#% description: Priority raster for the priority order (e.g. attack probability)
+#% required: no
+#%end
 #%option G_OPT_V_OUTPUT
 #% key: pheromone_trap
 #% description: Output point layer for pheromone traps
 #% answer: pheromone_trap
 #% required: yes
 #%end
+#%option G_OPT_F_OUTPUT
+#% key: gpkg
+#% description: Output GeoPackage file for pheromone traps
+#% required: no
+#%end
 
 import grass.script as gs
 import numpy as np
-import geopandas as gpd
-import pyproj
-from shapely.geometry import Point, MultiPoint
-from shapely.ops import nearest_points, transform
-from scipy.ndimage import binary_dilation
-
+import tempfile
+import os
+from scipy.ndimage import convolve
 
-def generate_and_filter_points(forest_edge_mask, s50mask, forest_transform,
-                               forest_crs):
-    rows, cols = np.where(forest_edge_mask == 1)
-    geometries_mask = [Point(forest_transform * (col + 0.5, row + 0.5))
-                       for col, row in zip(cols, rows)]
-    gdf_mask = gpd.GeoDataFrame(geometry=geometries_mask)
-    gdf_mask.set_crs(forest_crs, inplace=True)
 
-    mask_polygon_features = [
-        shape(shape_val) for shape_val, val in
-        features.shapes(s50mask.astype(np.uint8), transform=forest_transform)
-        if val == 1
-    ]
+def read_grass_raster(raster_name):
+    # binary export, null cells as 0
+    region = gs.region()
+    fd, temp_file_path = tempfile.mkstemp()
+    os.close(fd)
+    gs.run_command('r.out.bin', flags='f', input=raster_name, output=temp_file_path, null=0, bytes=4,
+                   overwrite=True, quiet=True)
+    raster_array = np.fromfile(temp_file_path, dtype=np.float32).reshape((region['rows'], region['cols']))
+    os.remove(temp_file_path)
+    return raster_array
 
-    if not mask_polygon_features:
-        raise ValueError("No valid geometries found in s50mask!")
 
-    mask_gdf = gpd.GeoDataFrame({'geometry': mask_polygon_features})
-    mask_gdf.crs = forest_crs
+def edge_candidates(forest_edge, s50mask):
+    # edge pixels inside the forest mask, row major order
+    rows, cols = np.nonzero((forest_edge == 1) & (s50mask == 1))
+    return rows, cols
 
-    gdf_mask_within = sjoin(gdf_mask, mask_gdf, how="inner", op="within")
-    all_centroids_mask_filtered = gdf_mask_within['geometry'].values
 
-    return all_centroids_mask_filtered
+def pixel_coordinates(rows, cols):
+    region = gs.region()
+    x = region['w'] + (cols + 0.5) * region['ewres']
+    y = region['n'] - (rows + 0.5) * region['nsres']
+    return x, y
 
 
-def determine_utm_zone(centroid):
-    zone_number = (int((centroid.x + 180) / 6) % 60) + 1
-    return f"EPSG:326{zone_number:02}" if centroid.y > 0 else \
+def determine_utm_zone(lon, lat):
+    zone_number = (int((lon + 180) / 6) % 60) + 1
+    return f"EPSG:326{zone_number:02}" if lat > 0 else \
         f"EPSG:327{zone_number:02}"
 
 
-def generate_filtered_centroids_shp(edge, forest_transform, forest_crs,
-                                    all_centroids_mask_filtered, output_file_path):
-    rows, cols = np.where(edge == 1)
-    geometries = [Point(forest_transform * (col + 0.5, row + 0.5))
-                  for col, row in zip(cols, rows)]
-    gdf = gpd.GeoDataFrame(geometry=geometries)
-    gdf.set_crs(forest_crs, inplace=True)
-
-    all_centroids = [(geometry.x, geometry.y) for geometry in gdf.geometry]
-    utm_zone = determine_utm_zone(Point(all_centroids[0]))
-
-    project_to_utm = pyproj.Transformer.from_crs(forest_crs, utm_zone,
-                                                 always_xy=True).transform
-    project_to_wgs84 = pyproj.Transformer.from_crs(utm_zone, forest_crs,
-                                                   always_xy=True).transform
-    all_centroids_mask_utm = [transform(project_to_utm, Point(c))
-                              for c in all_centroids_mask_filtered]
-
-    final_centroids_mask_utm = []
-    for point in all_centroids_mask_utm:
-        if final_centroids_mask_utm:
-            nearest = nearest_points(point, MultiPoint(final_centroids_mask_utm))
-        else:
-            nearest = [None, Point(9999, 9999)]
-
-        if point.distance(nearest[1]) > 50:
-            final_centroids_mask_utm.append(point)
-    final_centroids_mask = [transform(project_to_wgs84, point)
-                            for point in final_centroids_mask_utm]
-    
-    # Calculate the number of traps
-    num_traps = len(final_centroids_mask)
+def metric_coordinates(x, y):
+    # spacing is measured in meters, latitude-longitude locations are projected to UTM
+    if not gs.locn_is_latlong() or len(x) == 0:
+        return x, y
+    import pyproj
+    utm_zone = determine_utm_zone(x[0], y[0])
+    project_to_utm = pyproj.Transformer.from_crs("EPSG:4326", utm_zone, always_xy=True)
+    return project_to_utm.transform(x, y)
+
+
+def edge_exposure(bb_spot_merged):
+    # number of forest loss pixels among the 8 neighbours
+    kernel = np.ones((3, 3))
+    kernel[1, 1] = 0
+    return convolve((bb_spot_merged == 1).astype(np.float64), kernel, mode='constant')
+
+
+def placement_order(rows, cols, values=None):
+    # candidates by descending values, ties in row major order
+    if values is None:
+        return np.arange(len(rows))
+    return np.lexsort((np.arange(len(rows)), -values[rows, cols]))
+
+
+def place_traps(x, y, spacing, order):
+    # greedy placement, a candidate is accepted when no trap is within spacing;
+    # traps are hashed to a uniform grid of spacing cells, so only 9 grid cells are searched
+    cell_x = np.floor(x / spacing).astype(np.int64)
+    cell_y = np.floor(y / spacing).astype(np.int64)
+    spacing2 = spacing * spacing
+    buckets = {}
+    accepted = []
+    for i in order:
+        cx, cy = cell_x[i], cell_y[i]
+        free = True
+        for key in [(cx + dx, cy + dy) for dx in (-1, 0, 1) for dy in (-1, 0, 1)]:
+            for j in buckets.get(key, ()):
+                if (x[i] - x[j]) ** 2 + (y[i] - y[j]) ** 2 <= spacing2:
+                    free = False
+                    break
+            if not free:
+                break
+        if free:
+            accepted.append(i)
+            buckets.setdefault((cx, cy), []).append(i)
+    return np.array(accepted, dtype=np.int64)
+
+
+def write_traps_vector(vector_name, x, y, priority):
+    lines = [f"{x[i]}|{y[i]}|{i + 1}|{priority[i]}" for i in range(len(x))]
+    gs.write_command('v.in.ascii', input='-', output=vector_name, separator='pipe', x=1, y=2, cat=3,
+                     columns='x double precision, y double precision, cat integer, priority double precision',
+                     stdin="\n".join(lines) + "\n", overwrite=True, quiet=True)
+
+
+def write_traps_gpkg(file_name, x, y, priority):
+    try:
+        import geopandas as gpd
+    except ImportError:
+        gs.fatal("GeoPackage output requires the geopandas package")
+    crs = gs.read_command('g.proj', flags='wf').strip()
+    gdf = gpd.GeoDataFrame({'priority': priority}, geometry=gpd.points_from_xy(x, y), crs=crs)
+    gdf.to_file(file_name, driver='GPKG')
+
+
+def process_traps(s50mask_layer, bb_spot_merged_layer, forest_edge_layer, spacing, order_name,
+                  priority_layer, output_layer, gpkg_file=None):
+    forest_edge = read_grass_raster(forest_edge_layer)
+    rows, cols = edge_candidates(forest_edge, read_grass_raster(s50mask_layer))
+    if len(rows) == 0:
+        gs.fatal("No forest edge pixels inside the forest mask")
+
+    if order_name == 'exposure':
+        values = edge_exposure(read_grass_raster(bb_spot_merged_layer))
+    elif order_name == 'priority':
+        if not priority_layer:
+            gs.fatal("Order <priority> requires the <priority> raster")
+        values = read_grass_raster(priority_layer)
+    else:
+        values = None
+    order = placement_order(rows, cols, values)
+
+    x, y = pixel_coordinates(rows, cols)
+    mx, my = metric_coordinates(x, y)
+    traps = place_traps(np.asarray(mx), np.asarray(my), spacing, order)
+    priority = values[rows, cols][traps] if values is not None else np.zeros(len(traps))
+
+    write_traps_vector(output_layer, x[traps], y[traps], priority)
+    if gpkg_file:
+        write_traps_gpkg(gpkg_file, x[traps], y[traps], priority)
 
     print("Trap installation point generation is complete.")
-    print(f"The number of traps is {num_traps}.")
+    print(f"The number of edge pixels is {len(rows)}.")
+    print(f"The number of traps is {len(traps)}.")
+
 
 def main():
     options, flags = gs.parser()
+    process_traps(options['s50mask'], options['bb_spot_merged'], options['forest_edge'],
+                  float(options['distance']), options['order'], options['priority'],
+                  options['pheromone_trap'], options['gpkg'])
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
@@ -4,7 +4,7 @@
 #
 # MODULE:       bbo.drought_index
 # AUTHOR(S):	Miroslav Blazenec, Rastislav Jakus, Milan Koren
-# PURPOSE:      Computes NSC2 index for Landsat scene
+# PURPOSE:      Computes drought index
 # COPYRIGHT:	This program is free software under the GNU General Public
 #		License (>=v2). Read the file COPYING that comes with GRASS
 #		for details.
@@ -72,6 +72,20 @@
 #% description: Reset of cumulative deficit
 #% required: yes
 #%end
+#%option
+#% key: dibreaks
+#% type: double
+#% multiple: yes
+#% description: Drought index risk class breaks (class is the number of breaks <= di), no risk if empty
+#% required: no
+#%end
+#%option
+#% key: cdefbreaks
+#% type: double
+#% multiple: yes
+#% description: Cumulative deficit risk class breaks (class is the number of breaks < cdef), no risk if empty
+#% required: no
+#%end
 
 import sys
 import os
@@ -84,26 +98,26 @@ import bboLib
 import bboDroughtLib
 
 
-def printValues(dayFrom, dayTo, airTemperature, realPrecipitation, solarRadiation,
-                potentialTransp, realTransp, dzvpSeries, deficitSeries, cumDefSeries, droughtIdx):
-    i = 0
-    grass.message("day temp precip radiat ptransp rtransp swc deficit cumdeficit di")
-    for iDay in range(dayFrom, dayTo):
-        grass.message("{0} {1} {2} {3} {4} {5} {6} {7} {8} {9}".format(iDay, airTemperature[i][1], realPrecipitation[i][1], solarRadiation[i][1],
-                      potentialTransp[i][1], realTransp[i][1], dzvpSeries[i][1], deficitSeries[i][1], cumDefSeries[i][1], droughtIdx[i][1]))
-        i += 1
+def writeMap(iDay, values, mapPrefix):
+    mapFN = bboLib.rasterDay(mapPrefix, iDay)
+    bboLib.writeRasterArray(mapFN, values)
+    grass.message(str.format("{3} day={0} min={1} max={2}", iDay, numpy.nanmin(values), numpy.nanmax(values), mapFN))
+
 
+def writeRisk(iDay, classes, stage, riskPrefix):
+    # risk class increased in swarming stage, written for days with the stage raster as calcRiskDI
+    if (stage is not None):
+        bboLib.writeRasterArray(bboLib.rasterDay(riskPrefix, iDay), classes + (stage == 1))
 
-def writeMap(iDay, valR, mapPrefix, nullVal):
-    mapFN = (bboLib.rasterDay(mapPrefix, iDay))
-    valR.write(mapFN, overwrite=True, null=nullVal)
-    grass.run_command("r.null", map=mapFN, setnull=nullVal, quiet=True)
-    grass.message(str.format("{3} day={0} min={1} max={2}", iDay, bboLib.getMinValue(mapFN), bboLib.getMaxValue(mapFN), mapFN))
+
+def parseBreaks(optionValue):
+    if (not optionValue):
+        return None
+    return [float(b) for b in optionValue.split(",")]
 
 
 def main():
     targetMapset = bboLib.hydroMapset
-    nullVal = -999999
 
     userMapset = grass.gisenv()["MAPSET"]  
     if not userMapset == targetMapset:
@@ -115,6 +129,8 @@ def main():
     pwpFN = bboLib.checkInputRaster(options, 'pwp')
     interceptionVal = int(options['intercept'])
     resetOfCumDeficit = int(options['rcd'])
+    diBreaks = parseBreaks(options['dibreaks'])
+    cdefBreaks = parseBreaks(options['cdefbreaks'])
    
     dayFrom = int(options["dayfrom"])
     dayTo = int(options["dayto"])
@@ -128,16 +144,6 @@ def main():
 
     minDay = bboLib.seriesMinDay(solarRadiation)
     maxDay = bboLib.seriesMaxDay(solarRadiation)
-
-    n = maxDay - minDay + 1
-    while (bboLib.garray3DMaxRows < n):
-        i = len(solarRadiation) - 1
-        solarRadiation.remove(solarRadiation[i])
-        realPrecipitation.remove(realPrecipitation[i])
-        airTemperature.remove(airTemperature[i])
-        minDay = bboLib.seriesMinDay(solarRadiation)
-        maxDay = bboLib.seriesMaxDay(solarRadiation)
-        n = maxDay - minDay + 1
     
     grass.message("min day {0}   max day {1}   series length {2}".format(minDay, maxDay, maxDay - minDay + 1))
     grass.message("day from {0}   day to {1}   days {2}".format(dayFrom, dayTo, dayTo - dayFrom + 1))
@@ -151,47 +157,49 @@ def main():
     if maxDay < dayTo:
         grass.fatal("Parameter <dayto> is out of series ({0})".format(maxDay))
 
-    gregion = grass.region()
-    nRows = gregion['rows']
-    nCols = gregion['cols']
-    
-    iswc = bboLib.garray(iswcFN)
-    swc = bboLib.garray(swcFN)
-    pda = bboLib.garray(pdaFN)
-    pwp = bboLib.garray(pwpFN)
-
-    nLays = dayFrom - dayTo + 1
-    solarA = bboLib.garray3d(nLays)
-    solarA.readMapSeries(bboLib.srdayPrefix, minDay, maxDay)
-
-    for iDay in range(dayFrom, dayTo+1):
-    #for iDay in (146,138,157,159):
-        diR = bboLib.garray(None)
-        defR = bboLib.garray(None)
-        cdefR = bboLib.garray(None)
-        for r in range(nRows):
-            if ((r % 10) == 0):
-                grass.message(str.format("day: {0}   row: {1}", iDay, r))
-            for c in range(nCols):
-                diR[r, c] = nullVal
-                defR[r, c] = nullVal
-                cdefR[r, c] = nullVal
-                if (0 < iswc[r, c] and 0 < swc[r, c] and 0 < pda[r, c] and 0 < pwp[r, c]):
-                    #radiationSer = bboLib.readMapSeries(bboLib.srdayPrefix, dayFrom, dayTo, r, c)
-                    radiationSer = solarA.getSeries(minDay, maxDay, r, c)
-                    potentialTransp, realTransp, dzvpSeries, droughtIdx, deficitSeries, cumDefSeries = bboDroughtLib.calculateDroughtIndex(
-                                        minDay, maxDay, 
-                                        airTemperature, radiationSer, realPrecipitation,
-                                        iswc[r, c], swc[r, c], pda[r, c], pwp[r, c], interceptionVal,resetOfCumDeficit)
-                    i = iDay - minDay
-                    diR[r, c] = droughtIdx[i][1]
-                    defR[r, c] = deficitSeries[i][1]
-                    cdefR[r, c] = cumDefSeries[i][1]
-                    #printValues(dayFrom, dayTo, airTemperature, realPrecipitation, solarRadiation,
-                    #            potentialTransp, realTransp, dzvpSeries, deficitSeries, cumDefSeries, droughtIdx)
-        writeMap(iDay, diR, bboLib.diPrefix, nullVal)
-        writeMap(iDay, defR, bboLib.deficitPrefix, nullVal)
-        writeMap(iDay, cdefR, bboLib.cumDefPrefix, nullVal)
+    # water balance of all cells streamed day by day from the beginning of the series
+    state = bboDroughtLib.droughtStateInit(bboLib.readRasterArray(iswcFN, True), bboLib.readRasterArray(swcFN, True),
+                                           bboLib.readRasterArray(pdaFN, True), bboLib.readRasterArray(pwpFN, True),
+                                           interceptionVal, resetOfCumDeficit)
+    diSummary = None
+    cdefSummary = None
+    if (diBreaks):
+        diSummary = bboDroughtLib.riskSummaryInit(state["valid"].shape, len(diBreaks))
+    if (cdefBreaks):
+        cdefSummary = bboDroughtLib.riskSummaryInit(state["valid"].shape, len(cdefBreaks))
+
+    i = 0
+    for iDay in range(minDay, dayTo + 1):
+        if (iDay != airTemperature[i][0] or iDay != realPrecipitation[i][0]):
+            grass.fatal("Input data error (iDay={0})".format(iDay))
+        solar = bboLib.readRasterArray(bboLib.rasterDayMapset(bboLib.srdayPrefix, iDay, bboLib.solarMapset), True)
+        day = bboDroughtLib.droughtStep(state, airTemperature[i][1], solar, realPrecipitation[i][1])
+        i += 1
+        if (iDay < dayFrom):
+            continue
+
+        writeMap(iDay, day.di, bboLib.diPrefix)
+        writeMap(iDay, day.deficit, bboLib.deficitPrefix)
+        writeMap(iDay, day.cdef, bboLib.cumDefPrefix)
+
+        if (diSummary or cdefSummary):
+            stageName = bboLib.rasterDayMapset(bboLib.phenipsStagePrefix, iDay, bboLib.phenipsMapset)
+            stage = None
+            if (bboLib.getRasterModificationTime(stageName) is not None):
+                stage = bboLib.readRasterArray(stageName, True)
+            if (diSummary):
+                classes = bboDroughtLib.riskClass(day.di, diBreaks)
+                writeRisk(iDay, classes, stage, bboLib.riskDIPrefix)
+                bboDroughtLib.riskSummaryUpdate(diSummary, classes, iDay)
+            if (cdefSummary):
+                classes = bboDroughtLib.riskClass(day.cdef, cdefBreaks, True)
+                writeRisk(iDay, classes, stage, bboLib.riskCDEFPrefix)
+                bboDroughtLib.riskSummaryUpdate(cdefSummary, classes, iDay)
+
+    if (diSummary):
+        bboDroughtLib.writeRiskSummary(diSummary, bboLib.riskDIDaysPrefix, bboLib.riskDIFirstPrefix, state["valid"])
+    if (cdefSummary):
+        bboDroughtLib.writeRiskSummary(cdefSummary, bboLib.riskCDEFDaysPrefix, bboLib.riskCDEFFirstPrefix, state["valid"])
 
     # set history for site map
     if not userMapset == targetMapset:
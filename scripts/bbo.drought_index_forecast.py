@@ -2,9 +2,9 @@
 #
 ############################################################################
 #
-# MODULE:       bbo.drought_index
+# MODULE:       bbo.drought_index_forecast
 # AUTHOR(S):	Miroslav Blazenec, Rastislav Jakus, Milan Koren
-# PURPOSE:      Computes NSC2 index for Landsat scene
+# PURPOSE:      Computes drought index forecast
 # COPYRIGHT:	This program is free software under the GNU General Public
 #		License (>=v2). Read the file COPYING that comes with GRASS
 #		for details.
@@ -12,8 +12,8 @@
 #############################################################################
 
 #%module
-#% description: Computes drought index
-#% keywords: drought index
+#% description: Computes drought index forecast from the observed state checkpoint
+#% keywords: drought index forecast
 #% keywords:TANABBO
 #%end
 #%option
@@ -21,7 +21,7 @@
 #% type: integer
 #% options: 1-365
 #% answer: 104
-#% description: Day from (1 - 365)
+#% description: First forecast day (1 - 365)
 #% required : yes
 #%end
 #%option
@@ -29,7 +29,7 @@
 #% type: integer
 #% options: 1-365
 #% answer: 106
-#% description: Day to (1 - 365)
+#% description: Last forecast day (1 - 365)
 #% required : yes
 #%end
 #%option G_OPT_R_INPUT
@@ -72,6 +72,41 @@
 #% description: Reset of cumulative deficit
 #% required: yes
 #%end
+#%option
+#% key: tseries
+#% type: string
+#% multiple: yes
+#% answer: md_tmean_forecast.txt
+#% description: Forecast mean air temperature series, one scenario per series
+#% required : yes
+#%end
+#%option
+#% key: pseries
+#% type: string
+#% multiple: yes
+#% answer: md_prec_forecast.txt
+#% description: Forecast precipitation series, one per temperature series or one for all
+#% required : yes
+#%end
+#%option
+#% key: quantiles
+#% type: double
+#% multiple: yes
+#% answer: 0.1,0.5,0.9
+#% description: Ensemble quantiles (0 - 1), used for more than one scenario
+#% required : yes
+#%end
+#%option
+#% key: checkpoint
+#% type: string
+#% answer: drought_checkpoint.npz
+#% description: Observed drought state file (location _data directory)
+#% required : yes
+#%end
+#%flag
+#% key: r
+#% description: Recalculate the observed drought state
+#%end
 
 import sys
 import os
@@ -84,26 +119,27 @@ import bboLib
 import bboDroughtLib
 
 
-def printValues(dayFrom, dayTo, airTemperature, realPrecipitation, solarRadiation,
-                potentialTransp, realTransp, dzvpSeries, deficitSeries, cumDefSeries, droughtIdx):
-    i = 0
-    grass.message("day temp precip radiat ptransp rtransp swc deficit cumdeficit di")
-    for iDay in range(dayFrom, dayTo):
-        grass.message("{0} {1} {2} {3} {4} {5} {6} {7} {8} {9}".format(iDay, airTemperature[i][1], realPrecipitation[i][1], solarRadiation[i][1],
-                      potentialTransp[i][1], realTransp[i][1], dzvpSeries[i][1], deficitSeries[i][1], cumDefSeries[i][1], droughtIdx[i][1]))
-        i += 1
+def writeMap(iDay, values, mapPrefix):
+    mapFN = bboLib.rasterDay(mapPrefix, iDay)
+    bboLib.writeRasterArray(mapFN, values)
+    grass.message(str.format("{3} day={0} min={1} max={2}", iDay, numpy.nanmin(values), numpy.nanmax(values), mapFN))
+
 
+def writeQuantiles(iDay, values, quantiles, quantilePrefix):
+    for q, qValues in zip(quantiles, bboDroughtLib.ensembleQuantiles(values, quantiles)):
+        qPrefix = "{0}{1}_d".format(quantilePrefix, bboLib.formatNum(str(int(round(q*100))), 2))
+        bboLib.writeRasterArray(bboLib.rasterDay(qPrefix, iDay), qValues)
 
-def writeMap(iDay, valR, mapPrefix, nullVal):
-    mapFN = (bboLib.rasterDay(mapPrefix, iDay))
-    valR.write(mapFN, overwrite=True, null=nullVal)
-    grass.run_command("r.null", map=mapFN, setnull=nullVal, quiet=True)
-    grass.message(str.format("{3} day={0} min={1} max={2}", iDay, bboLib.getMinValue(mapFN), bboLib.getMaxValue(mapFN), mapFN))
+
+def loadScenarios(seriesList, nScenarios, dayFrom, dayTo):
+    values = [bboDroughtLib.seriesValues(bboLib.loadDataSeries(fn), dayFrom, dayTo, fn) for fn in seriesList]
+    if (len(values) == 1):
+        values = values*nScenarios
+    return numpy.array(values)
 
 
 def main():
     targetMapset = bboLib.hydroMapset
-    nullVal = -999999
 
     userMapset = grass.gisenv()["MAPSET"]  
     if not userMapset == targetMapset:
@@ -122,76 +158,34 @@ def main():
     if dayTo < dayFrom:
         grass.fatal(_("Parameter <dayfrom> must be less or equal than <dayto>"))
 
-    solarRadiation = bboLib.loadDataSeries(bboLib.solarRadiationForecast)
-    realPrecipitation = bboLib.loadDataSeries(bboLib.realPrecipitationForecast)
-    airTemperature = bboLib.loadDataSeries(bboLib.airTemperatureForecast)
-
-    minDay = bboLib.seriesMinDay(solarRadiation)
-    maxDay = bboLib.seriesMaxDay(solarRadiation)
-
-    n = maxDay - minDay + 1
-    while (bboLib.garray3DMaxRows < n):
-        i = len(solarRadiation) - 1
-        solarRadiation.remove(solarRadiation[i])
-        realPrecipitation.remove(realPrecipitation[i])
-        airTemperature.remove(airTemperature[i])
-        minDay = bboLib.seriesMinDay(solarRadiation)
-        maxDay = bboLib.seriesMaxDay(solarRadiation)
-        n = maxDay - minDay + 1
-    
-    grass.message("min day {0}   max day {1}   series length {2}".format(minDay, maxDay, maxDay - minDay + 1))
-    grass.message("day from {0}   day to {1}   days {2}".format(dayFrom, dayTo, dayTo - dayFrom + 1))
-
-    if ((maxDay - minDay + 1) < 7):
-        grass.fatal("The data series is too short")
-
-    if dayFrom < minDay:
-        grass.fatal("Parameter <dayfrom> is out of series ({0})".format(minDay))
-
-    if maxDay < dayTo:
-        grass.fatal("Parameter <dayto> is out of series ({0})".format(maxDay))
-
-    gregion = grass.region()
-    nRows = gregion['rows']
-    nCols = gregion['cols']
-    
-    iswc = bboLib.garray(iswcFN)
-    swc = bboLib.garray(swcFN)
-    pda = bboLib.garray(pdaFN)
-    pwp = bboLib.garray(pwpFN)
-
-    nLays = dayFrom - dayTo + 1
-    solarA = bboLib.garray3d(nLays)
-    solarA.readMapSeries(bboLib.srdayPrefix, minDay, maxDay)
-
-    for iDay in range(dayFrom, dayTo+1):
-    #for iDay in (146,138,157,159):
-        diR = bboLib.garray(None)
-        defR = bboLib.garray(None)
-        cdefR = bboLib.garray(None)
-        for r in range(nRows):
-            if ((r % 10) == 0):
-                grass.message(str.format("day: {0}   row: {1}", iDay, r))
-            for c in range(nCols):
-                diR[r, c] = nullVal
-                defR[r, c] = nullVal
-                cdefR[r, c] = nullVal
-                if (0 < iswc[r, c] and 0 < swc[r, c] and 0 < pda[r, c] and 0 < pwp[r, c]):
-                    #radiationSer = bboLib.readMapSeries(bboLib.srdayPrefix, dayFrom, dayTo, r, c)
-                    radiationSer = solarA.getSeries(minDay, maxDay, r, c)
-                    potentialTransp, realTransp, dzvpSeries, droughtIdx, deficitSeries, cumDefSeries = bboDroughtLib.calculateDroughtIndex(
-                                        minDay, maxDay, 
-                                        airTemperature, radiationSer, realPrecipitation,
-                                        iswc[r, c], swc[r, c], pda[r, c], pwp[r, c], interceptionVal,resetOfCumDeficit)
-                    i = iDay - minDay
-                    diR[r, c] = droughtIdx[i][1]
-                    defR[r, c] = deficitSeries[i][1]
-                    cdefR[r, c] = cumDefSeries[i][1]
-                    #printValues(dayFrom, dayTo, airTemperature, realPrecipitation, solarRadiation,
-                    #            potentialTransp, realTransp, dzvpSeries, deficitSeries, cumDefSeries, droughtIdx)
-        writeMap(iDay, diR, bboLib.diForecastPrefix, nullVal)
-        writeMap(iDay, defR, bboLib.deficitForecastPrefix, nullVal)
-        writeMap(iDay, cdefR, bboLib.cumDefForecastPrefix, nullVal)
+    tList = options["tseries"].split(",")
+    pList = options["pseries"].split(",")
+    quantiles = [float(q) for q in options["quantiles"].split(",")]
+    nScenarios = max(len(tList), len(pList))
+    if (len(tList) != len(pList) and min(len(tList), len(pList)) != 1):
+        grass.fatal(_("Parameter <pseries> must have one series or one series per <tseries>"))
+
+    # forecast scenarios (scenario, day)
+    airTemperature = loadScenarios(tList, nScenarios, dayFrom, dayTo)
+    realPrecipitation = loadScenarios(pList, nScenarios, dayFrom, dayTo)
+    grass.message("drought forecast: {0} scenarios, days {1} - {2}".format(nScenarios, dayFrom, dayTo))
+
+    state = bboDroughtLib.droughtCheckpoint(dayFrom - 1, options["checkpoint"], iswcFN, swcFN, pdaFN, pwpFN,
+                                            interceptionVal, resetOfCumDeficit, flags["r"])
+    ensemble = bboDroughtLib.droughtEnsembleInit(state, nScenarios)
+
+    for i, iDay in enumerate(range(dayFrom, dayTo + 1)):
+        solar = bboLib.readRasterArray(bboLib.rasterDayMapset(bboLib.srdayPrefix, iDay, bboLib.solarMapset), True)
+        day = bboDroughtLib.droughtEnsembleStep(ensemble, airTemperature[:, i], solar, realPrecipitation[:, i])
+
+        # first scenario as the forecast, quantiles of the ensemble
+        writeMap(iDay, day.di[0], bboLib.diForecastPrefix)
+        writeMap(iDay, day.deficit[0], bboLib.deficitForecastPrefix)
+        writeMap(iDay, day.cdef[0], bboLib.cumDefForecastPrefix)
+        if (1 < nScenarios):
+            writeQuantiles(iDay, day.di, quantiles, bboLib.diForecastQuantilePrefix)
+            writeQuantiles(iDay, day.deficit, quantiles, bboLib.deficitForecastQuantilePrefix)
+            writeQuantiles(iDay, day.cdef, quantiles, bboLib.cumDefForecastQuantilePrefix)
 
     # set history for site map
     if not userMapset == targetMapset:
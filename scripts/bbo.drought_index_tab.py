@@ -37,32 +37,32 @@
 #% type: integer
 #% answer: 199
 #% options: 1-999
-#% description: Initial soil water content (iswc)
-#% required: yes
+#% description: Initial soil water content (iswc), single point mode
+#% required: no
 #%end
 #%option
 #% key: swc
 #% type: integer
 #% answer: 199
 #% options: 1-999
-#% description: Soil water content (swc)
-#% required: yes
+#% description: Soil water content (swc), single point mode
+#% required: no
 #%end
 #%option
 #% key: pda
 #% type: double
 #% answer: 155.5
 #% options: 1-999
-#% description: Point of decreased availability (pda)
-#% required: yes
+#% description: Point of decreased availability (pda), single point mode
+#% required: no
 #%end
 #%option
 #% key: pwp
 #% type: double
 #% answer: 96.25
 #% options: 1-999
-#% description: Permanent wilting point
-#% required: yes
+#% description: Permanent wilting point, single point mode
+#% required: no
 #%end
 #%option
 #% key: intercept
@@ -80,9 +80,23 @@
 #% description: Reset of cumulative deficit
 #% required: yes
 #%end
+#%option
+#% key: stations
+#% type: string
+#% description: Station table (csv: station,iswc,swc,pda,pwp and optional tseries,pseries,sseries series files), single point parameters if empty
+#% required: no
+#%end
+#%option
+#% key: output
+#% type: string
+#% description: Output station table file (station, day, series, value), values are printed if empty
+#% required: no
+#%end
 
 import sys
 import os
+import csv
+import numpy
 import grass.script as grass
 import atexit
 import string
@@ -91,11 +105,71 @@ import bboLib
 import bboDroughtLib
 
 
+tableSeries = ["temp", "precip", "radiat", "ptransp", "rtransp", "swc", "deficit", "cumdeficit", "di"]
+
+
+def readStations(stationsFN):
+    stationsFile = open(stationsFN, "r")
+    stations = list(csv.DictReader(stationsFile))
+    stationsFile.close()
+    if (len(stations) == 0):
+        grass.fatal("Station table {0} is empty".format(stationsFN))
+    for name in ["station", "iswc", "swc", "pda", "pwp"]:
+        if (name not in stations[0]):
+            grass.fatal("Station table {0} has no column {1}".format(stationsFN, name))
+    return stations
+
+
+def stationSeries(stations, column, defaultFN, dayFrom, dayTo, seriesCache):
+    # (station, day) values, every series file loaded once
+    values = list()
+    for station in stations:
+        seriesFN = station.get(column) or defaultFN
+        if (seriesFN not in seriesCache):
+            series = bboLib.loadDataSeries(seriesFN)
+            if (dayFrom < bboLib.seriesMinDay(series) or bboLib.seriesMaxDay(series) < dayTo):
+                grass.fatal("Days {0} - {1} are out of series {2} of station {3}".format(dayFrom, dayTo, seriesFN, station["station"]))
+            seriesCache[seriesFN] = bboDroughtLib.seriesValues(series, dayFrom, dayTo, seriesFN)
+        values.append(seriesCache[seriesFN])
+    return numpy.array(values)
+
+
+def calcStations(stations, dayFrom, dayTo, interceptionVal, resetOfCumDeficit):
+    seriesCache = dict()
+    airTemperature = stationSeries(stations, "tseries", bboLib.airTemperatureFN, dayFrom, dayTo, seriesCache)
+    realPrecipitation = stationSeries(stations, "pseries", bboLib.realPrecipitationFN, dayFrom, dayTo, seriesCache)
+    solarRadiation = stationSeries(stations, "sseries", bboLib.solarRadiationFN, dayFrom, dayTo, seriesCache)
+    soil = [numpy.array([float(station[name]) for station in stations]) for name in ["iswc", "swc", "pda", "pwp"]]
+    names = [station["station"] for station in stations]
+
+    state = bboDroughtLib.droughtStateInit(soil[0], soil[1], soil[2], soil[3], interceptionVal, resetOfCumDeficit)
+    rows = list()
+    for i, iDay in enumerate(range(dayFrom, dayTo + 1)):
+        day = bboDroughtLib.droughtStep(state, airTemperature[:, i], solarRadiation[:, i], realPrecipitation[:, i])
+        dayValues = [airTemperature[:, i], realPrecipitation[:, i], solarRadiation[:, i],
+                     day.ptransp, day.rtransp, day.swc, day.deficit, day.cdef, day.di]
+        for k in range(len(names)):
+            for name, values in zip(tableSeries, dayValues):
+                if (not numpy.isnan(values[k])):
+                    rows.append((names[k], iDay, name, float(values[k])))
+    return rows
+
+
+def writeStationTable(rows, outputFN):
+    header = ["station", "day", "series", "value"]
+    if (not outputFN):
+        grass.message(",".join(header))
+        for r in rows:
+            grass.message(",".join([str(v) for v in r]))
+    else:
+        csvFile = open(outputFN, "w")
+        writer = csv.writer(csvFile, lineterminator="\n")
+        writer.writerow(header)
+        writer.writerows(rows)
+        csvFile.close()
+
+
 def main():
-    initSoilWaterCont = int(options['iswc'])
-    soilWaterCont = int(options['swc'])
-    pointOfDecrAvail = float(options['pda'])
-    permWiltingPoint = float(options['pwp'])
     interceptionVal = int(options['intercept'])
     resetOfCumDeficit = int(options['rcd'])
    
@@ -105,6 +179,22 @@ def main():
     if dayTo < dayFrom:
         grass.fatal("Parameter <dayfrom> must be less or equal than <dayto>")
 
+    # station table mode, days are checked against the series of every station
+    if (options['stations']):
+        stations = readStations(options['stations'])
+        grass.message("drought index: {0} stations, days {1} - {2}".format(len(stations), dayFrom, dayTo))
+        writeStationTable(calcStations(stations, dayFrom, dayTo, interceptionVal, resetOfCumDeficit), options['output'])
+        grass.message(_("Done."))
+        return
+
+    for name in ['iswc', 'swc', 'pda', 'pwp']:
+        if (not options[name]):
+            grass.fatal("Parameter <{0}> is required without <stations>".format(name))
+    initSoilWaterCont = int(options['iswc'])
+    soilWaterCont = int(options['swc'])
+    pointOfDecrAvail = float(options['pda'])
+    permWiltingPoint = float(options['pwp'])
+
     solarRadiation = bboLib.loadDataSeries(bboLib.solarRadiationFN)
     realPrecipitation = bboLib.loadDataSeries(bboLib.realPrecipitationFN)
     airTemperature = bboLib.loadDataSeries(bboLib.airTemperatureFN)
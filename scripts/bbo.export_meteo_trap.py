@@ -4,7 +4,7 @@
 #
 # MODULE:       bbo.export_meteo_trap
 # AUTHOR(S):	Miroslav Blazenec, Rastislav Jakus, Milan Koren
-# PURPOSE:      Calculates effective temperature
+# PURPOSE:      Exports day series values at the traps
 # COPYRIGHT:	This program is free software under the GNU General Public
 #		License (>=v2). Read the file COPYING that comes with GRASS
 #		for details.
@@ -12,16 +12,16 @@
 #############################################################################
 
 #%module
-#% description: Export meteorological data for a trap
+#% description: Export meteorological data for traps
 #% keywords: meteo data
 #%end
 #%option
 #% key: idbbtrap
 #% type: integer
-#% answer: 1
 #% options: 1-99
-#% description: Trap ID
-#% required: yes
+#% multiple: yes
+#% description: Trap IDs (all traps if empty)
+#% required: no
 #%end
 #%option
 #% key: dayfrom
@@ -39,38 +39,116 @@
 #% description: Day to
 #% required: yes
 #%end
+#%option
+#% key: series
+#% type: string
+#% multiple: yes
+#% options: sr,psr,at_max,at_mean,bt_max,bt_mean,bt_eff,at_dd,stage,di,def,cdef
+#% answer: sr,at_max,at_mean,bt_max,bt_mean,bt_eff,at_dd
+#% description: Exported day series
+#% required: yes
+#%end
+#%option
+#% key: interpolation
+#% type: string
+#% options: nearest,bilinear
+#% answer: nearest
+#% description: Value at the trap point (stage is always nearest)
+#% required: yes
+#%end
+#%option
+#% key: output
+#% type: string
+#% description: Output table file, values are printed if empty
+#% required: no
+#%end
+#%option
+#% key: format
+#% type: string
+#% options: csv,parquet
+#% answer: csv
+#% description: Output table format
+#% required: yes
+#%end
 
 import sys
 import os
+import csv
+import numpy
 import grass.script as grass
-import atexit
-import string
 sys.path.append(os.path.join(os.environ["GISBASE"], "scripts"))
 import bboLib
 
+# series name: raster prefix, mapset, continuous values
+exportSeriesList = {
+    "sr": (bboLib.srdayPrefix, bboLib.solarMapset, True),
+    "psr": (bboLib.psrdayPrefix, bboLib.solarMapset, True),
+    "at_max": (bboLib.atMaxPrefix, bboLib.atMapset, True),
+    "at_mean": (bboLib.atMeanPrefix, bboLib.atMapset, True),
+    "bt_max": (bboLib.btMaxPrefix, bboLib.btMapset, True),
+    "bt_mean": (bboLib.btMeanPrefix, bboLib.btMapset, True),
+    "bt_eff": (bboLib.btEffPrefix, bboLib.btMapset, True),
+    "at_dd": (bboLib.infestationDDPrefix, bboLib.infestationMapset, True),
+    "stage": (bboLib.phenipsStagePrefix, bboLib.phenipsMapset, False),
+    "di": (bboLib.diPrefix, bboLib.hydroMapset, True),
+    "def": (bboLib.deficitPrefix, bboLib.hydroMapset, True),
+    "cdef": (bboLib.cumDefPrefix, bboLib.hydroMapset, True),
+}
 
-def exportSeries(dayFrom, dayTo, idTrap, exportList, shpName):
-    outLine = "day"
-    for c in exportList:
-        outLine = outLine + "," + c[2]
-    grass.message(outLine)
-    for iDay in range(dayFrom, dayTo + 1):
-        outLine = str(iDay)
-        for c in exportList:
-            rasterName = bboLib.validateRaster(bboLib.rasterDayMapset(c[0], iDay, c[1]))
-            if (rasterName != None):
-                grass.run_command("v.what.rast", map=shpName, raster=rasterName, column="val", quiet=True)
-                params = grass.parse_command("v.db.select", map=shpName, columns="val", where="cat={0}".format(idTrap), separator="=", flags="v")
-                outLine = outLine + "," + str(round(float(params["val"].strip()),2))
-            else:
-                outLine = outLine + ",?"
-        grass.message(outLine)
+
+def exportSeries(dayFrom, dayTo, traps, seriesNames, interpolation):
+    # long table rows (trap, day, series, value), one r.what pass per series over all traps
+    points = [(t[0], t[1]) for t in traps]
+    neighbours, weights = bboLib.bilinearNeighbours(points)
+    rows = list()
+    for name in seriesNames:
+        prefix, mapset, continuous = exportSeriesList[name]
+        days = list()
+        rasters = list()
+        for iDay in range(dayFrom, dayTo + 1):
+            rasterName = bboLib.rasterDayMapset(prefix, iDay, mapset)
+            if (bboLib.getRasterModificationTime(rasterName) is not None):
+                days.append(iDay)
+                rasters.append(rasterName)
+        grass.message("{0}: {1} days".format(name, len(days)))
+        if (len(rasters) == 0):
+            continue
+        if (interpolation == "bilinear" and continuous):
+            values = bboLib.bilinearValues(bboLib.samplePointSeries(rasters, neighbours), weights)
+        else:
+            values = bboLib.samplePointSeries(rasters, points)
+        for i, t in enumerate(traps):
+            for j, iDay in enumerate(days):
+                if (not numpy.isnan(values[i, j])):
+                    rows.append((t[2], iDay, name, round(float(values[i, j]), 4)))
+    rows.sort(key=lambda r: (r[0], r[1]))
+    return rows
+
+
+def writeTable(rows, outputFN, outputFormat):
+    header = ["trap", "day", "series", "value"]
+    if (not outputFN):
+        grass.message(",".join(header))
+        for r in rows:
+            grass.message(",".join([str(v) for v in r]))
+    elif (outputFormat == "parquet"):
+        try:
+            import pandas
+        except ImportError:
+            grass.fatal("Parquet output requires the pandas package")
+        pandas.DataFrame(rows, columns=header).to_parquet(outputFN, index=False)
+    else:
+        csvFile = open(outputFN, "w")
+        writer = csv.writer(csvFile, lineterminator="\n")
+        writer.writerow(header)
+        writer.writerows(rows)
+        csvFile.close()
 
 
 def main():
     dayFrom = int(options['dayfrom'])
     dayTo = int(options['dayto'])
-    idTrap = int(options['idbbtrap'])
+    seriesNames = options['series'].split(",")
 
     targetMapset = bboLib.shpMapset
     bbTrapName = bboLib.shpBBTrap + "@" + bboLib.shpMapset
@@ -82,23 +160,16 @@ def main():
     if not userMapset == targetMapset:
         grass.run_command("g.mapset", mapset=targetMapset)
 
-    params = grass.parse_command("v.db.select", map=bbTrapName, columns="val", where="cat={0}".format(idTrap), separator="=", flags="v")
-    if (len(params) < 1):
-        grass.fatal("Trap ID={0} does not exists".format(idTrap))
-
-    # ["dem", "aspect", "slope"], "dem", ["dem", "aspect", "slope"]
-    # ["_swarming", "_swarming_span", "_infestation"], "bb_infestation", ["swarming", "swarming_span", "infestation"]
-       
-    exportSeries(dayFrom, dayTo, idTrap, 
-                 [(bboLib.srdayPrefix, bboLib.solarMapset, "sr"), 
-                  (bboLib.atMaxPrefix, bboLib.atMapset, "at_max"), 
-                  (bboLib.atMeanPrefix, bboLib.atMapset, "at_mean"),
-                  (bboLib.btMaxPrefix, bboLib.btMapset, "bt_max"),
-                  (bboLib.btMeanPrefix, bboLib.btMapset, "bt_mean"),
-                  (bboLib.btEffPrefix, bboLib.btMapset, "bt_eff"),
-                  (bboLib.infestationDDPrefix, bboLib.infestationMapset, "at_dd")
-                 ], 
-                 bbTrapName)     
+    traps = bboLib.getVectorPoints(bbTrapName, True)
+    if (options['idbbtrap']):
+        idTraps = [int(t) for t in options['idbbtrap'].split(",")]
+        for idTrap in idTraps:
+            if (idTrap not in [t[2] for t in traps]):
+                grass.fatal("Trap ID={0} does not exists".format(idTrap))
+        traps = [t for t in traps if (t[2] in idTraps)]
+
+    rows = exportSeries(dayFrom, dayTo, traps, seriesNames, options['interpolation'])
+    writeTable(rows, options['output'], options['format'])
 
     if not userMapset == targetMapset:
         grass.run_command("g.mapset", mapset=userMapset)
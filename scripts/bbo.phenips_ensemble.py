@@ -0,0 +1,145 @@
+#!/usr/bin/env python
+#
+############################################################################
+#
+# MODULE:       bbo.phenips_ensemble
+# AUTHOR(S):	Miroslav Blazenec, Rastislav Jakus, Milan Koren
+# PURPOSE:      PHENIPS forecast ensemble from the observed season checkpoint
+# COPYRIGHT:	This program is free software under the GNU General Public
+#		License (>=v2). Read the file COPYING that comes with GRASS
+#		for details.
+#
+#############################################################################
+
+#%module
+#% description: Runs PHENIPS forecast scenarios from the observed season checkpoint
+#% keywords: bark beetle phenips forecast ensemble
+#% keywords:TANABBO
+#%end
+#%option
+#% key: dayfrom
+#% type: integer
+#% options: 1-365
+#% answer: 150
+#% description: First forecast day (1 - 365)
+#% required : yes
+#%end
+#%option
+#% key: dayto
+#% type: integer
+#% options: 1-365
+#% answer: 160
+#% description: Last forecast day (1 - 365)
+#% required : yes
+#%end
+#%option
+#% key: series
+#% type: string
+#% multiple: yes
+#% answer: md_tmax_forecast.txt
+#% description: Forecast maximal air temperature series, one scenario per series
+#% required : yes
+#%end
+#%option
+#% key: perturbations
+#% type: double
+#% multiple: yes
+#% answer: 0
+#% description: Air temperature perturbations (C) applied to every series
+#% required : yes
+#%end
+#%option
+#% key: quantiles
+#% type: double
+#% multiple: yes
+#% answer: 0.1,0.5,0.9
+#% description: Onset day quantiles (0 - 1)
+#% required : yes
+#%end
+#%option
+#% key: checkpoint
+#% type: string
+#% answer: phenips_checkpoint.npz
+#% description: Observed PHENIPS state file (location _data directory)
+#% required : yes
+#%end
+#%option
+#% key: coefficients
+#% type: string
+#% description: Bark temperature coefficient sets file (location _data directory) for -v, default coefficients if empty
+#% required : no
+#%end
+#%option G_OPT_R_INPUT
+#% key: selector
+#% description: Raster of coefficient set codes for -v (e.g. sun-exposed and shaded bark)
+#% required : no
+#%end
+#%flag
+#% key: r
+#% description: Recalculate the observed PHENIPS state
+#%end
+#%flag
+#% key: v
+#% description: Calculate observed air and bark temperature from DEM and meteo station series instead of daily rasters
+#%end
+
+import sys
+import os
+import numpy
+import grass.script as grass
+sys.path.append(os.path.join(os.environ["GISBASE"], "scripts"))
+import bboLib
+import bboPhenipsLib
+import bboTemperatureLib
+
+
+def main():
+    dayFrom = int(options["dayfrom"])
+    dayTo = int(options["dayto"])
+    if dayTo < dayFrom:
+        grass.fatal(_("Parameter <dayfrom> must be less or equal than <dayto>"))
+    if dayFrom <= bboLib.phenipsFromDay:
+        grass.fatal(_("Parameter <dayfrom> must be greater than {0}".format(bboLib.phenipsFromDay)))
+
+    seriesList = options["series"].split(",")
+    perturbations = [float(p) for p in options["perturbations"].split(",")]
+    quantiles = [float(q) for q in options["quantiles"].split(",")]
+
+    # scenario offsets from the forecast series used for the forecast rasters
+    baseSeries = bboLib.loadDataSeries(bboLib.airTemperatureMaxForecast)
+    atShift = list()
+    for seriesFN in seriesList:
+        series = bboLib.loadDataSeries(seriesFN)
+        delta = list()
+        for iDay in range(dayFrom, dayTo + 1):
+            v = bboLib.linearInterpolation(series, iDay)
+            v0 = bboLib.linearInterpolation(baseSeries, iDay)
+            if (v is None or v0 is None):
+                grass.fatal(_("Series {0} does not cover day {1}".format(seriesFN, iDay)))
+            delta.append(v - v0)
+        for p in perturbations:
+            atShift.append(numpy.array(delta) + p)
+    atShift = numpy.array(atShift)
+    grass.message("PHENIPS ensemble: {0} scenarios, days {1} - {2}".format(atShift.shape[0], dayFrom, dayTo))
+
+    temperatureSource = None
+    if (flags["v"]):
+        sets = bboTemperatureLib.barkCoefficients(options["coefficients"])
+        selector = None
+        if (options["selector"]):
+            selector = bboLib.readRasterArray(bboLib.checkInputRaster(options, "selector"), True)
+        coefficients = bboTemperatureLib.barkCoefficientGrids(sets, selector)
+        temperatureSource = bboTemperatureLib.virtualTemperature(coefficients=coefficients,
+                                                                 coefficientsFN=options["coefficients"],
+                                                                 selectorName=options["selector"])
+
+    state = bboPhenipsLib.phenipsCheckpoint(dayFrom - 1, options["checkpoint"], flags["r"], temperatureSource)
+    ensemble, nullCells = bboPhenipsLib.phenipsEnsemble(state, dayFrom, dayTo,
+                                                        bboLib.ForecastMaxPrefix, bboLib.ForecastbtMaxPrefix, atShift)
+    bboPhenipsLib.writeEnsembleRasters(ensemble, nullCells, quantiles, bboLib.phenipsMapset)
+
+    grass.message(_("Done."))
+
+if __name__ == "__main__":
+    options, flags = grass.parser()
+    main()
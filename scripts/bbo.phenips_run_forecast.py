@@ -53,6 +53,7 @@ import string
 sys.path.append(os.path.join(os.environ["GISBASE"], "scripts"))
 import bboLib
 import bboPhenipsLib
+import bboTemperatureLib
 
 def main():   
     #air
@@ -60,9 +61,7 @@ def main():
     solarMapset = bboLib.solarMapset
     demName = "dem@dem"
 
-    shpMapset = bboLib.shpMapset
     meteostationName = bboLib.shpMeteostation + "@" + bboLib.shpMapset
-    valFieldName = bboLib.shpMeteostationValField
 
     demName = bboLib.checkInputRaster(options, "dem")
     meteostationName = options["meteo"]
@@ -111,11 +110,7 @@ def main():
         grass.run_command("g.mapset", mapset=targetMapset)
 
     # meteo station parameters
-    grass.run_command("g.mapset", mapset=shpMapset)
-   # grass.run_command("v.what.rast", map=meteostationName, raster=demName, column=valFieldName)
-    grass.run_command("g.mapset", mapset=targetMapset)
-  #  params = grass.parse_command("v.db.select", map=meteostationName, columns=valFieldName, flags="v", separator="=", quiet=True)
-    msElev = 1050 #float(params["val"].strip())
+    msElev = bboTemperatureLib.stationElevation(meteostationName, demName)
 
     dayTo += 1
     for iDay in range(dayFrom, dayTo):
@@ -268,12 +263,12 @@ def main():
     bboLib.deleteDaySeries(bboLib.phenipsFORECASTDDPrefix)
 
     bboPhenipsLib.calcGenerationsForecast(dayFrom, dayTo, bboLib.phenipsToDay)
-    bboPhenipsLib.stageCalc(dayFrom, dayTo,
-                            bboLib.phenipsMapset, 
-                            bboLib.phenipsForecast2SwarmingName,
-                            bboLib.phenipsForecastInfestationName,
-                            bboLib.phenipsForecastDevelopmentName,
-                            bboLib.phenipsForecastStagePrefix)
+    bboPhenipsLib.stageCalcArray(dayFrom, dayTo,
+                                 bboLib.phenipsMapset, 
+                                 bboLib.phenipsForecast2SwarmingName,
+                                 bboLib.phenipsForecastInfestationName,
+                                 bboLib.phenipsForecastDevelopmentName,
+                                 bboLib.phenipsForecastStagePrefix)
     
     grass.message(_("Stage calculation"))
 
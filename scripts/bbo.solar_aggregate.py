@@ -0,0 +1,92 @@
+#!/usr/bin/env python
+#
+############################################################################
+#
+# MODULE:       bbo.solar_aggregate
+# AUTHOR(S):	Miroslav Blazenec, Rastislav Jakus, Milan Koren
+# PURPOSE:      Aggregates daily solar irradiation for months, decades, year, season and custom day ranges
+# COPYRIGHT:	This program is free software under the GNU General Public
+#		License (>=v2). Read the file COPYING that comes with GRASS
+#		for details.
+#
+#############################################################################
+
+#%module
+#% description: Aggregates daily solar irradiation in one pass over the daily rasters.
+#% keywords: solar irradiation
+#%end
+#%option
+#% key: input
+#% type: string
+#% options: psr,sr
+#% answer: psr
+#% description: Potential (psr) or corrected (sr) solar irradiation
+#% required: yes
+#%end
+#%option
+#% key: windows
+#% type: string
+#% multiple: yes
+#% answer: month,year
+#% description: Aggregation windows: month, decade, year, season or name:dayfrom-dayto
+#% required: yes
+#%end
+#%option
+#% key: methods
+#% type: string
+#% multiple: yes
+#% options: sum,mean,min,max
+#% answer: sum
+#% description: Aggregation methods
+#% required: yes
+#%end
+
+import sys
+import os
+import grass.script as grass
+sys.path.append(os.path.join(os.environ["GISBASE"], "scripts"))
+import bboLib
+import bboSolarLib
+
+
+def main():
+    if (options["input"] == "sr"):
+        dayPrefix = bboLib.srdayPrefix
+        monthPrefix = bboLib.srmonthPrefix
+        decadePrefix = bboLib.srdecadePrefix
+        yearName = bboLib.sryearPrefix
+        seasonName = bboLib.srseasonName
+    else:
+        dayPrefix = bboLib.psrdayPrefix
+        monthPrefix = bboLib.psrmonthPrefix
+        decadePrefix = bboLib.psrdecadePrefix
+        yearName = bboLib.psryearPrefix
+        seasonName = bboLib.psrseasonName
+
+    windows = list()
+    for w in options["windows"].split(","):
+        if (w == "month"):
+            windows += bboSolarLib.monthWindows(monthPrefix)
+        elif (w == "decade"):
+            windows += bboSolarLib.decadeWindows(decadePrefix)
+        elif (w == "year"):
+            windows.append((yearName, 1, 365))
+        elif (w == "season"):
+            windows.append((seasonName, bboLib.phenipsFromDay, bboLib.phenipsToDay))
+        else:
+            try:
+                name, dayRange = w.split(":")
+                dayFrom, dayTo = [int(d) for d in dayRange.split("-")]
+            except ValueError:
+                grass.fatal(_("Invalid aggregation window <{0}>".format(w)))
+            if (dayFrom < 1 or 365 < dayTo or dayTo < dayFrom):
+                grass.fatal(_("Invalid day range of the window <{0}>".format(w)))
+            windows.append((name, dayFrom, dayTo))
+
+    bboSolarLib.aggregateSeries(bboLib.solarMapset, bboSolarLib.dayRasters(dayPrefix), windows, options["methods"].split(","))
+    grass.message(_("Done."))
+
+
+if __name__ == "__main__":
+    options, flags = grass.parser()
+    main()
@@ -34,6 +34,7 @@
 
 import sys
 import os
+import numpy
 import grass.script as grass
 import atexit
 import string
@@ -52,12 +53,10 @@ def main():
     md_gsrFN = "md_gsr_1.txt"
 
     shpMapsetName =bboLib.shpMapset
-    meteostationName = bboLib.setRasterMapset(bboLib.shpMeteostation, shpMapsetName)
-    valFieldName = "val"
+    meteostationName = bboLib.getLayerWithMapset(bboLib.shpMeteostation, shpMapsetName)
 
     if dayTo < dayFrom:
         grass.fatal(_("Parameter <dayfrom> must be less or equal than <dayto>"))
-    dayTo += 1
 
     userMapset = grass.gisenv()["MAPSET"]
     if not userMapset == targetMapset:
@@ -67,23 +66,30 @@ def main():
 
     gsrSeries = bboLib.loadDataSeries(md_gsrFN)
     grass.message("corrections of solar irradiation")
-    for iDay in range(dayFrom, dayTo):
+
+    # potential irradiation at the meteo station for all days in one read
+    days = list()
+    psrNames = list()
+    for iDay in range(dayFrom, dayTo + 1):
         psrName = bboLib.rasterDay(bboLib.psrdayPrefix, iDay) + "@" + targetMapset
-        if grass.find_file(psrName)["file"]:
-            srName = bboLib.rasterDay(bboLib.srdayPrefix, iDay)
-            srVal = bboLib.linearInterpolation(gsrSeries, iDay)
-            if (srVal == None):
-                grass.message("day: {0}   no corrections, missing meteo data".format(iDay))
-                grass.mapcalc("$sr = $psr", overwrite=True, sr=srName, psr=psrName)
-            else:
-                grass.run_command("g.mapset", mapset = shpMapsetName)
-                grass.run_command("v.what.rast", map=meteostationName, raster=psrName, column=valFieldName)
-                grass.run_command("g.mapset", mapset = targetMapset)
-                params = grass.parse_command("v.db.select", map=meteostationName, columns=valFieldName, flags="v", separator="=", quiet=True)
-                psrVal = float(params["val"].strip())
-                k = srVal / psrVal
-                grass.message("day: {0}   coeficient: {1}".format(iDay, k))
-                grass.mapcalc("$sr = $k * $psr", overwrite=True, sr=srName, k=k, psr=psrName)
+        if bboLib.getRasterModificationTime(psrName):
+            days.append(iDay)
+            psrNames.append(psrName)
+    stationPoints = bboLib.getVectorPoints(meteostationName)[:1]
+    if (len(stationPoints) == 0):
+        grass.fatal(_("Meteo station layer {0} has no points".format(meteostationName)))
+    psrVal = bboLib.samplePointSeries(psrNames, stationPoints)[0]
+    srVal = numpy.array([numpy.nan if v is None else v for v in [bboLib.linearInterpolation(gsrSeries, iDay) for iDay in days]])
+    k = srVal / psrVal
+
+    for i, iDay in enumerate(days):
+        srName = bboLib.rasterDay(bboLib.srdayPrefix, iDay)
+        if (numpy.isnan(k[i])):
+            grass.message("day: {0}   no corrections, missing meteo data".format(iDay))
+            grass.mapcalc("$sr = $psr", overwrite=True, sr=srName, psr=psrNames[i])
+        else:
+            grass.message("day: {0}   coeficient: {1}".format(iDay, k[i]))
+            grass.mapcalc("$sr = $k * $psr", overwrite=True, sr=srName, k=k[i], psr=psrNames[i])
 
     # set history for site map
     if not userMapset == targetMapset:
@@ -73,10 +73,28 @@
 #% description: Calculation step in hours
 #% required: yes
 #%end
+#%option
+#% key: nprocs
+#% type: integer
+#% answer: 1
+#% description: Number of parallel r.sun processes
+#% required: yes
+#%end
+#%option
+#% key: horizonstep
+#% type: double
+#% answer: 0.0
+#% description: Horizon angle step in degrees, 0 = no horizon
+#% required: yes
+#%end
 #%flag
 #% key: c
 #% description: Clean mapset
 #%end
+#%flag
+#% key: r
+#% description: Recalculate cached days
+#%end
 
 import sys
 import os
@@ -98,6 +116,8 @@ def main():
     dayToStr = options["dayto"]
     calcStepStr = options["calcstep"]
     cleanMapset = flags["c"]
+    nProcs = int(options["nprocs"])
+    horizonStep = float(options["horizonstep"])
 
     dayFrom = int(dayFromStr)
     dayTo = int(dayToStr)
@@ -113,6 +133,8 @@ def main():
         grass.fatal(_("Parameter <calcstep> must be greater than 0"))
     if 24.0 <= calcStep:
         grass.fatal(_("Parameter <calcstep> must be less than 24"))
+    if nProcs < 1:
+        grass.fatal(_("Parameter <nprocs> must be greater than 0"))
 
     userMapset = grass.gisenv()["MAPSET"]
     if not userMapset == targetMapset:
@@ -122,14 +144,10 @@ def main():
     grass.mapcalc("$output = $value", overwrite=True, output=tmpLongitude, value=longitudeDeg)
     
     if (cleanMapset):
-        bboLib.deleteDaySeries(bboSolarLib.psrdayPrefix)
+        bboLib.deleteDaySeries(bboLib.psrdayPrefix)
 
-    dayTo = dayTo + 1
-    for iDay in range(dayFrom, dayTo):
-        grass.message("potential solar irradiation day {0}".format(iDay))
-        psrName = bboLib.rasterDay(bboLib.psrdayPrefix, iDay)
-        grass.run_command("r.sun", elevation=demName, aspect=aspectName, slope=slopeName, lat=tmpLatitude, long=tmpLongitude,
-                           glob_rad=psrName, day=iDay, step=calcStep, overwrite=True)
+    bboSolarLib.solarDaySeries(targetMapset, bboLib.psrdayPrefix, demName, slopeName, aspectName, tmpLatitude, tmpLongitude,
+                               dayFrom, dayTo, calcStep, nProcs, horizonStep, not flags["r"])
 
     bboLib.deleteRaster(tmpLatitude)
     bboLib.deleteRaster(tmpLongitude)
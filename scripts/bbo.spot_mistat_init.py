@@ -29,6 +29,18 @@
 #% description: Last year
 #% required: yes
 #%end
+#%option
+#% key: quantiles
+#% type: double
+#% multiple: yes
+#% answer: 0.25,0.5,0.75
+#% description: Mortality index quantiles (0 - 1)
+#% required: no
+#%end
+#%flag
+#% key: a
+#% description: Statistics of init, new and spread spots from one spot area table
+#%end
 
 import sys
 import os
@@ -47,7 +59,15 @@ def main():
     if (yearTo < yearFrom):
         grass.fatal("yearfrom must be less or equal to YearTo")
 
-    bboPrognosisLib.printMISeriesStatistics(yearFrom, yearTo, bboPrognosisLib.INITSPOTCODE)
+    quantiles = None
+    if (options["quantiles"]):
+        quantiles = [float(q) for q in options["quantiles"].split(",")]
+
+    if (flags["a"]):
+        spotCodes = [bboPrognosisLib.INIT_SPOTCODE, bboPrognosisLib.NEW_SPOTCODE, bboPrognosisLib.SPREAD_SPOTCODE]
+        bboPrognosisLib.printMIScenarios(yearFrom, yearTo, spotCodes, quantiles)
+    else:
+        bboPrognosisLib.printMISeriesStatistics(yearFrom, yearTo, bboPrognosisLib.INIT_SPOTCODE, quantiles)
 
     # finish calculation, restore settings
     grass.message(_("Done.")) 
@@ -32,6 +32,21 @@
 #% description: Day to (1 - 365)
 #% required : yes
 #%end
+#%option
+#% key: store
+#% type: string
+#% answer: phenips_forecast_stage.npz
+#% description: Stage store file name (location _data directory), written with -s, expanded with -x
+#% required : no
+#%end
+#%flag
+#% key: s
+#% description: Write run-length encoded stage store instead of daily stage rasters
+#%end
+#%flag
+#% key: x
+#% description: Expand the stage store into daily stage rasters (no stage calculation)
+#%end
 
 import sys
 import os
@@ -46,13 +61,26 @@ def main():
 
     dayFrom = int(options["dayfrom"])
     dayTo = int(options["dayto"])
+    stageStoreFN = None
+    if (flags["s"]):
+        stageStoreFN = options["store"]
+
+    if (flags["s"] and flags["x"]):
+        grass.fatal(_("Flags -s and -x are mutually exclusive"))
+
+    if (flags["x"]):
+        bboPhenipsLib.stageStoreToRasters(options["store"], dayFrom, dayTo,
+                                          bboLib.phenipsMapset, bboLib.phenipsForecastStagePrefix)
+        grass.message(_("Stage store expanded"))
+        return
 
-    bboPhenipsLib.stageCalc(dayFrom, dayTo,
-                            bboLib.phenipsMapset, 
-                            bboLib.phenipsForecast2SwarmingName,
-                            bboLib.phenipsForecastInfestationName,
-                            bboLib.phenipsForecastDevelopmentName,
-                            bboLib.phenipsForecastStagePrefix)
+    bboPhenipsLib.stageCalcArray(dayFrom, dayTo,
+                                 bboLib.phenipsMapset, 
+                                 bboLib.phenipsForecast2SwarmingName,
+                                 bboLib.phenipsForecastInfestationName,
+                                 bboLib.phenipsForecastDevelopmentName,
+                                 bboLib.phenipsForecastStagePrefix,
+                                 stageStoreFN=stageStoreFN)
     
     grass.message(_("Stage calculation"))
 
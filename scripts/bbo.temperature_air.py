@@ -43,6 +43,34 @@
 #% description: Day to (1 - 365)
 #% required : yes
 #%end
+#%option
+#% key: hourly
+#% type: string
+#% description: Hourly air temperature series (day hour value [value ...]), its daily mean and maximum replace md_tmean_1.txt and md_tmax_1.txt
+#% required : no
+#%end
+#%option
+#% key: method
+#% type: string
+#% options: lapse,idw,kriging
+#% answer: lapse
+#% description: Interpolation: first station and standard lapse rate, or daily lapse rate of all stations with IDW or kriging of residuals (one series column per station)
+#% required : yes
+#%end
+#%option
+#% key: range
+#% type: double
+#% answer: 0
+#% description: Kriging variogram range (m), 0 = half of the maximal station distance
+#% required : yes
+#%end
+#%option
+#% key: nprocs
+#% type: integer
+#% answer: 1
+#% description: Number of parallel processes
+#% required : yes
+#%end
 
 import sys
 import os
@@ -51,65 +79,46 @@ import atexit
 import string
 sys.path.append(os.path.join(os.environ["GISBASE"], "scripts"))
 import bboLib
+import bboTemperatureLib
 
 
 def main():   
     targetMapset = bboLib.atMapset
-    solarMapset = bboLib.solarMapset
-    demName = "dem@dem"
-
-    shpMapset = bboLib.shpMapset
-    meteostationName = bboLib.shpMeteostation + "@" + bboLib.shpMapset
-    valFieldName = bboLib.shpMeteostationValField
 
     demName = bboLib.checkInputRaster(options, "dem")
     meteostationName = options["meteo"]
-
-    tgradSeries = bboLib.loadDataSeries("tgrad_std.txt")
-    tmeanSeries = bboLib.loadDataSeries("md_tmean_1.txt")
-    tmaxSeries = bboLib.loadDataSeries("md_tmax_1.txt")
-    srSeries = bboLib.loadDataSeries("md_gsr_1.txt")
+    method = options["method"]
+    nProcs = int(options["nprocs"])
+    rangeDistance = float(options["range"])
+
+    tgradSeries = bboLib.readDataSeries("tgrad_std.txt")
+    srSeries = bboLib.readDataSeries("md_gsr_1.txt")
+    if (options["hourly"]):
+        hourlySeries = bboLib.readDataSeries(options["hourly"], True)
+        tmeanSeries = bboLib.dailySeries(hourlySeries, "mean")
+        tmaxSeries = bboLib.dailySeries(hourlySeries, "max")
+    else:
+        tmeanSeries = bboLib.readDataSeries("md_tmean_1.txt")
+        tmaxSeries = bboLib.readDataSeries("md_tmax_1.txt")
+    for name, series in [("tmean", tmeanSeries), ("tmax", tmaxSeries)]:
+        for gap in bboLib.seriesGaps(series):
+            grass.warning("{0} series gap days {1} - {2} interpolated".format(name, gap[0], gap[1]))
 
     dayFrom = int(options["dayfrom"])
     dayTo = int(options["dayto"])
 
     if dayTo < dayFrom:
         grass.fatal(_("Parameter <dayfrom> must be less or equal than <dayto>"))
+    if nProcs < 1:
+        grass.fatal(_("Parameter <nprocs> must be greater than 0"))
 
     userMapset = grass.gisenv()["MAPSET"]  
     if not userMapset == targetMapset:
         grass.run_command("g.mapset", mapset=targetMapset)
 
-    # meteo station parameters
-    grass.run_command("g.mapset", mapset=shpMapset)
-    grass.run_command("v.what.rast", map=meteostationName, raster=demName, column=valFieldName)
-    grass.run_command("g.mapset", mapset=targetMapset)
-    params = grass.parse_command("v.db.select", map=meteostationName, columns=valFieldName, flags="v", separator="=", quiet=True)
-    msElev = float(params["val"].strip())
-
-    dayTo += 1
-    for iDay in range(dayFrom, dayTo):
-        grass.message("air temperature day {0}".format(iDay))
-        srName = bboLib.rasterDayMapset(bboLib.srdayPrefix, iDay, solarMapset)
-
-        meanName = bboLib.rasterDay(bboLib.atMeanPrefix, iDay)
-        maxName = bboLib.rasterDay(bboLib.atMaxPrefix,  iDay)
-        bboLib.deleteRaster(meanName)
-        bboLib.deleteRaster(maxName)
-
-        dt = bboLib.linearInterpolation(tmeanSeries, iDay)
-        dc = bboLib.linearInterpolation(tgradSeries, iDay)
-        if (dt != None and dc != None):
-            grass.mapcalc("$output = $dc * ($dem - $mselev) + $dt", 
-                          output=meanName,
-                          dem=demName, dc=dc, dt=dt, mselev=msElev, overwrite=True)
-        
-        dm = bboLib.linearInterpolation(tmaxSeries, iDay)
-        msSR = bboLib.linearInterpolation(srSeries, iDay)
-        if (dm != None and msSR != None):
-            grass.mapcalc("$output = $dc * ($dem - $mselev) * ($sr / $mssr) + $dm", 
-                          output=maxName,
-                          dem=demName, dc=dc, mselev=msElev, dm=dm, sr=srName, mssr=msSR, overwrite=True)
+    bboTemperatureLib.networkTemperature(dayFrom, dayTo, demName, meteostationName, method,
+                                         tmeanSeries, tmaxSeries, tgradSeries, srSeries,
+                                         bboLib.atMeanPrefix, bboLib.atMaxPrefix, nProcs, rangeDistance)
 
     if not userMapset == targetMapset:
         grass.run_command("g.mapset", mapset=userMapset)
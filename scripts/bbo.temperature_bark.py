@@ -31,6 +31,17 @@
 #% description: Day to (1 - 365)
 #% required : yes
 #%end
+#%option
+#% key: coefficients
+#% type: string
+#% description: Bark temperature coefficient sets file (location _data directory), default coefficients if empty
+#% required : no
+#%end
+#%option G_OPT_R_INPUT
+#% key: selector
+#% description: Raster of coefficient set codes (e.g. sun-exposed and shaded bark)
+#% required : no
+#%end
 
 import sys
 import os
@@ -39,34 +50,11 @@ import atexit
 import string
 sys.path.append(os.path.join(os.environ["GISBASE"], "scripts"))
 import bboLib
+import bboTemperatureLib
 
 
 def main():   
-    atempMapset = bboLib.atMapset
-    atMeanPrefix = bboLib.atMeanPrefix
-    atMaxPrefix = bboLib.atMaxPrefix
-
     targetMapset = bboLib.btMapset
-    btMeanPrefix = bboLib.btMeanPrefix
-    btMaxPrefix = bboLib.btMaxPrefix
-    btEffPrefix = bboLib.btEffPrefix
-
-    solarMapset = bboLib.solarMapset
-    srPrefix = bboLib.srdayPrefix
-
-    s50maskName = bboLib.forestS50Mask + "@" + bboLib.forestMapset
-
-    mean_a1 = -0.173
-    mean_a2 = 0.0008518
-    mean_a3 = 1.054
-    
-    max_a1 = 1.656
-    max_a2 = 0.002955
-    max_a3 = 0.534
-    max_a4 = 0.01884
-
-    eff_a1 = -310.667
-    eff_a2 = 9.603
 
     dayFrom = int(options["dayfrom"])
     dayTo = int(options["dayto"])
@@ -74,43 +62,18 @@ def main():
     if dayTo < dayFrom:
         grass.fatal(_("Parameter <dayfrom> must be less or equal than <dayto>"))
 
+    sets = bboTemperatureLib.barkCoefficients(options["coefficients"])
+    selector = None
+    if (options["selector"]):
+        selector = bboLib.readRasterArray(bboLib.checkInputRaster(options, "selector"), True)
+    coefficients = bboTemperatureLib.barkCoefficientGrids(sets, selector)
+
     userMapset = grass.gisenv()["MAPSET"]  
     if not userMapset == targetMapset:
         grass.run_command("g.mapset", mapset=targetMapset)
 
-    dayTo += 1
-    for iDay in range(dayFrom, dayTo):
-        grass.message("bark temperature day " + str(iDay))
-        srName = bboLib.validateRaster(bboLib.rasterDayMapset(srPrefix,  iDay, solarMapset))
-        atmeanName = bboLib.validateRaster(bboLib.rasterDayMapset(atMeanPrefix,  iDay, atempMapset))
-        atmaxName = bboLib.validateRaster(bboLib.rasterDayMapset(atMaxPrefix, iDay, atempMapset))
-        #
-        meanName = bboLib.rasterDay(btMeanPrefix, iDay)
-        maxName = bboLib.rasterDay(btMaxPrefix, iDay)
-        effName = bboLib.rasterDay(btEffPrefix,  iDay)
-        bboLib.deleteRaster(meanName)
-        bboLib.deleteRaster(maxName)
-        bboLib.deleteRaster(effName)
-
-        if (srName != None and atmeanName != None and atmaxName != None):
-            #grass.mapcalc("$output = $s50mask * ($a1 + ($a2 * $sol) + ($a3 * $atmean))", 
-            #              output=meanName, s50mask=s50maskName,
-            #              a1=mean_a1, a2=mean_a2, a3=mean_a3, sol=srName, atmean=atmeanName, overwrite=True)
-            #grass.mapcalc("$output = $s50mask * ($a1 + ($a2 * $sol) + ($a3 * $atmax) + ($a4 * $atmean))",
-            #              output=maxName, s50mask=s50maskName,
-            #              a1=max_a1, a2=max_a2, a3=max_a3, a4=max_a4, sol=srName, atmax=atmaxName, atmean=atmeanName, overwrite=True)
-            #grass.mapcalc("$output = ($a1 + $a2*$btmax) / 24.0",
-            #              output=effName,
-            #              a1=eff_a1, a2=eff_a2, btmax=maxName, overwrite=True)
-            grass.mapcalc("$output = ($a1 + ($a2 * $sol) + ($a3 * $atmean))", 
-                          output=meanName,
-                          a1=mean_a1, a2=mean_a2, a3=mean_a3, sol=srName, atmean=atmeanName, overwrite=True)
-            grass.mapcalc("$output = ($a1 + ($a2 * $sol) + ($a3 * $atmax) + ($a4 * $atmean))",
-                          output=maxName,
-                          a1=max_a1, a2=max_a2, a3=max_a3, a4=max_a4, sol=srName, atmax=atmaxName, atmean=atmeanName, overwrite=True)
-            grass.mapcalc("$output = ($a1 + $a2*$btmax) / 24.0",
-                          output=effName,
-                          a1=eff_a1, a2=eff_a2, btmax=maxName, overwrite=True)
+    bboTemperatureLib.barkTemperatureSeries(dayFrom, dayTo, coefficients,
+                                            bboLib.btMeanPrefix, bboLib.btMaxPrefix, bboLib.btEffPrefix)
 
     # set history for site map
     if not userMapset == targetMapset:
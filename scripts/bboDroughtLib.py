@@ -13,8 +13,10 @@
 
 import sys
 import os
+import numpy
 import grass.script as grass
 import string
+import collections
 sys.path.append(os.path.join(os.environ["GISBASE"], "scripts"))
 import bboLib
 
@@ -181,6 +183,216 @@ def calculateDroughtIndex(dayFrom, dayTo,
 
 
 
+# potential transpiration by Turc for air temperature and solar radiation arrays, nan without radiation
+def potentialTranspirationArray(airTemperature, solarRadiation):
+    t = numpy.asarray(airTemperature, dtype=numpy.double)
+    gr = numpy.asarray(solarRadiation, dtype=numpy.double)
+    with numpy.errstate(invalid="ignore", divide="ignore"):
+        prec = 0.013 * (t / (15.0 + t)) * ((gr / 41867.2807201172) + 50.0) * 24.0 * 0.78
+        return numpy.where(0 < gr, prec, numpy.nan)
+
+
+# water balance state of the cells (or stations), same recurrence as calculateDroughtIndex
+def droughtStateInit(initWaterReserve, maxCappCapacity, reducedCappAttraction, wiltingPoint, interceptionVal, restartCumDeficit):
+    initWaterReserve = numpy.asarray(initWaterReserve, dtype=numpy.double)
+    state = dict()
+    state["step"] = 0
+    state["valid"] = ((0 < initWaterReserve) & (0 < maxCappCapacity) & (0 < reducedCappAttraction) & (0 < wiltingPoint))
+    state["iswc"] = initWaterReserve
+    state["swc"] = numpy.asarray(maxCappCapacity, dtype=numpy.double)
+    state["pda"] = numpy.asarray(reducedCappAttraction, dtype=numpy.double)
+    state["pwp"] = numpy.asarray(wiltingPoint, dtype=numpy.double)
+    state["interception"] = interceptionVal
+    state["rcd"] = restartCumDeficit
+    state["precipitation"] = None
+    state["dzvp"] = numpy.full(initWaterReserve.shape, numpy.nan)
+    state["rt"] = numpy.full(initWaterReserve.shape, numpy.nan)
+    state["cdef"] = numpy.zeros(initWaterReserve.shape)
+    state["zeroDays"] = numpy.zeros(initWaterReserve.shape, dtype=numpy.int32)
+    return state
+
+
+# one day of the water balance, output: potential and real transpiration, soil water capacity,
+# drought index, water deficit and cumulative water deficit (nan on the first day and for invalid cells)
+def droughtStep(state, airTemperature, solarRadiation, realPrecipitation):
+    shape = state["iswc"].shape
+    ptr = potentialTranspirationArray(airTemperature, solarRadiation) * numpy.ones(shape)
+    zn = numpy.asarray(realPrecipitation, dtype=numpy.double)
+    iVal = numpy.minimum(zn, state["interception"])
+    step = state["step"]
+
+    with numpy.errstate(invalid="ignore", divide="ignore"):
+        if (step == 0):
+            strN = numpy.full(shape, numpy.nan)
+            dzvp = numpy.full(shape, numpy.nan)
+        elif (step == 1):
+            dzvp = numpy.minimum(state["iswc"] + state["precipitation"] - iVal, state["swc"])
+            strN = numpy.where(state["pda"] < dzvp, ptr, 0.0)
+        else:
+            dzvp = state["dzvp"] + state["precipitation"] - iVal - state["rt"]
+            dzvp = numpy.maximum(numpy.minimum(dzvp, state["swc"]), state["pwp"])
+            smer = ptr / (state["pda"] - state["pwp"])
+            strN = numpy.where(state["pda"] < dzvp, ptr, numpy.where(0 < (dzvp - state["pwp"]), smer * (dzvp - state["pwp"]), 0.0))
+            strN = numpy.where(strN < 0, 0.0, strN)
+
+        if (step == 0):
+            di = numpy.full(shape, numpy.nan)
+            deficit = numpy.full(shape, numpy.nan)
+            cdef = numpy.full(shape, numpy.nan)
+        else:
+            di = numpy.where(ptr != 0, 1.0 - strN / numpy.where(ptr != 0, ptr, 1.0), 0.0)
+            deficit = ptr - strN
+            # cumulative deficit restarts after restartCumDeficit consecutive days without deficit
+            state["cdef"] = state["cdef"] + deficit
+            state["zeroDays"] = numpy.where(deficit == 0, state["zeroDays"] + 1, 0)
+            restart = (state["rcd"] <= state["zeroDays"])
+            state["cdef"][restart] = 0.0
+            state["zeroDays"][restart] = 0
+            cdef = state["cdef"].copy()
+
+    state["step"] = step + 1
+    state["precipitation"] = zn
+    state["dzvp"] = dzvp
+    state["rt"] = strN
+
+    dayValues = collections.namedtuple("droughtDay", "ptransp rtransp swc di deficit cdef")
+    values = [numpy.where(state["valid"], v, numpy.nan) for v in [ptr, strN, dzvp, di, deficit, cdef]]
+    return dayValues(*values)
+
+
+# risk class (number of breaks passed) for drought index (threshold <= di) or cumulative deficit (threshold < cdef)
+def riskClass(values, classBreaks, strict=False):
+    classes = numpy.digitize(numpy.nan_to_num(values, nan=-numpy.inf), numpy.sort(classBreaks), right=strict)
+    return numpy.where(numpy.isnan(values), 0, classes)
+
+
+# season summary of risk classes: number of days in exactly each class (days-in-class)
+# and first day in each class or above (first-day-above-class)
+def riskSummaryInit(shape, nClasses):
+    summary = dict()
+    summary["days"] = numpy.zeros((nClasses,) + tuple(shape), dtype=numpy.int32)
+    summary["first"] = numpy.zeros((nClasses,) + tuple(shape), dtype=numpy.int32)
+    return summary
+
+
+def riskSummaryUpdate(summary, classes, iDay):
+    for k in range(summary["days"].shape[0]):
+        summary["days"][k] += (classes == k + 1)
+        first = summary["first"][k]
+        first[(first == 0) & (k + 1 <= classes)] = iDay
+
+
+def writeRiskSummary(summary, daysPrefix, firstPrefix, valid):
+    for k in range(summary["days"].shape[0]):
+        days = numpy.where(valid, summary["days"][k], bboLib.rasterNullValue)
+        first = numpy.where(valid & (0 < summary["first"][k]), summary["first"][k], bboLib.rasterNullValue)
+        bboLib.writeRasterArray(bboLib.rasterMonth(daysPrefix, k + 1), days)
+        bboLib.writeRasterArray(bboLib.rasterMonth(firstPrefix, k + 1), first)
+
+
+def seriesValues(series, dayFrom, dayTo, seriesFN):
+    values = dict((d[0], d[1]) for d in series)
+    result = list()
+    for iDay in range(dayFrom, dayTo + 1):
+        if (values.get(iDay) is None):
+            grass.fatal("Input data error (series {0} iDay={1})".format(seriesFN, iDay))
+        result.append(values[iDay])
+    return numpy.array(result, dtype=numpy.double)
+
+
+# water balance of all cells from the first observed day to dayTo
+def droughtStateRun(state, dayFrom, dayTo, airTemperature, realPrecipitation, srPrefix=bboLib.srdayPrefix):
+    for i, iDay in enumerate(range(dayFrom, dayTo + 1)):
+        if ((iDay % 10) == 0):
+            grass.message("drought observed day {0}".format(iDay))
+        solar = bboLib.readRasterArray(bboLib.rasterDayMapset(srPrefix, iDay, bboLib.solarMapset), True)
+        droughtStep(state, airTemperature[i], solar, realPrecipitation[i])
+
+
+def droughtStateSave(state, dayTo, checkpointFN, inputNames="", inputTimes=()):
+    store = dict(state)
+    store["day"] = dayTo
+    store["inputNames"] = inputNames
+    store["inputTimes"] = numpy.array(inputTimes, dtype=numpy.int64)
+    if (store["precipitation"] is None):
+        store["precipitation"] = numpy.nan
+    numpy.savez_compressed(bboLib.getFullDataFileName(checkpointFN), **store)
+
+
+def droughtStateLoad(checkpointFN):
+    fileName = bboLib.getFullDataFileName(checkpointFN)
+    if (not os.path.exists(fileName)):
+        return None
+    store = numpy.load(fileName)
+    state = dict()
+    for name in store.files:
+        state[name] = store[name]
+    for name in ["day", "step", "interception", "rcd"]:
+        state[name] = int(state[name])
+    state["inputNames"] = str(state.get("inputNames", ""))
+    return state
+
+
+def droughtCheckpoint(dayTo, checkpointFN, iswcFN, swcFN, pdaFN, pwpFN, interceptionVal, restartCumDeficit, recalculate=False):
+    # observed water balance state at the end of dayTo, shared by all forecast scenarios
+    seriesNames = [bboLib.solarRadiationFN, bboLib.airTemperatureFN, bboLib.realPrecipitationFN]
+    solarRadiation = bboLib.loadDataSeries(bboLib.solarRadiationFN)
+    minDay = bboLib.seriesMinDay(solarRadiation)
+    if (dayTo < minDay):
+        grass.fatal("Checkpoint day {0} is out of series ({1})".format(dayTo, minDay))
+    rasterNames = [iswcFN, swcFN, pdaFN, pwpFN]
+    rasterNames += [bboLib.rasterDayMapset(bboLib.srdayPrefix, iDay, bboLib.solarMapset) for iDay in range(minDay, dayTo + 1)]
+    inputNames, inputTimes = bboLib.checkpointInputs(rasterNames, seriesNames)
+
+    iswc = bboLib.readRasterArray(iswcFN, True)
+    state = None
+    if (not recalculate):
+        state = droughtStateLoad(checkpointFN)
+    if ((state is not None) and (state["day"] == dayTo) and (state["iswc"].shape == iswc.shape) and
+            (state["interception"] == interceptionVal) and (state["rcd"] == restartCumDeficit) and
+            (state["inputNames"] == inputNames) and numpy.array_equal(state.get("inputTimes"), inputTimes)):
+        grass.message("drought checkpoint {0} day {1}".format(checkpointFN, dayTo))
+        for name in ["day", "inputNames", "inputTimes"]:
+            del state[name]
+        return state
+
+    airTemperature = seriesValues(bboLib.loadDataSeries(bboLib.airTemperatureFN), minDay, dayTo, bboLib.airTemperatureFN)
+    realPrecipitation = seriesValues(bboLib.loadDataSeries(bboLib.realPrecipitationFN), minDay, dayTo, bboLib.realPrecipitationFN)
+
+    grass.message("drought observed days {0} - {1}".format(minDay, dayTo))
+    state = droughtStateInit(iswc, bboLib.readRasterArray(swcFN, True), bboLib.readRasterArray(pdaFN, True),
+                             bboLib.readRasterArray(pwpFN, True), interceptionVal, restartCumDeficit)
+    droughtStateRun(state, minDay, dayTo, airTemperature, realPrecipitation)
+    droughtStateSave(state, dayTo, checkpointFN, inputNames, inputTimes)
+    return state
+
+
+# checkpoint state repeated for the scenarios (scenario axis first)
+def droughtEnsembleInit(state, nScenarios):
+    shape = (nScenarios,) + state["iswc"].shape
+    ensemble = dict()
+    for name in state:
+        value = state[name]
+        if (isinstance(value, numpy.ndarray)):
+            ensemble[name] = numpy.broadcast_to(value, shape).copy()
+        else:
+            ensemble[name] = value
+    return ensemble
+
+
+def droughtEnsembleStep(ensemble, airTemperature, solarRadiation, realPrecipitation):
+    # airTemperature, realPrecipitation: one value per scenario
+    scenarioShape = (-1,) + (1,)*solarRadiation.ndim
+    return droughtStep(ensemble, numpy.reshape(airTemperature, scenarioShape), solarRadiation,
+                       numpy.reshape(realPrecipitation, scenarioShape))
+
+
+def ensembleQuantiles(values, quantiles):
+    # values (scenario, ...), nan cells stay nan
+    return numpy.quantile(values, quantiles, axis=0)
+
+
+
 def calcRiskDI(dayFrom, dayTo, riskThreshold):
     targetMapset = bboLib.hydroMapset
     stageTmp = "tmp_dlib_crdi_stage"
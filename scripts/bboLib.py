@@ -12,9 +12,12 @@
 #############################################################################
 
 import os
+import json
+import hashlib
 import numpy
 import grass.script as grass
 import collections
+from scipy import ndimage
 
 
 #region #################### PARAMETERS ####################
@@ -75,6 +78,10 @@ psryearPrefix = "psr_y"
 srdayPrefix = "sr_d"
 srmonthPrefix = "sr_m"
 sryearPrefix = "sr_y"
+psrdecadePrefix = "psr_dc"
+srdecadePrefix = "sr_dc"
+psrseasonName = "psr_season"
+srseasonName = "sr_season"
 
 # hydro mapset, drought index
 hydroMapset = "hydro"
@@ -86,14 +93,22 @@ realPrecipitationFN = "md_prec_di.txt"
 airTemperatureFN = "md_tmean_di.txt"
 riskDIPrefix = "risk_di_d"
 riskCDEFPrefix = "risk_cdef_d"
+riskDIDaysPrefix = "risk_di_days_c"
+riskDIFirstPrefix = "risk_di_first_c"
+riskCDEFDaysPrefix = "risk_cdef_days_c"
+riskCDEFFirstPrefix = "risk_cdef_first_c"
 
 # forecast hydro mapset, drought index
 diForecastPrefix = "_forecast_di_d"
 deficitForecastPrefix = "_forecast_def_d"
 cumDefForecastPrefix = "_forecast_cdef_d"
+diForecastQuantilePrefix = "_forecast_di_q"
+deficitForecastQuantilePrefix = "_forecast_def_q"
+cumDefForecastQuantilePrefix = "_forecast_cdef_q"
 solarRadiationForecast = "md_gsr_forecast.txt"
 realPrecipitationForecast = "md_prec_forecast.txt"
 airTemperatureForecast = "md_tmean_forecast.txt"
+airTemperatureMaxForecast = "md_tmax_forecast.txt"
 riskForecastCDEFPrefix = "_forecast_risk_cdef_d"
 
 # air temperature prefix
@@ -108,6 +123,9 @@ btMapset = "temperature_bark"
 btMeanPrefix = "bt_mean_d"
 btMaxPrefix = "bt_max_d"
 btEffPrefix = "bt_eff_d"
+btMeanCoefficients = (-0.173, 0.0008518, 1.054)
+btMaxCoefficients = (1.656, 0.002955, 0.534, 0.01884)
+btEffCoefficients = (-310.667, 9.603)
 
 # forecast bark temperature
 ForecastbtMeanPrefix = "_forecast_bt_mean_d"
@@ -156,10 +174,30 @@ phenipsFORECASTDDPrefix = "_forecast_dd_d"
 phenipsBTDDPrefix = "bt_dd_d"
 phenipsFORECASTBTDDPrefix = "_foreast_bt_dd_d"
 phenipsDevelopmentSumThreshold = 557
+phenipsMaxGenerations = 4
+phenipsCheckpointFN = "phenips_checkpoint.npz"
+phenipsEnsembleDevelopmentProbability = "_ensemble_pdevelopment"
+phenipsEnsembleSwarmingName = "_ensemble_swarming"
+phenipsEnsembleInfestationName = "_ensemble_infestation"
+phenipsEnsembleDevelopmentName = "_ensemble_development"
 
 # garray3D
 garray3DMaxRows = 220
 
+# raster arrays
+rasterNullValue = -999999
+
+# point sampling cache, location _data directory
+pointCacheFN = "point_cache.json"
+rwhatMaxRasters = 64
+
+# raster statistics, r.stats default number of floating point ranges
+statsHistogramBins = 255
+statsMaxValues = 65536
+
+# s50 distance update, windowed update while its windows cover at most this fraction of the region
+s50UpdateMaxFraction = 0.5
+
 #endregion
 
 
@@ -220,6 +258,11 @@ def getFullLogFileName(logFN):
     locName = grass.gisenv()["LOCATION_NAME"]
     return os.path.join(dbName, locName, "_data\\prognoses", logFN)
 
+def getFullDataFileName(dataFN):
+    dbName = grass.gisenv()["GISDBASE"]
+    locName = grass.gisenv()["LOCATION_NAME"]
+    return os.path.join(dbName, locName, "_data", dataFN)
+
 #endregion
 
 
@@ -254,6 +297,61 @@ def getLayerWithMapset(layerName, mapsetName):
     return layerName
 
 
+def getFastGisenv():
+    # gisenv read from the GISRC file, without g.gisenv process
+    env = dict()
+    gisrcFile = open(os.environ["GISRC"], "r")
+    for l in gisrcFile:
+        if (":" in l):
+            k, v = l.split(":", 1)
+            env[k.strip()] = v.strip()
+    gisrcFile.close()
+    return env
+
+
+def getRasterFileName(rasterName):
+    env = getFastGisenv()
+    if ("@" in rasterName):
+        name, mapsetName = rasterName.split("@", 1)
+    else:
+        name = rasterName
+        mapsetName = env["MAPSET"]
+    fileName = os.path.join(env["GISDBASE"], env["LOCATION_NAME"], mapsetName, "cell", name)
+    if (os.path.exists(fileName)):
+        return fileName
+    if ("@" in rasterName):
+        return None
+    return grass.find_file(rasterName, "cell")["file"] or None
+
+
+def getRasterModificationTime(rasterName):
+    # None for a missing raster
+    fileName = getRasterFileName(rasterName)
+    if (not fileName):
+        return None
+    mtime = os.stat(fileName).st_mtime_ns
+    fcellName = fileName.replace(os.sep + "cell" + os.sep, os.sep + "fcell" + os.sep)
+    if (os.path.exists(fcellName)):
+        mtime = max(mtime, os.stat(fcellName).st_mtime_ns)
+    return mtime
+
+
+def checkpointInputs(rasterNames, seriesNames):
+    # names and modification times of the checkpoint inputs, the checkpoint is valid while no input changed
+    times = [getRasterModificationTime(r) for r in rasterNames]
+    if (None in times):
+        grass.fatal("Raster {0} does not exist".format(rasterNames[times.index(None)]))
+    times += [os.stat(getFullDataFileName(fn)).st_mtime_ns for fn in seriesNames]
+    return "|".join(rasterNames + seriesNames), numpy.array(times, dtype=numpy.int64)
+
+
+def isFloatRaster(rasterName):
+    fileName = getRasterFileName(rasterName)
+    if (not fileName):
+        return False
+    return os.path.exists(fileName.replace(os.sep + "cell" + os.sep, os.sep + "fcell" + os.sep))
+
+
 def deleteRaster(rasterName):
     if (validateRaster(rasterName)):
         grass.run_command("g.remove", name=rasterName, type="raster", flags="fb", quiet=True)
@@ -420,9 +518,9 @@ def rescaleRaster(inGrid, outGrid, vmin=0.0, vmax=1.0):
     debugMessage("bboLib.rescaleRaster")
     tmp1 = "tmp_rescaleraster1"
     tmp2 = "tmp_rescaleraster2"
-    p = grass.parse_command("r.info", flags="r", map=inGrid)
-    dmin = float(p["min"])
-    dmax = float(p["max"])
+    stat = rasterStatistics(inGrid)
+    dmin = stat.min
+    dmax = stat.max
     debugMessage("bboLib.rescaleRaster grid={0}   dmin={1}   dmax={2}".format(inGrid, dmin, dmax))
     if (dmin < dmax):
         if (vmin < vmax):
@@ -464,55 +562,120 @@ def exportRasterYearToAAI(sourceMapset, sourceTemplate, yearFrom, yearTo, target
 
 
 #region #################### RASTER AREA ####################
+rasterStatisticsCache = dict()
+
+def regionKey():
+    # current region without g.region process
+    env = getFastGisenv()
+    windFN = os.path.join(env["GISDBASE"], env["LOCATION_NAME"], env["MAPSET"], "WIND")
+    wind = ""
+    if (os.path.exists(windFN)):
+        windFile = open(windFN, "r")
+        wind = windFile.read()
+        windFile.close()
+    return (wind, os.environ.get("GRASS_REGION"), os.environ.get("WIND_OVERRIDE"))
+
+
+def rasterStatistics(rasterName, distribution=False):
+    # count, null count, min, max, sum, mean and variance from one read, histogram, value counts and
+    # first category cells only for distribution, cached per raster modification time and region
+    mtime = getRasterModificationTime(rasterName)
+    if (mtime is None):
+        grass.fatal("Raster {0} does not exist".format(rasterName))
+    fileName = getRasterFileName(rasterName)
+    key = (mtime, regionKey())
+    cached = rasterStatisticsCache.get(fileName)
+    if (cached is not None and cached[0] == key and (cached[2] or not distribution)):
+        return cached[1]
+
+    values = readRasterArray(rasterName, True)
+    cells = values.size
+    values = values[~numpy.isnan(values)]
+    n = values.size
+    if (cached is not None and cached[0] == key):
+        stat = cached[1]
+    else:
+        if (0 < n):
+            minVal = float(values.min())
+            maxVal = float(values.max())
+            sumVal = float(values.sum(dtype=numpy.double))
+            meanVal = sumVal / n
+            varVal = float(((values - meanVal) ** 2).mean())
+        else:
+            minVal = maxVal = meanVal = varVal = None
+            sumVal = 0.0
+        rasterStat = collections.namedtuple("rasterStatistics", "cells nulls n min max sum mean variance histogram values firstcells")
+        stat = rasterStat(cells, cells - n, n, minVal, maxVal, sumVal, meanVal, varVal, None, None, None)
+
+    if (distribution):
+        histogram = None
+        valueCounts = None
+        firstCells = 0
+        if (0 < n):
+            histogram = numpy.histogram(values, bins=statsHistogramBins, range=(stat.min, stat.max))
+            uniqueValues, uniqueCounts = numpy.unique(values, return_counts=True)
+            if (uniqueValues.size <= statsMaxValues):
+                valueCounts = dict(zip(uniqueValues.tolist(), uniqueCounts.tolist()))
+            if (isFloatRaster(rasterName)):
+                firstCells = int(histogram[0][0])
+            else:
+                firstCells = int(uniqueCounts[0])
+        stat = stat._replace(histogram=histogram, values=valueCounts, firstcells=firstCells)
+    rasterStatisticsCache[fileName] = (key, stat, distribution)
+    return stat
+
+
+def getRastersStatistics(rasterNames):
+    if (isinstance(rasterNames, str)):
+        rasterNames = rasterNames.split(",")
+    return [rasterStatistics(r) for r in rasterNames]
+
+
 def getRasterArea(rasterName):
-    p = grass.read_command("r.stats", flags="an", input=rasterName, quiet=True)
-    if (p == ""):
-        return 0.0
-    return float(p.split(" ")[1])
+    # area of the first category as r.stats -an
+    reg = grass.region()
+    return rasterStatistics(rasterName, True).firstcells * float(reg["ewres"]) * float(reg["nsres"])
 
 def getCellsNumber(rasterName, value=None):
-    tmp = "tmp_bbolib_cellsnumber_1"
+    stat = rasterStatistics(rasterName, True)
     if (value is None):
-        rasterFN = rasterName
-    else:
-        grass.mapcalc("$tmp = if($valRaster == $val, 1, null())", tmp=tmp, valRaster=rasterName, val=value, overwrite=True)
-        rasterFN = tmp
-    p = grass.read_command("r.stats", flags="cn", input=rasterFN, quiet=True)
+        return stat.firstcells
+    if (stat.values is not None):
+        return int(stat.values.get(float(value), 0))
+    tmp = "tmp_bbolib_cellsnumber_1"
+    grass.mapcalc("$tmp = if($valRaster == $val, 1, null())", tmp=tmp, valRaster=rasterName, val=value, overwrite=True)
+    n = rasterStatistics(tmp).n
     deleteRaster(tmp)
-    if (p == ""):
-        return 0
-    return int(p.split(" ")[1])
+    return n
 
 def getNotNullCellsNumber(rasterName):
-    p = grass.parse_command("r.univar", flags="g", map=rasterName, quiet=True)
-    if (0 < len(p)):
-        return int(p["n"].strip())
-    return 0
+    return rasterStatistics(rasterName).n
 
 def getMinValue(rasterName):
-    p = grass.parse_command("r.univar", flags="g", map=rasterName, quiet=True)
-    if (0 < len(p)):
-        return float(p["min"].strip())
+    stat = rasterStatistics(rasterName)
+    if (0 < stat.n):
+        return stat.min
     return 0
 
 def getMaxValue(rasterName):
-    p = grass.parse_command("r.univar", flags="g", map=rasterName, quiet=True)
-    if (0 < len(p)):
-        return float(p["max"].strip())
+    stat = rasterStatistics(rasterName)
+    if (0 < stat.n):
+        return stat.max
     return 0
 
 
 def getValueStatistics(rasterNames):
-    p = grass.parse_command("r.univar", flags="g", map=rasterNames, quiet=True)
-
-    if (0 < len(p)):
-        cells = int(p["cells"].strip())
-        minVal = float(p["min"].strip())
-        maxVal = float(p["max"].strip())
-        avgVal = float(p["mean"].strip())
-        stdVal = float(p["stddev"].strip())
+    # statistics of all rasters together as r.univar with several maps
+    stats = getRastersStatistics(rasterNames)
+    n = sum([s.n for s in stats])
+    if (0 < n):
+        cells = sum([s.cells for s in stats])
+        minVal = min([s.min for s in stats if (0 < s.n)])
+        maxVal = max([s.max for s in stats if (0 < s.n)])
+        avgVal = sum([s.sum for s in stats]) / n
+        varVal = sum([s.n * (s.variance + (s.mean - avgVal) ** 2) for s in stats if (0 < s.n)]) / n
         valStat = collections.namedtuple("valSatistics", "cells min max avg std")
-        return valStat(cells, minVal, maxVal, avgVal, stdVal)
+        return valStat(cells, minVal, maxVal, avgVal, varVal ** 0.5)
 
     return None
 
@@ -529,25 +692,131 @@ def getCellArea():
 
 
 #region #################### DATA SERIES PROCESSING ####################
-def loadDataSeries(fileName):
-    dbName = grass.gisenv()["GISDBASE"]
-    locName = grass.gisenv()["LOCATION_NAME"]
-    fileName = os.path.join(dbName, locName, "_data", fileName)
-    s = list()
+dataSeriesCache = dict()
+
+
+def _parseDataSeries(fileName, hourly):
+    # day [hour] value [value ...], one value column per station
+    rows = list()
     txtFile = open(fileName, "r")
     for l in txtFile:
         if (2 < len(l)):
-            d, v = l.split()
-            s.append((int(d), float(v)))
+            rows.append([float(v) for v in l.split()])
     txtFile.close()
-    return s
+    try:
+        data = numpy.array(rows, dtype=numpy.double).reshape((len(rows), -1))
+    except ValueError:
+        grass.fatal("Data series {0} has rows of different length".format(fileName))
+    nKeys = 2 if hourly else 1
+    if (data.shape[1] <= nKeys):
+        grass.fatal("Data series {0} has no values".format(fileName))
+    hours = data[:, 1] if hourly else numpy.zeros(0)
+    return data[:, 0].astype(numpy.int32), hours, data[:, nKeys:]
+
+
+def readDataSeries(fileName, hourly=False):
+    # typed data series, parsed once per file version (memory and binary npz cache in _data)
+    fullName = getFullDataFileName(fileName)
+    if (not os.path.exists(fullName)):
+        grass.fatal("Data series {0} does not exist".format(fullName))
+    mtime = os.path.getmtime(fullName)
+    key = (fullName, hourly)
+    entry = dataSeriesCache.get(key)
+    if (entry and entry[0] == mtime):
+        return entry[1]
+
+    cacheFile = fullName + (".hourly.npz" if hourly else ".npz")
+    days = None
+    if (os.path.exists(cacheFile)):
+        try:
+            store = numpy.load(cacheFile)
+            if (float(store["mtime"]) == mtime):
+                days, hours, values = store["days"], store["hours"], store["values"]
+        except Exception:
+            days = None
+    if (days is None):
+        days, hours, values = _parseDataSeries(fullName, hourly)
+        try:
+            numpy.savez(cacheFile, mtime=mtime, days=days, hours=hours, values=values)
+        except (IOError, OSError):
+            debugMessage("bboLib.readDataSeries cache {0} not written".format(cacheFile))
+
+    dataSeries = collections.namedtuple("dataSeries", "days hours values")
+    series = dataSeries(days, hours if hourly else None, values)
+    dataSeriesCache[key] = (mtime, series)
+    return series
+
+
+def dailySeries(series, aggregate="mean"):
+    # hourly series aggregated to days (mean, max, min or sum), nan values skipped
+    functions = {"mean": numpy.nanmean, "max": numpy.nanmax, "min": numpy.nanmin, "sum": numpy.nansum}
+    if (series.hours is None):
+        return series
+    order = numpy.argsort(series.days, kind="stable")
+    days, starts = numpy.unique(series.days[order], return_index=True)
+    values = series.values[order]
+    ends = list(starts[1:]) + [len(order)]
+    with numpy.errstate(invalid="ignore"):
+        daily = numpy.array([functions[aggregate](values[i0:i1], axis=0) for i0, i1 in zip(starts, ends)])
+    return type(series)(days, None, daily.reshape((len(days), -1)))
+
+
+def seriesInterpolation(series, days, method="linear", column=0):
+    # values for an array of days (linear, nearest or step), nan values are skipped and their gaps interpolated
+    # from the neighbouring known days, nan out of the known days of the series
+    # column None returns values of all stations (days, stations)
+    days = numpy.asarray(days, dtype=numpy.double)
+    columns = range(series.values.shape[1]) if column is None else [column]
+    result = numpy.full((days.size, len(columns)), numpy.nan)
+    for k, c in enumerate(columns):
+        known = ~numpy.isnan(series.values[:, c])
+        x = series.days[known].astype(numpy.double)
+        v = series.values[known, c]
+        if (x.size == 0):
+            continue
+        inside = (x[0] <= days) & (days <= x[-1])
+        if (method == "linear"):
+            values = numpy.interp(days, x, v)
+        elif (method == "nearest"):
+            i1 = numpy.clip(numpy.searchsorted(x, days), 0, x.size - 1)
+            i0 = numpy.clip(i1 - 1, 0, x.size - 1)
+            values = numpy.where(numpy.abs(days - x[i0]) <= numpy.abs(x[i1] - days), v[i0], v[i1])
+        elif (method == "step"):
+            values = v[numpy.clip(numpy.searchsorted(x, days, side="right") - 1, 0, x.size - 1)]
+        else:
+            grass.fatal("Unknown interpolation method {0}".format(method))
+        result[:, k] = numpy.where(inside, values, numpy.nan)
+    if (column is None):
+        return result
+    return result[:, 0]
+
+
+def seriesGaps(series, column=0):
+    # missing days inside the series as (first missing day, last missing day)
+    days = series.days[~numpy.isnan(series.values[:, column])]
+    days = numpy.unique(days)
+    gaps = list()
+    for i in numpy.nonzero(1 < numpy.diff(days))[0]:
+        gaps.append((int(days[i]) + 1, int(days[i + 1]) - 1))
+    return gaps
+
+
+def loadDataSeries(fileName):
+    series = readDataSeries(fileName)
+    return [(int(d), float(v)) for d, v in zip(series.days, series.values[:, 0])]
 
 
 def linearInterpolation(valSeries, iDay):
-    i1 = 0
+    # first item after iDay by bisection, the series is sorted by days
+    i0 = 0
+    i1 = len(valSeries)
+    while (i0 < i1):
+        i = (i0 + i1) // 2
+        if (valSeries[i][0] <= iDay):
+            i0 = i + 1
+        else:
+            i1 = i
     n = len(valSeries)
-    while (i1 < n and valSeries[i1][0] <= iDay):
-        i1 = i1 + 1
     if (n <= i1):
         c = None
     elif (0 < i1):
@@ -676,6 +945,104 @@ def showSeriesStatistics(rasterTemplate, yearFrom, yearTo, valStat, logFile=None
 
 
 
+#region #################### POINT SAMPLING ####################
+def getVectorPoints(vectorName, withCats=False):
+    points = list()
+    p = grass.read_command("v.out.ascii", input=vectorName, type="point", format="point", separator="pipe", quiet=True)
+    for l in p.splitlines():
+        v = l.split("|")
+        if (withCats and 3 <= len(v)):
+            points.append((float(v[0]), float(v[1]), int(v[-1])))
+        elif (2 <= len(v)):
+            points.append((float(v[0]), float(v[1])))
+    return points
+
+
+def bilinearNeighbours(points):
+    # centres of the four cells around each point and their bilinear weights
+    reg = grass.region()
+    ewres = float(reg["ewres"])
+    nsres = float(reg["nsres"])
+    neighbours = list()
+    weights = numpy.zeros((len(points), 4))
+    for i, pt in enumerate(points):
+        fc = (pt[0] - float(reg["w"])) / ewres - 0.5
+        fr = (float(reg["n"]) - pt[1]) / nsres - 0.5
+        c0 = int(min(max(numpy.floor(fc), 0), reg["cols"] - 2))
+        r0 = int(min(max(numpy.floor(fr), 0), reg["rows"] - 2))
+        dc = min(max(fc - c0, 0.0), 1.0)
+        dr = min(max(fr - r0, 0.0), 1.0)
+        for r, c in [(r0, c0), (r0, c0 + 1), (r0 + 1, c0), (r0 + 1, c0 + 1)]:
+            neighbours.append((float(reg["w"]) + (c + 0.5) * ewres, float(reg["n"]) - (r + 0.5) * nsres))
+        weights[i] = [(1 - dr) * (1 - dc), (1 - dr) * dc, dr * (1 - dc), dr * dc]
+    return neighbours, weights
+
+
+def bilinearValues(values, weights):
+    # values (4 * points, rasters) sampled at bilinearNeighbours, null neighbours are left out
+    values = values.reshape((weights.shape[0], 4, -1))
+    w = numpy.where(numpy.isnan(values), 0.0, weights[:, :, numpy.newaxis])
+    wsum = w.sum(axis=1)
+    result = numpy.nansum(values * w, axis=1) / numpy.where(0 < wsum, wsum, 1)
+    result[wsum == 0] = numpy.nan
+    return result
+
+
+def samplePoints(rasterNames, points):
+    # values (point, raster) of cells containing the points, null as nan
+    values = numpy.full((len(points), len(rasterNames)), numpy.nan)
+    if (len(points) == 0):
+        return values
+    coords = "".join(["{0}|{1}\n".format(x, y) for x, y in points]).encode()
+    for i0 in range(0, len(rasterNames), rwhatMaxRasters):
+        names = rasterNames[i0:i0 + rwhatMaxRasters]
+        p = grass.start_command("r.what", map=",".join(names), separator="pipe", null_value="*", quiet=True,
+                                stdin=grass.PIPE, stdout=grass.PIPE)
+        out = p.communicate(coords)[0].decode()
+        lines = [l for l in out.splitlines() if (0 < len(l.strip()))]
+        if (len(lines) != len(points)):
+            grass.fatal("r.what returned {0} rows for {1} points".format(len(lines), len(points)))
+        for i, l in enumerate(lines):
+            v = l.split("|")[-len(names):]
+            values[i, i0:i0 + len(names)] = [numpy.nan if (s.strip() in ["*", ""]) else float(s) for s in v]
+    return values
+
+
+def samplePointSeries(rasterNames, points, cacheFN=pointCacheFN):
+    # cached samplePoints, cache entry is valid while no raster of the series changed
+    reg = grass.region()
+    key = json.dumps([points, rasterNames, [reg[k] for k in ["n", "s", "e", "w", "rows", "cols"]]])
+    key = hashlib.sha1(key.encode()).hexdigest()
+    mtimes = [getRasterModificationTime(r) for r in rasterNames]
+    if (None in mtimes):
+        grass.fatal("Raster {0} does not exist".format(rasterNames[mtimes.index(None)]))
+
+    cacheFile = getFullDataFileName(cacheFN)
+    cache = dict()
+    if (os.path.exists(cacheFile)):
+        try:
+            jsonFile = open(cacheFile, "r")
+            cache = json.load(jsonFile)
+            jsonFile.close()
+        except ValueError:
+            cache = dict()
+
+    entry = cache.get(key)
+    if (entry and entry["mtimes"] == mtimes):
+        debugMessage("bboLib.samplePointSeries cached {0} rasters".format(len(rasterNames)))
+        return numpy.array(entry["values"], dtype=numpy.double)
+
+    values = samplePoints(rasterNames, points)
+    cache[key] = {"mtimes": mtimes, "values": values.tolist()}
+    jsonFile = open(cacheFile, "w")
+    json.dump(cache, jsonFile)
+    jsonFile.close()
+    return values
+
+#endregion
+
+
+
 #region #################### GROUP CELLS ####################
 def groupCells(srcRaster, grpRaster):
     tmp0 = "tmp_bbolib_groupCells_0"
@@ -715,56 +1082,19 @@ def findPreviousSpotYear(year, yearsRange=10):
     if (yearsRange < 1):
         return None
 
-    userMapset = grass.gisenv()["MAPSET"]  
-    if (not userMapset == forestMapset):
-        grass.run_command("g.mapset", mapset=forestMapset)
-    
-    yearFrom10 = year - yearsRange
-    
-    y1 = year - 1
-    cont = True
-    while (cont and (yearFrom10 <= y1)):
-        prevSpot = replaceYearParameter(spotTemplate, y1)
-        if (validateRaster(prevSpot)):
-            cont = False
-        else:
-            y1 = y1 - 1
-
-    if (not userMapset == forestMapset):
-        grass.run_command("g.mapset", mapset=userMapset)
-    
-    if (cont):
-        return None
-    else:
-        return y1
+    for y1 in range(year - 1, year - yearsRange - 1, -1):
+        if (getRasterModificationTime(replaceYearParameter(spotTemplate, y1, forestMapset)) is not None):
+            return y1
+    return None
 
 
 def findPreviousSpotLayer(year, yearsRange=10):
     debugMessage("bboLib.findPreviousSpotLayer")
     
-    if (yearsRange < 1):
+    y1 = findPreviousSpotYear(year, yearsRange)
+    if (y1 is None):
         return None
-
-    userMapset = grass.gisenv()["MAPSET"]  
-    if (not userMapset == forestMapset):
-        grass.run_command("g.mapset", mapset=forestMapset)
-    
-    yearFrom10 = year - yearsRange
-    
-    y1 = year - 1
-    prevSpot = None
-    while (yearFrom10 <= y1):
-        prevSpot = replaceYearParameter(spotTemplate, y1)
-        if (validateRaster(prevSpot)):
-            y1 = yearFrom10 - 1
-        else:
-            prevSpot = None
-        y1 = y1 - 1
-
-    if (not userMapset == forestMapset):
-        grass.run_command("g.mapset", mapset=userMapset)
-    
-    return prevSpot
+    return replaceYearParameter(spotTemplate, y1)
 
 
 def cleanSpotDB(yearFrom, yearTo):
@@ -817,8 +1147,6 @@ def spotClassificationDataSeries(yearFrom, yearTo):
 def spotClassificationInit(targetMapset, 
                            yearFrom, yearTo, 
                            aspotPrefix, aspotidPrefix):
-    spotY0 = "tmp_bb_spotinit_i0"
-
     userMapset = grass.gisenv()["MAPSET"]  
     if (not (userMapset == targetMapset)):
         grass.run_command("g.mapset", mapset=targetMapset)
@@ -828,7 +1156,7 @@ def spotClassificationInit(targetMapset,
     y0 = yearFrom
     while (y0 <= yearTo):
         actSpot = rasterYear(aspotPrefix, y0)
-        if grass.find_file(actSpot + "@" + targetMapset)['file']:
+        if (getRasterModificationTime(actSpot + "@" + targetMapset) is not None):
             break;
         y0 = y0 + 1
 
@@ -836,49 +1164,75 @@ def spotClassificationInit(targetMapset,
         grass.message("spot classification init {0}".format(actSpot))
         actSpotId = rasterYear(aspotidPrefix, y0)
 
-        grass.mapcalc("$tmp0 = if(0 < $actSpot, 3, null())", overwrite=True, tmp0=spotY0, actSpot=actSpot)
-        grass.mapcalc("$actSpot = $tmp0", overwrite=True, actSpot=actSpot, tmp0=spotY0)
-        groupCells(spotY0, actSpotId)
-
-        deleteRaster(spotY0)
+        spot = readRasterArray(actSpot, True)
+        infested = (0 < numpy.nan_to_num(spot))
+        ids = spotLabels(infested)
+        writeRasterArray(actSpot, numpy.where(infested, 3, rasterNullValue))
+        writeRasterArray(actSpotId, numpy.where(infested, ids, rasterNullValue))
 
     if (not (userMapset == targetMapset)):
         grass.run_command("g.mapset", mapset=userMapset)
 
 
+def spotLabels(cells):
+    # 8-connected groups of cells as groupCells
+    labels, n = ndimage.label(cells, structure=numpy.ones((3, 3)))
+    return labels
+
+
+def spotClassificationArray(prevSpot, prevSpotId, actSpot):
+    # OLD cells were infested the previous year, SPREAD groups of new cells touch the previous year new cells,
+    # INIT groups of new cells do not; spot ids label the groups of new cells
+    infested = (0 < numpy.nan_to_num(actSpot))
+    newCells = infested & numpy.isnan(prevSpot)
+    ids = spotLabels(newCells)
+    touching = ndimage.binary_dilation(~numpy.isnan(prevSpotId), structure=numpy.ones((3, 3))) & newCells
+    spread = numpy.isin(ids, numpy.unique(ids[touching])) & newCells
+    codes = numpy.where(infested, numpy.where(newCells, numpy.where(spread, 2, 3), 1), rasterNullValue)
+    return codes, numpy.where(newCells, ids, rasterNullValue)
+
+
 def spotClassificationSeries(sourceMapset, targetMapset, 
                              yearFrom, yearTo, 
                              pspotPrefix, pspotidPrefix,
                              aspotPrefix, aspotidPrefix):
+    # one forward pass, each classified year is the previous year of the next one
     grass.message("spot series classification")
 
     y0 = yearTo
     while (yearFrom <= y0):
         y0Name = rasterYear(pspotidPrefix, y0, sourceMapset)
-        if grass.find_file(y0Name)['file']:
+        if (getRasterModificationTime(y0Name) is not None):
             break
         y0 = y0 - 1
 
-    while (y0 < yearTo):
-        checkRaster(rasterYear(pspotPrefix, y0), sourceMapset)
-        checkRaster(rasterYear(pspotidPrefix, y0), sourceMapset)
+    if (yearTo <= y0):
+        return
 
-        y1 = y0 + 1
-        while (y1 <= yearTo):
-            y1Name = rasterYear(aspotPrefix, y1, targetMapset)
-            if grass.find_file(y1Name)['file']:
-                break
-            y1 = y1 + 1
+    checkRaster(rasterYear(pspotPrefix, y0), sourceMapset)
+    checkRaster(rasterYear(pspotidPrefix, y0), sourceMapset)
+    prevSpot = readRasterArray(rasterYear(pspotPrefix, y0, sourceMapset), True)
+    prevSpotId = readRasterArray(rasterYear(pspotidPrefix, y0, sourceMapset), True)
 
-        if (y1 <= yearTo):
-            actSpot = rasterYear(aspotPrefix, y1, targetMapset)
-            checkRaster(actSpot)
-            spotClassificationST(sourceMapset, targetMapset, 
-                                 y0, pspotPrefix, pspotidPrefix,
-                                 y1, aspotPrefix, aspotidPrefix)
-        
+    userMapset = grass.gisenv()["MAPSET"]  
+    if (not (userMapset == targetMapset)):
+        grass.run_command("g.mapset", mapset=targetMapset)
+
+    for y1 in range(y0 + 1, yearTo + 1):
+        actSpot = rasterYear(aspotPrefix, y1)
+        if (getRasterModificationTime(rasterYear(aspotPrefix, y1, targetMapset)) is None):
+            continue
+        grass.message("spot classification {0} / {1}".format(actSpot, y0))
+        codes, ids = spotClassificationArray(prevSpot, prevSpotId, readRasterArray(actSpot, True))
+        writeRasterArray(actSpot, codes)
+        writeRasterArray(rasterYear(aspotidPrefix, y1), ids)
+        prevSpot = numpy.where(codes == rasterNullValue, numpy.nan, codes)
+        prevSpotId = numpy.where(ids == rasterNullValue, numpy.nan, ids)
         y0 = y1
 
+    if (not (userMapset == targetMapset)):
+        grass.run_command("g.mapset", mapset=userMapset)
+
 
 def spotClassificationST(sourceMapset, targetMapset, 
                          y0, pspotPrefix, pspotidPrefix, 
@@ -902,50 +1256,16 @@ def spotClassificationFN(targetMapset,
     if (not classifySpots):
         return
 
-    spotY0 = "tmp_bbolib_spotclass_r0"
-    spotY1 = "tmp_bbolib_spotclass_r1"
-    spotY2 = "tmp_bbolib_spotclass_r2"
-    spotY3 = "tmp_bbolib_spotclass_r3"
-    actEId = "tmp_bbolib_spotclass_r4"
-
     userMapset = grass.gisenv()["MAPSET"]  
     if (not (userMapset == targetMapset)):
         grass.run_command("g.mapset", mapset=targetMapset)
     
     grass.message("spot classification {0} / {1}".format(actSpot, prevSpot))
     
-    grass.mapcalc("$tmp0 = if(0 < $actSpot, if(isnull($prevSpot), 1, null()))", overwrite=True, tmp0=spotY0, prevSpot=prevSpot, actSpot=actSpot)
-    groupCells(spotY0, actSpotId)
-
-    grass.mapcalc("$tmp1 = $prevSpotId", overwrite=True, tmp1=spotY1, prevSpotId=prevSpotId)
-    area2 = getNotNullCellsNumber(spotY1)
-    area1 = 0
-    i = 1
-    while (area1 != area2):
-        debugMessage("iteration: {0}   cells: {1}".format(i, area2))
-        area1 = area2
-        grass.run_command("r.neighbors", input=spotY1, output=spotY2, method="minimum", quiet=True, overwrite=True)
-        grass.mapcalc("$tmp3 = if(isnull($tmp1), $tmp2 * $tmp0, $tmp1)", tmp0=spotY0, tmp1=spotY1, tmp2=spotY2, tmp3=spotY3, overwrite=True)
-        grass.mapcalc("$tmp1 = $tmp3", tmp1=spotY1, tmp3=spotY3, overwrite=True)
-        area2 = getNotNullCellsNumber(spotY1)
-        i = i + 1
-
-    grass.mapcalc("$eid = $tmp1", eid=actEId, tmp1=spotY1, overwrite=True)
-    grass.run_command("r.null", map=actEId, setnull=0, quiet=True)
-    grass.mapcalc("$tmp0 = if(0 < $actSpot, if(isnull($prevSpot), 2, 0))", overwrite=True, tmp0=spotY0, prevSpot=prevSpot, actSpot=actSpot)
-    grass.mapcalc("$tmp1 = if(0 < $actSpot, 1, 0)", overwrite=True, tmp1=spotY1, actSpot=actSpot)
-    grass.mapcalc("$tmp2 = if(0 < $eid, if(isnull($prevSpot), 1, 0))", overwrite=True, tmp2=spotY2, prevSpot=prevSpot, eid=actEId)
-    grass.run_command("r.null", map=spotY0, null=0, quiet=True)
-    grass.run_command("r.null", map=spotY1, null=0, quiet=True)
-    grass.run_command("r.null", map=spotY2, null=0, quiet=True)
-    grass.mapcalc("$actSpot = $tmp1 + $tmp0 - $tmp2", tmp0=spotY0, tmp1=spotY1, tmp2=spotY2, actSpot=actSpot, overwrite=True)
-    grass.run_command("r.null", map=actSpot, setnull=0, quiet=True)
-    
-    deleteRaster(spotY0)
-    deleteRaster(spotY1)
-    deleteRaster(spotY2)
-    deleteRaster(spotY3)
-    deleteRaster(actEId)
+    codes, ids = spotClassificationArray(readRasterArray(prevSpot, True), readRasterArray(prevSpotId, True),
+                                         readRasterArray(actSpot, True))
+    writeRasterArray(actSpot, codes)
+    writeRasterArray(actSpotId, ids)
 
     if (not (userMapset == targetMapset)):
         grass.run_command("g.mapset", mapset=userMapset)
@@ -980,12 +1300,6 @@ def spotAreas(targetMapset, year):
     # calculates areas in hectares
     debugMessage("bboLib.spotAreas")
 
-    tmp1 = "tmp_bbolib_spotarea_1"
-    tmp2 = "tmp_bbolib_spotarea_2"
-    actualNSpot = "tmp_bbolib_spotarea_3"
-    actualNSpot0 = "tmp_bbolib_spotarea_4"
-    actualNSpotGroup = "tmp_bbolib_spotarea_5"
-
     grass.message("spot areas {0}".format(year))
 
     userMapset = grass.gisenv()["MAPSET"]  
@@ -995,22 +1309,11 @@ def spotAreas(targetMapset, year):
     bbSpot = replaceYearParameter(spotTemplate, year)
     bbSpotArea = replaceYearParameter(spotAreaTemplate, year)
 
-    # actual bark beetle spots
-    grass.mapcalc("$actualNSpot = if(1 < $bbSpot, 1, null())", actualNSpot=actualNSpot, bbSpot=bbSpot, overwrite=True)
-    grass.mapcalc("$actualNSpot0 = $actualNSpot", actualNSpot0=actualNSpot0, actualNSpot=actualNSpot, overwrite=True)
-    grass.run_command("r.null", map=actualNSpot0, null=0, quiet=True)
-
-    # size of bark beetle spots
-    grass.mapcalc("$tmp1 = $v", tmp1=tmp1, v=getCellArea()/10000.0, overwrite=True)
-    grass.run_command("r.clump", overwrite=True, input=actualNSpot, output=tmp2, quiet=True)
-    grass.mapcalc("$actualNSpotGroup = $tmp2 * $actualNSpot", actualNSpotGroup=actualNSpotGroup, tmp2=tmp2, actualNSpot=actualNSpot, overwrite=True)
-    grass.run_command("r.stats.zonal", overwrite=True, base=actualNSpotGroup, cover=tmp1, output=bbSpotArea, method="sum", quiet=True)
-    
-    deleteRaster(actualNSpotGroup)
-    deleteRaster(actualNSpot0)
-    deleteRaster(actualNSpot)
-    deleteRaster(tmp2)
-    deleteRaster(tmp1)
+    # actual bark beetle spots and size of their groups
+    actualNSpot = sparseSpot.fromRaster(bbSpot).select(lambda v: 1 < v)
+    groups = actualNSpot.labels()
+    groupArea = numpy.bincount(groups) * getCellArea() / 10000.0
+    sparseSpot(actualNSpot.shape, actualNSpot.indices, groupArea[groups]).toRaster(bbSpotArea, True)
 
     if (not (userMapset == targetMapset)):
         grass.run_command("g.mapset", mapset=userMapset)
@@ -1373,7 +1676,8 @@ def updateS50MaskSeries(targetMapset, yearFrom, yearTo):
     userMapset = grass.gisenv()["MAPSET"]  
     if (not (userMapset == targetMapset)):
         grass.run_command("g.mapset", mapset=targetMapset)
-        
+
+    s50 = None
     y = yearFrom
     while (y <= yearTo):
         actSpot = replaceYearParameter(spotTemplate, y)
@@ -1381,10 +1685,13 @@ def updateS50MaskSeries(targetMapset, yearFrom, yearTo):
         updatedS50Mask = replaceYearParameter(updatedS50MaskTemplate, y)
         deleteRaster(updatedS50Mask)
 
-        if (validateRaster(actSpot) and validateRaster(s50Mask)):
+        if (getRasterModificationTime(actSpot) is not None and getRasterModificationTime(s50Mask) is not None):
             prevSpot = findPreviousSpotLayer(y)
             if (prevSpot):
-                updateS50Mask(y, s50Mask, prevSpot, updatedS50Mask)
+                grass.message("Update spruce forest mask {0}".format(y))
+                if (s50 is None or s50[0] != s50Mask):
+                    s50 = (s50Mask, readRasterArray(s50Mask, True))
+                writeS50Mask(updatedS50Mask, s50MaskArray(s50[1], readRasterArray(prevSpot, True)))
         
         y = y + 1
 
@@ -1394,23 +1701,134 @@ def updateS50MaskSeries(targetMapset, yearFrom, yearTo):
 def updateS50Mask(year, s50Mask, prevSpot, updatedS50Mask):
     debugMessage("bboLib.updateS50Mask")
 
-    tmp1 = "tmp_s50mask_tmp1"
-    prevSpot0 = "tmp_s50mask_tmp2"
-  
     if (validateRaster(prevSpot) and validateRaster(s50Mask)):
         grass.message("Update spruce forest mask {0}".format(year))
-
-        # prepare actualSpot
-        grass.mapcalc("$tmp1 = $prevSpot * $s50Mask", tmp1=tmp1, prevSpot=prevSpot, s50Mask=s50Mask, overwrite=True)
-        grass.mapcalc("$prevSpot0 = if(0 < $tmp1, 1, null())", prevSpot0=prevSpot0, tmp1=tmp1, overwrite=True)
-        grass.run_command("r.null", map=prevSpot0, null=0, quiet=True)
-        
-        # update spruce forest mask
-        grass.mapcalc("$updatedS50Mask = $s50Mask - $prevSpot0", updatedS50Mask=updatedS50Mask, s50Mask=s50Mask, prevSpot0=prevSpot0, overwrite=True)
-        grass.run_command("r.null", map=updatedS50Mask, setnull=0, quiet=True)
-
-        deleteRaster(tmp1)
-        deleteRaster(prevSpot0)
+        writeS50Mask(updatedS50Mask, s50MaskArray(readRasterArray(s50Mask, True), readRasterArray(prevSpot, True)))
+
+
+def s50MaskArray(s50, prevSpot):
+    # stand mask without the previous year spots, null as nan
+    prevSpot0 = (0 < numpy.nan_to_num(prevSpot * s50))
+    mask = s50 - prevSpot0
+    mask[mask == 0] = numpy.nan
+    return mask
+
+
+def writeS50Mask(maskName, mask):
+    writeRasterArray(maskName, numpy.where(numpy.isnan(mask), rasterNullValue, mask).astype(numpy.int32))
+
+
+def s50Distance(forest, sampling):
+    # distance of forest cells to the nearest non forest cell and of non forest cells to the nearest forest cell
+    if (not forest.any()):
+        return numpy.full(forest.shape, numpy.nan)
+    if (forest.all()):
+        return numpy.zeros(forest.shape)
+    dIn = ndimage.distance_transform_edt(forest, sampling=sampling)
+    dOut = ndimage.distance_transform_edt(~forest, sampling=sampling)
+    return numpy.where(forest, dIn, dOut)
+
+
+def _mergeWindows(windows):
+    # windows (r0, r1, c0, c1, margin) around candidate cells, windows overlapping with their margins merged
+    merged = True
+    while (merged):
+        merged = False
+        result = list()
+        for w in windows:
+            for i, m in enumerate(result):
+                if ((w[0] - w[4] < m[1] + m[4]) and (m[0] - m[4] < w[1] + w[4]) and
+                        (w[2] - w[4] < m[3] + m[4]) and (m[2] - m[4] < w[3] + w[4])):
+                    result[i] = (min(w[0], m[0]), max(w[1], m[1]), min(w[2], m[2]), max(w[3], m[3]), max(w[4], m[4]))
+                    merged = True
+                    break
+            else:
+                result.append(w)
+        windows = result
+    return windows
+
+
+def _windowDistance(forest, candidates, window, sampling, result):
+    # s50Distance of the candidate cells from a window around them, enlarged until the window distances are exact
+    nRows, nCols = forest.shape
+    cr0, cr1, cc0, cc1, margin = window
+    while (True):
+        r0 = max(cr0 - margin, 0)
+        r1 = min(cr1 + margin, nRows)
+        c0 = max(cc0 - margin, 0)
+        c1 = min(cc1 + margin, nCols)
+        w = forest[r0:r1, c0:c1]
+        if (w.all() or not w.any()):
+            distance = numpy.full(w.shape, numpy.inf)
+        else:
+            distance = numpy.where(w, ndimage.distance_transform_edt(w, sampling=sampling),
+                                   ndimage.distance_transform_edt(~w, sampling=sampling))
+        wr = numpy.arange(r0, r1)[:, numpy.newaxis]
+        wc = numpy.arange(c0, c1)[numpy.newaxis, :]
+        edge = numpy.full(w.shape, numpy.inf)
+        if (0 < r0):
+            edge = numpy.minimum(edge, (wr - r0 + 1) * sampling[0])
+        if (r1 < nRows):
+            edge = numpy.minimum(edge, (r1 - wr) * sampling[0])
+        if (0 < c0):
+            edge = numpy.minimum(edge, (wc - c0 + 1) * sampling[1])
+        if (c1 < nCols):
+            edge = numpy.minimum(edge, (c1 - wc) * sampling[1])
+        windowCandidates = candidates[r0:r1, c0:c1]
+        if (numpy.all(distance[windowCandidates] <= edge[windowCandidates])):
+            break
+        margin = 2 * margin
+    result[r0:r1, c0:c1][windowCandidates] = distance[windowCandidates]
+
+
+def s50DistanceUpdate(forest, prevForest, prevDistance, sampling):
+    # s50Distance recomputed only for cells whose distance may change after the forest changed,
+    # other cells are nearer to their nearest opposite cell than to any changed cell;
+    # the cells are searched around each changed component, full s50Distance when the windows cover most of the region
+    changed = (forest != prevForest)
+    if (not changed.any()):
+        return prevDistance.copy()
+    # without opposite cells the previous distances do not bound the changes
+    if ((not forest.any()) or forest.all() or (not prevForest.any()) or prevForest.all() or
+            numpy.isnan(prevDistance).any()):
+        return s50Distance(forest, sampling)
+
+    nRows, nCols = forest.shape
+    maxDistance = prevDistance.max()
+    reach = (int(numpy.ceil(maxDistance / sampling[0])), int(numpy.ceil(maxDistance / sampling[1])))
+    labels, n = ndimage.label(changed, structure=numpy.ones((3, 3)))
+    components = ndimage.find_objects(labels)
+    searchArea = sum((rs.stop - rs.start + 2 * reach[0]) * (cs.stop - cs.start + 2 * reach[1]) for rs, cs in components)
+    if (s50UpdateMaxFraction * nRows * nCols < searchArea):
+        return s50Distance(forest, sampling)
+
+    candidates = numpy.zeros(forest.shape, dtype=bool)
+    windows = list()
+    for rs, cs in components:
+        r0 = max(rs.start - reach[0], 0)
+        r1 = min(rs.stop + reach[0], nRows)
+        c0 = max(cs.start - reach[1], 0)
+        c1 = min(cs.stop + reach[1], nCols)
+        rows = numpy.arange(r0, r1)
+        cols = numpy.arange(c0, c1)
+        dr = numpy.maximum(numpy.maximum(rs.start - rows, rows - (rs.stop - 1)), 0) * sampling[0]
+        dc = numpy.maximum(numpy.maximum(cs.start - cols, cols - (cs.stop - 1)), 0) * sampling[1]
+        near = (numpy.hypot(dr[:, numpy.newaxis], dc[numpy.newaxis, :]) <= prevDistance[r0:r1, c0:c1])
+        candidates[r0:r1, c0:c1] |= near
+        cr, cc = numpy.nonzero(near)
+        margin = int(numpy.ceil(prevDistance[r0:r1, c0:c1][near].max() / min(sampling))) + 1
+        windows.append((r0 + cr.min(), r0 + cr.max() + 1, c0 + cc.min(), c0 + cc.max() + 1, margin))
+
+    windows = _mergeWindows(windows)
+    windowArea = sum((min(w[1] + w[4], nRows) - max(w[0] - w[4], 0)) * (min(w[3] + w[4], nCols) - max(w[2] - w[4], 0))
+                     for w in windows)
+    if (s50UpdateMaxFraction * nRows * nCols < windowArea):
+        return s50Distance(forest, sampling)
+
+    result = prevDistance.copy()
+    for w in windows:
+        _windowDistance(forest, candidates, w, sampling, result)
+    return result
 
 
 def updateS50DistanceSeries(targetMapset, yearFrom, yearTo):
@@ -1420,6 +1838,9 @@ def updateS50DistanceSeries(targetMapset, yearFrom, yearTo):
     if (not (userMapset == targetMapset)):
         grass.run_command("g.mapset", mapset=targetMapset)
 
+    reg = grass.region()
+    sampling = (float(reg["nsres"]), float(reg["ewres"]))
+    prevForest = None
     y = yearFrom
     while (y <= yearTo):
         updatedS50Dst = replaceYearParameter(updatedS50DstTemplate, y)
@@ -1428,8 +1849,15 @@ def updateS50DistanceSeries(targetMapset, yearFrom, yearTo):
         actSpot = replaceYearParameter(spotTemplate, y)
         updatedS50Mask = replaceYearParameter(updatedS50MaskTemplate, y)
 
-        if (validateRaster(actSpot) and validateRaster(updatedS50Mask)):
-            updateS50Distance(y, updatedS50Mask, updatedS50Dst)
+        if (getRasterModificationTime(actSpot) is not None and getRasterModificationTime(updatedS50Mask) is not None):
+            grass.message("Update distance to spruce forest edge {0}".format(y))
+            forest = ~numpy.isnan(readRasterArray(updatedS50Mask, True))
+            if (prevForest is None):
+                distance = s50Distance(forest, sampling)
+            else:
+                distance = s50DistanceUpdate(forest, prevForest, distance, sampling)
+            writeRasterArray(updatedS50Dst, distance)
+            prevForest = forest
 
         y = y + 1
 
@@ -1439,24 +1867,141 @@ def updateS50DistanceSeries(targetMapset, yearFrom, yearTo):
 def updateS50Distance(year, updatedS50Mask, updatedS50Dst):
     debugMessage("bboLib.updateS50Distance")
 
-    tmp1 = "tmp_s50dst_dst1"
-    tmp2 = "tmp_s50dst_dst2"
-    updatedS50MaskInv = "tmp_s50dst_s50mask_inv"
-
     if (validateRaster(updatedS50Mask)):
         grass.message("Update distance to spruce forest edge {0}".format(year))
-       
-        # distance to actual forest edge
-        grass.mapcalc("$updatedS50MaskInv = $updatedS50Mask", updatedS50MaskInv=updatedS50MaskInv, updatedS50Mask=updatedS50Mask, overwrite=True)
-        grass.run_command("r.null", map=updatedS50MaskInv, setnull=1, null=1, quiet=True)
-        grass.run_command("r.grow.distance",input=updatedS50MaskInv, distance=tmp1, quiet=True, overwrite=True)
-        grass.mapcalc("$tmp2 = $updatedS50Mask * $tmp1", tmp2=tmp2, updatedS50Mask=updatedS50Mask, tmp1=tmp1, overwrite=True)
-        grass.run_command("r.grow.distance",input=updatedS50Mask, distance=tmp1, quiet=True, overwrite=True)
-        grass.run_command("r.patch", input=tmp2 + ',' + tmp1, output=updatedS50Dst, quiet=True, overwrite=True)
+        reg = grass.region()
+        forest = ~numpy.isnan(readRasterArray(updatedS50Mask, True))
+        writeRasterArray(updatedS50Dst, s50Distance(forest, (float(reg["nsres"]), float(reg["ewres"]))))
+#endregion
 
-        deleteRaster(tmp1)
-        deleteRaster(tmp2)
-        deleteRaster(updatedS50MaskInv)
+
+
+#region #################### SPARSE SPOTS ####################
+# spot layer as sorted linear cell indices (row * cols + col) of the current region and their values
+class sparseSpot:
+    def __init__(self, shape, indices=None, values=None):
+        self.shape = tuple(shape)
+        if (indices is None):
+            indices = numpy.zeros(0, dtype=numpy.int64)
+        indices = numpy.asarray(indices, dtype=numpy.int64)
+        if (values is None):
+            values = numpy.ones(indices.size)
+        values = numpy.asarray(values)
+        order = numpy.argsort(indices, kind="stable")
+        self.indices = indices[order]
+        self.values = values[order]
+
+    @classmethod
+    def fromArray(cls, values):
+        indices = numpy.flatnonzero(~numpy.isnan(values))
+        return cls(values.shape, indices, values.ravel()[indices])
+
+    @classmethod
+    def fromRaster(cls, rasterName):
+        # r.stats lists only not null cells, 1-based column and row
+        reg = grass.region()
+        p = grass.read_command("r.stats", flags="1nx", input=rasterName, separator="pipe", quiet=True)
+        cells = [l.split("|") for l in p.splitlines() if (0 < len(l.strip()))]
+        if (len(cells) == 0):
+            return cls((reg["rows"], reg["cols"]))
+        cells = numpy.array(cells, dtype=numpy.double)
+        indices = (cells[:, 1].astype(numpy.int64) - 1) * reg["cols"] + cells[:, 0].astype(numpy.int64) - 1
+        return cls((reg["rows"], reg["cols"]), indices, cells[:, 2])
+
+    def toArray(self):
+        values = numpy.full(self.shape[0] * self.shape[1], numpy.nan)
+        values[self.indices] = self.values
+        return values.reshape(self.shape)
+
+    def toRaster(self, rasterName, isFloat=False):
+        if (self.indices.size == 0):
+            grass.mapcalc("$raster = null()", raster=rasterName, overwrite=True)
+            return
+        reg = grass.region()
+        rows, cols = self.rowsCols()
+        x = float(reg["w"]) + (cols + 0.5) * float(reg["ewres"])
+        y = float(reg["n"]) - (rows + 0.5) * float(reg["nsres"])
+        points = "".join(["{0}|{1}|{2}\n".format(x[i], y[i], self.values[i]) for i in range(self.indices.size)])
+        if (isFloat):
+            rasterType = "DCELL"
+        else:
+            rasterType = "CELL"
+        p = grass.feed_command("r.in.xyz", input="-", output=rasterName, method="max", type=rasterType, separator="pipe",
+                               overwrite=True, quiet=True)
+        p.stdin.write(points.encode())
+        p.stdin.close()
+        p.wait()
+
+    def rowsCols(self):
+        return numpy.divmod(self.indices, self.shape[1])
+
+    def select(self, condition):
+        # cells with condition(values) true
+        keep = condition(self.values)
+        return sparseSpot(self.shape, self.indices[keep], self.values[keep])
+
+    def union(self, other):
+        # values of self win
+        extra = ~numpy.isin(other.indices, self.indices)
+        return sparseSpot(self.shape, numpy.concatenate([self.indices, other.indices[extra]]),
+                          numpy.concatenate([self.values, other.values[extra]]))
+
+    def intersection(self, other):
+        keep = numpy.isin(self.indices, other.indices)
+        return sparseSpot(self.shape, self.indices[keep], self.values[keep])
+
+    def difference(self, other):
+        keep = ~numpy.isin(self.indices, other.indices)
+        return sparseSpot(self.shape, self.indices[keep], self.values[keep])
+
+    def cells(self):
+        return self.indices.size
+
+    def area(self):
+        reg = grass.region()
+        return self.indices.size * float(reg["ewres"]) * float(reg["nsres"])
+
+    def valueCells(self):
+        # cells per integer value
+        values, counts = numpy.unique(self.values.astype(numpy.int64), return_counts=True)
+        return dict(zip(values.tolist(), counts.tolist()))
+
+    def bbox(self):
+        # first row, last row, first column, last column, None for no cells
+        if (self.indices.size == 0):
+            return None
+        rows, cols = self.rowsCols()
+        return (int(rows.min()), int(rows.max()), int(cols.min()), int(cols.max()))
+
+    def dilate(self, radius=1, value=1):
+        # cells within radius (cells) added with value, cell values kept
+        rows, cols = self.rowsCols()
+        indices = [self.indices]
+        for dr in range(-radius, radius + 1):
+            for dc in range(-radius, radius + 1):
+                if ((dr == 0 and dc == 0) or radius * radius < dr * dr + dc * dc):
+                    continue
+                r = rows + dr
+                c = cols + dc
+                valid = (0 <= r) & (r < self.shape[0]) & (0 <= c) & (c < self.shape[1])
+                indices.append(r[valid] * self.shape[1] + c[valid])
+        grown = numpy.setdiff1d(numpy.unique(numpy.concatenate(indices)), self.indices)
+        return self.union(sparseSpot(self.shape, grown, numpy.full(grown.size, value, dtype=self.values.dtype)))
+
+    def labels(self, diagonal=False):
+        # connected groups of cells labelled inside the bounding box
+        box = self.bbox()
+        if (box is None):
+            return numpy.zeros(0, dtype=numpy.int64)
+        rows, cols = self.rowsCols()
+        window = numpy.zeros((box[1] - box[0] + 1, box[3] - box[2] + 1), dtype=bool)
+        window[rows - box[0], cols - box[2]] = True
+        if (diagonal):
+            structure = numpy.ones((3, 3))
+        else:
+            structure = None
+        labels, n = ndimage.label(window, structure=structure)
+        return labels[rows - box[0], cols - box[2]]
 #endregion
 
 
@@ -1536,16 +2081,64 @@ class garray(numpy.memmap):
         else:
             return 0
 
-def readMapSeries(mapPrefix, dayFrom, dayTo, iRow, iCol):
-    #grass.message("loading series {0} row={1} col={2}".format(mapPrefix, iRow, iCol))
-    valSeries = list()
+def readRasterArray(mapName, nullToNan=False):
+    reg = grass.region()
+    fileName = grass.tempfile()
+    if (nullToNan):
+        null = rasterNullValue
+    else:
+        null = None
+    grass.run_command("r.out.bin", flags="f", input=mapName, output=fileName, null=null, bytes=8, quiet=True, overwrite=True)
+    values = numpy.fromfile(fileName, dtype=numpy.double).reshape((reg["rows"], reg["cols"]))
+    grass.try_remove(fileName)
+    if (nullToNan):
+        values[values == rasterNullValue] = numpy.nan
+    return values
+
+def writeRasterArray(mapName, values, null=rasterNullValue, overwrite=True):
+    reg = grass.region()
+    fileName = grass.tempfile()
+    if (values.dtype.kind == 'f'):
+        values = numpy.where(numpy.isnan(values), null, values).astype(numpy.double)
+        flags = "d"
+        size = None
+    else:
+        values = numpy.asarray(values, dtype=numpy.int32)
+        flags = "s"
+        size = 4
+    values.tofile(fileName)
+    grass.run_command("r.in.bin", flags=flags, input=fileName, output=mapName, bytes=size, anull=null, overwrite=overwrite, quiet=True,
+                      north=reg["n"], south=reg["s"], east=reg["e"], west=reg["w"], rows=reg["rows"], cols=reg["cols"])
+    grass.try_remove(fileName)
+
+def cellCoordinates(cells):
+    # (row, col) region cells to cell centre coordinates
+    reg = grass.region()
+    ewres = float(reg["ewres"])
+    nsres = float(reg["nsres"])
+    return [(float(reg["w"]) + (c + 0.5) * ewres, float(reg["n"]) - (r + 0.5) * nsres) for r, c in cells]
+
+
+def readCellSeries(mapPrefix, dayFrom, dayTo, cells, null=0.0):
+    # days of the existing day rasters and their values (day, cell) for a list of (row, col) cells,
+    # r.what reads only the raster rows of the cells, all days in one batch
+    days = list()
+    rasters = list()
     for iDay in range(dayFrom, dayTo + 1):
         mapFN = rasterDay(mapPrefix, iDay)
-        if grass.find_file(mapFN)['file']:
-            mapR = garray(mapFN)
-            val = mapR[iRow, iCol]
-            valSeries.append((iDay, val))
-    return valSeries
+        if (getRasterModificationTime(mapFN) is not None):
+            days.append(iDay)
+            rasters.append(mapFN)
+    values = samplePoints(rasters, cellCoordinates(cells)).T
+    if (null is not None):
+        values[numpy.isnan(values)] = null
+    return days, values
+
+
+def readMapSeries(mapPrefix, dayFrom, dayTo, iRow, iCol):
+    #grass.message("loading series {0} row={1} col={2}".format(mapPrefix, iRow, iCol))
+    days, values = readCellSeries(mapPrefix, dayFrom, dayTo, [(iRow, iCol)])
+    return [(iDay, values[i, 0]) for i, iDay in enumerate(days)]
 
 def seriesToMap3d(mapPrefix, sourceMapset, outFN):
     maps = ""
@@ -1576,26 +2169,21 @@ class garray3d(numpy.memmap):
             grass.try_remove(self.filename)
 
     def readMapSeries(self, mapPrefix, dayFrom, dayTo):
-        reg = grass.region()
-        nRows = reg['rows']
-        nCols = reg['cols']
         for iDay in range(dayFrom, dayTo+1):
             mapFN = rasterDay(mapPrefix, iDay)
             grass.message("garray3D: reading map {0}".format(mapFN))
             i = iDay - dayFrom
             mapR = garray(mapFN)
-            for r in range(nRows):
-                for c in range(nCols):
-                    self[i, r, c] = mapR[r, c]
+            self[i] = mapR
 
     def getSeries(self, dayFrom, dayTo, iRow, iCol):
-        valSeries = list()
-        i = 0
-        for iDay in range(dayFrom, dayTo+1):
-            val = self[i, iRow, iCol]
-            valSeries.append((iDay, val))
-            i = i + 1
-        return valSeries
+        values = self[0:dayTo - dayFrom + 1, iRow, iCol]
+        return list(zip(range(dayFrom, dayTo + 1), values))
+
+    def getCellsSeries(self, dayFrom, dayTo, cells):
+        # values (day, cell) for a list of (row, col) cells
+        rows, cols = numpy.array(cells, dtype=int).reshape((-1, 2)).T
+        return self[0:dayTo - dayFrom + 1, rows, cols]
 #endregion
 
 
@@ -13,6 +13,7 @@
 
 import sys
 import os
+import numpy
 import grass.script as grass
 import string
 sys.path.append(os.path.join(os.environ["GISBASE"], "scripts"))
@@ -993,3 +994,310 @@ def stageCalc(fromDay, toDay,
     # set history for site map
     if not userMapset == targetMapset:
         grass.run_command("g.mapset", mapset=userMapset)
+
+
+def stageCalcArray(fromDay, toDay, 
+                   targetMapset, swarmingPrefix, infestationPrefix, developmentPrefix, 
+                   stagePrefix, showMessage=True, stageStoreFN=None):
+    userMapset = grass.gisenv()["MAPSET"]  
+    if not userMapset == targetMapset:
+        grass.run_command("g.mapset", mapset=targetMapset)
+
+    maxGen = 0
+    while (bboLib.validateRaster(bboLib.rasterMonth(developmentPrefix, maxGen + 1))):
+        maxGen += 1
+
+    if (0 < maxGen):
+        grass.message("read stage generations 1 - {0}".format(maxGen))
+        swarming, infestation, development, nullCells = readStageGenerations(swarmingPrefix, infestationPrefix, developmentPrefix, maxGen)
+        if (stageStoreFN):
+            writeStageStore(stageStoreFN, fromDay, toDay, swarming, infestation, development, nullCells)
+        else:
+            reg = grass.region()
+            for iDay in range(fromDay, toDay + 1):
+                if (((iDay % 10) == 0) and showMessage):
+                    grass.message("update stage day {0}".format(iDay))
+                stage = stageCube(swarming, infestation, development, [iDay])[0].astype(numpy.int32)
+                stage[nullCells] = bboLib.rasterNullValue
+                bboLib.writeRasterArray(bboLib.rasterDay(stagePrefix, iDay), stage.reshape((reg["rows"], reg["cols"])))
+
+    if not userMapset == targetMapset:
+        grass.run_command("g.mapset", mapset=userMapset)
+
+
+def readStageGenerations(swarmingPrefix, infestationPrefix, developmentPrefix, maxGen):
+    # (generation, cell) arrays of onset days, 0 = not reached
+    onsets = list()
+    for prefix in [swarmingPrefix, infestationPrefix, developmentPrefix]:
+        genList = list()
+        for i in range(1, maxGen + 1):
+            genList.append(bboLib.readRasterArray(bboLib.rasterMonth(prefix, i), True).ravel())
+        onsets.append(numpy.array(genList))
+
+    # cells outside of the first generation are null in the stage series
+    nullCells = numpy.isnan(onsets[0][0])
+    for a in onsets:
+        a[numpy.isnan(a)] = 0
+    return onsets[0], onsets[1], onsets[2], nullCells
+
+
+def stageCube(swarming, infestation, development, days):
+    # stage of the highest generation reached before the day, 3 development, 2 infestation, 1 swarming
+    d = numpy.asarray(days).reshape((-1, 1))
+    stage = numpy.zeros((d.shape[0], swarming.shape[1]), dtype=numpy.int8)
+    for i in range(swarming.shape[0] - 1, -1, -1):
+        genStage = numpy.where((0 < development[i]) & (development[i] < d), 3,
+                               numpy.where((0 < infestation[i]) & (infestation[i] < d), 2,
+                                           numpy.where((0 < swarming[i]) & (swarming[i] < d), 1, 0)))
+        stage = numpy.where(0 < stage, stage, genStage).astype(numpy.int8)
+    return stage
+
+
+def writeStageStore(stageStoreFN, fromDay, toDay, swarming, infestation, development, nullCells):
+    # run-length encoded stage series, one run list per cell
+    days = numpy.arange(fromDay, toDay + 1)
+    nCells = swarming.shape[1]
+    blockCells = max(1, 4194304 // len(days))
+    runCell = list()
+    runDay = list()
+    runStage = list()
+    for c0 in range(0, nCells, blockCells):
+        c1 = min(nCells, c0 + blockCells)
+        stage = stageCube(swarming[:, c0:c1], infestation[:, c0:c1], development[:, c0:c1], days)
+        change = numpy.ones(stage.shape, dtype=bool)
+        change[1:] = stage[1:] != stage[:-1]
+        cells, dayIdx = numpy.nonzero(change.T)
+        runCell.append(cells + c0)
+        runDay.append(days[dayIdx])
+        runStage.append(stage[dayIdx, cells])
+
+    runCell = numpy.concatenate(runCell)
+    offsets = numpy.zeros(nCells + 1, dtype=numpy.int64)
+    offsets[1:] = numpy.cumsum(numpy.bincount(runCell, minlength=nCells))
+
+    reg = grass.region()
+    numpy.savez_compressed(bboLib.getFullDataFileName(stageStoreFN),
+                           fromDay=fromDay, toDay=toDay, rows=reg["rows"], cols=reg["cols"],
+                           offsets=offsets, runDay=numpy.concatenate(runDay).astype(numpy.int16),
+                           runStage=numpy.concatenate(runStage), nullCells=nullCells)
+    grass.message("stage store {0}: {1} runs, {2} cells".format(stageStoreFN, len(runCell), nCells))
+
+
+def loadStageStore(stageStoreFN):
+    fileName = bboLib.getFullDataFileName(stageStoreFN)
+    if (not os.path.exists(fileName)):
+        grass.fatal("Stage store {0} does not exist".format(fileName))
+    store = numpy.load(fileName)
+    return dict((name, store[name]) for name in store.files)
+
+
+def readStageStore(stageStoreFN, iDay, store=None):
+    if (store is None):
+        store = loadStageStore(stageStoreFN)
+    if ((iDay < store["fromDay"]) or (store["toDay"] < iDay)):
+        grass.fatal("Day {0} is out of the stage store range {1} - {2}".format(iDay, store["fromDay"], store["toDay"]))
+
+    offsets = store["offsets"]
+    # number of runs started up to the day, every cell has its first run on fromDay
+    nRuns = numpy.add.reduceat((store["runDay"] <= iDay).astype(numpy.int32), offsets[:-1])
+    stage = store["runStage"][offsets[:-1] + nRuns - 1].astype(numpy.int32)
+    stage[store["nullCells"]] = bboLib.rasterNullValue
+    return stage.reshape((int(store["rows"]), int(store["cols"])))
+
+
+def stageStoreToRasters(stageStoreFN, fromDay, toDay, targetMapset, stagePrefix):
+    userMapset = grass.gisenv()["MAPSET"]  
+    if not userMapset == targetMapset:
+        grass.run_command("g.mapset", mapset=targetMapset)
+
+    store = loadStageStore(stageStoreFN)
+    for iDay in range(fromDay, toDay + 1):
+        grass.message("stage store day {0}".format(iDay))
+        bboLib.writeRasterArray(bboLib.rasterDay(stagePrefix, iDay), readStageStore(stageStoreFN, iDay, store))
+
+    if not userMapset == targetMapset:
+        grass.run_command("g.mapset", mapset=userMapset)
+
+
+def phenipsStateInit(shape, maxGenerations=bboLib.phenipsMaxGenerations):
+    # per cell PHENIPS state, generation is the index of the developing generation
+    state = dict()
+    state["day"] = numpy.array(bboLib.phenipsFromDay - 1)
+    state["generation"] = numpy.zeros(shape, dtype=numpy.int8)
+    state["phase"] = numpy.zeros(shape, dtype=numpy.int8)
+    state["atDD"] = numpy.zeros(shape)
+    state["btDD"] = numpy.zeros(shape)
+    for name in ["swarming", "infestation", "development"]:
+        state[name] = numpy.zeros((maxGenerations,) + tuple(shape), dtype=numpy.int16)
+    return state
+
+
+def phenipsStateStep(state, iDay, atMax, btMax):
+    if (int(state["day"]) + 1 != iDay):
+        grass.fatal("PHENIPS state is at day {0}, can not continue with day {1}".format(int(state["day"]), iDay))
+
+    maxGenerations = state["swarming"].shape[0]
+    generation = state["generation"]
+    active = generation < maxGenerations
+    # phase 0 adult beetles before infestation, phase 1 within tree development
+    waiting = active & (state["phase"] == 0)
+    developing = active & (state["phase"] == 1)
+
+    state["atDD"] = numpy.where(waiting, state["atDD"] + numpy.maximum(atMax - bboLib.phenipsDDThreshold, 0), state["atDD"])
+    state["btDD"] = numpy.where(developing, state["btDD"] + btMax - bboLib.phenipsDDThreshold, state["btDD"])
+
+    flight = waiting & (bboLib.phenipsFlightThreshold <= atMax)
+    newSwarming = flight & (bboLib.phenipsSwarmingDDThreshold <= state["atDD"])
+    newInfestation = flight & (bboLib.phenipsInfestationDDThreshold <= state["atDD"])
+    newDevelopment = developing & (bboLib.phenipsDevelopmentSumThreshold <= state["btDD"])
+
+    for i in range(maxGenerations):
+        genCells = generation == i
+        swarming = state["swarming"][i]
+        swarming[newSwarming & genCells & (swarming == 0)] = iDay
+        state["infestation"][i][newInfestation & genCells] = iDay
+        state["development"][i][newDevelopment & genCells] = iDay
+
+    state["phase"][newInfestation] = 1
+    state["btDD"][newInfestation] = 0
+    state["phase"][newDevelopment] = 0
+    state["atDD"][newDevelopment] = 0
+    state["btDD"][newDevelopment] = 0
+    state["generation"][newDevelopment] += 1
+    state["day"] = numpy.array(iDay)
+
+
+def phenipsStateRun(state, dayFrom, dayTo, atMaxPrefix, btMaxPrefix, showMessage=True, temperatureSource=None):
+    # temperatureSource (bboTemperatureLib.virtualTemperature) replaces the daily temperature rasters
+    for iDay in range(dayFrom, dayTo + 1):
+        if (((iDay % 10) == 0) and showMessage):
+            grass.message("PHENIPS state day {0}".format(iDay))
+        if (temperatureSource):
+            atMax = temperatureSource.airMax(iDay)
+            btMax = temperatureSource.barkMax(iDay)
+            if (atMax is None or btMax is None):
+                grass.fatal("Meteo station series do not cover day {0}".format(iDay))
+            atMax = atMax.ravel()
+            btMax = btMax.ravel()
+        else:
+            atMax = bboLib.readRasterArray(bboLib.rasterDayMapset(atMaxPrefix, iDay, bboLib.atMapset), True).ravel()
+            btMax = bboLib.readRasterArray(bboLib.rasterDayMapset(btMaxPrefix, iDay, bboLib.btMapset), True).ravel()
+        phenipsStateStep(state, iDay, atMax, btMax)
+
+
+def phenipsStateSave(state, checkpointFN, inputNames="", inputTimes=(), source="", region=""):
+    store = dict(state)
+    store["inputNames"] = inputNames
+    store["inputTimes"] = numpy.array(inputTimes, dtype=numpy.int64)
+    store["source"] = source
+    store["region"] = region
+    numpy.savez_compressed(bboLib.getFullDataFileName(checkpointFN), **store)
+
+
+def phenipsStateLoad(checkpointFN):
+    fileName = bboLib.getFullDataFileName(checkpointFN)
+    if (not os.path.exists(fileName)):
+        return None
+    store = numpy.load(fileName)
+    state = dict()
+    for name in store.files:
+        state[name] = store[name]
+    for name in ["inputNames", "source", "region"]:
+        state[name] = str(state.get(name, ""))
+    return state
+
+
+def phenipsCheckpoint(dayTo, checkpointFN, recalculate=False, temperatureSource=None):
+    # observed PHENIPS state at the end of dayTo, shared by all forecast scenarios
+    reg = grass.region()
+    nCells = reg["rows"] * reg["cols"]
+    region = "|".join(str(reg[k]) for k in ["n", "s", "e", "w", "rows", "cols"])
+    if (temperatureSource):
+        source = "virtual"
+        rasterNames, seriesNames = temperatureSource.inputs(bboLib.phenipsFromDay, dayTo)
+    else:
+        source = "rasters"
+        rasterNames = list()
+        for iDay in range(bboLib.phenipsFromDay, dayTo + 1):
+            rasterNames.append(bboLib.rasterDayMapset(bboLib.atMaxPrefix, iDay, bboLib.atMapset))
+            rasterNames.append(bboLib.rasterDayMapset(bboLib.btMaxPrefix, iDay, bboLib.btMapset))
+        seriesNames = list()
+    inputNames, inputTimes = bboLib.checkpointInputs(rasterNames, seriesNames)
+
+    state = None
+    if (not recalculate):
+        state = phenipsStateLoad(checkpointFN)
+    if ((state is not None) and (int(state["day"]) == dayTo) and (state["phase"].shape == (nCells,)) and
+            (state["source"] == source) and (state["region"] == region) and
+            (state["inputNames"] == inputNames) and numpy.array_equal(state.get("inputTimes"), inputTimes)):
+        grass.message("PHENIPS checkpoint {0} day {1}".format(checkpointFN, dayTo))
+        for name in ["inputNames", "inputTimes", "source", "region"]:
+            del state[name]
+        return state
+
+    grass.message("PHENIPS observed days {0} - {1}".format(bboLib.phenipsFromDay, dayTo))
+    state = phenipsStateInit((nCells,))
+    phenipsStateRun(state, bboLib.phenipsFromDay, dayTo, bboLib.atMaxPrefix, bboLib.btMaxPrefix, temperatureSource=temperatureSource)
+    phenipsStateSave(state, checkpointFN, inputNames, inputTimes, source, region)
+    return state
+
+
+def phenipsEnsemble(state, dayFrom, dayTo, atMaxPrefix, btMaxPrefix, atShift):
+    # atShift (scenario, day) air temperature offsets from the forecast rasters
+    nScenarios = atShift.shape[0]
+    btShiftCoef = bboLib.btMaxCoefficients[2] + bboLib.btMaxCoefficients[3]
+    ensemble = dict()
+    for name in state:
+        if (name == "day"):
+            ensemble[name] = state[name].copy()
+        else:
+            ensemble[name] = numpy.repeat(state[name][numpy.newaxis, ...], nScenarios, axis=0)
+    # generation axis first
+    for name in ["swarming", "infestation", "development"]:
+        ensemble[name] = numpy.swapaxes(ensemble[name], 0, 1).copy()
+
+    nullCells = None
+    for iDay in range(dayFrom, dayTo + 1):
+        if ((iDay % 10) == 0):
+            grass.message("PHENIPS ensemble day {0}".format(iDay))
+        atMax = bboLib.readRasterArray(bboLib.rasterDayMapset(atMaxPrefix, iDay, bboLib.atMapset), True).ravel()
+        btMax = bboLib.readRasterArray(bboLib.rasterDayMapset(btMaxPrefix, iDay, bboLib.btMapset), True).ravel()
+        if (nullCells is None):
+            nullCells = numpy.isnan(atMax)
+        shift = atShift[:, iDay - dayFrom].reshape((-1, 1))
+        phenipsStateStep(ensemble, iDay, atMax + shift, btMax + btShiftCoef*shift)
+    return ensemble, nullCells
+
+
+def writeEnsembleRasters(ensemble, nullCells, quantiles, targetMapset):
+    userMapset = grass.gisenv()["MAPSET"]  
+    if not userMapset == targetMapset:
+        grass.run_command("g.mapset", mapset=targetMapset)
+
+    reg = grass.region()
+    shape = (reg["rows"], reg["cols"])
+    onsetNames = [("swarming", bboLib.phenipsEnsembleSwarmingName),
+                  ("infestation", bboLib.phenipsEnsembleInfestationName),
+                  ("development", bboLib.phenipsEnsembleDevelopmentName)]
+    maxGenerations = ensemble["development"].shape[0]
+    for i in range(maxGenerations):
+        development = ensemble["development"][i]
+        if (not numpy.any(0 < development)):
+            break
+        grass.message("ensemble generation {0}".format(i + 1))
+        probability = numpy.mean(0 < development, axis=0)
+        probability[nullCells] = numpy.nan
+        bboLib.writeRasterArray(bboLib.rasterMonth(bboLib.phenipsEnsembleDevelopmentProbability, i + 1), probability.reshape(shape))
+
+        for name, prefix in onsetNames:
+            # scenarios without onset are sorted after all onset days
+            onset = numpy.sort(numpy.where(0 < ensemble[name][i], ensemble[name][i], 9999), axis=0)
+            for q in quantiles:
+                k = int(numpy.floor(q*(onset.shape[0] - 1) + 0.5))
+                values = onset[k].astype(numpy.int32)
+                values[(values == 9999) | nullCells] = bboLib.rasterNullValue
+                qName = "{0}_q{1}_".format(prefix, bboLib.formatNum(str(int(round(q*100))), 2))
+                bboLib.writeRasterArray(bboLib.rasterMonth(qName, i + 1), values.reshape(shape))
+
+    if not userMapset == targetMapset:
+        grass.run_command("g.mapset", mapset=userMapset)
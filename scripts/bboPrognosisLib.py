@@ -23,6 +23,7 @@ import json
 import grass.script as grass
 import math
 import collections
+import numpy
 sys.path.append(os.path.join(os.environ["GISBASE"], "scripts"))
 import bboLib
 
@@ -250,6 +251,9 @@ TRAINING_ISMLAYERS_LOG_TEMPLATE = "_islay_train.txt"
 TRAINING_ISMLAYERS_AUC_TEMPLATE = "_islay_train_auc.csv"
 TRAINING_ISMLAYERS_CROSSTAB_TEMPLATE = "_islay_train_ctab.csv"
 
+# spot code cells per year, location _data directory
+SPOT_TABLE_CACHE = "spot_table.json"
+
 
 
 def _readProject(projectFN):
@@ -2239,8 +2243,70 @@ def _calcISModelOnLayers(project, newLayersList, logFile=None, aucFile=None, cta
 
 # #################### SPOT AREAS ####################
 #region SPOT_AREAS
+def _readSpotTableCache():
+    cacheFile = bboLib.getFullDataFileName(SPOT_TABLE_CACHE)
+    if (os.path.exists(cacheFile)):
+        try:
+            jsonFile = open(cacheFile, "r")
+            cache = json.load(jsonFile)
+            jsonFile.close()
+            return cache
+        except ValueError:
+            pass
+    return dict()
+
+
+def _writeSpotTableCache(cache):
+    jsonFile = open(bboLib.getFullDataFileName(SPOT_TABLE_CACHE), "w")
+    json.dump(cache, jsonFile)
+    jsonFile.close()
+
+
+def _cachedRasterCells(cache, rasterName, regionKey, cellsFunction):
+    # None for a missing raster, the cache entry is valid while the raster and region are unchanged
+    mtime = bboLib.getRasterModificationTime(rasterName)
+    if (mtime is None):
+        return None, False
+    key = bboLib.getRasterFileName(rasterName)
+    entry = cache.get(key)
+    if (entry and entry["mtime"] == mtime and entry["region"] == regionKey):
+        return entry["cells"], False
+    cells = cellsFunction(rasterName)
+    cache[key] = {"mtime": mtime, "region": regionKey, "cells": cells}
+    return cells, True
+
+
+def _spotCodeCells(spotFN):
+    codes = bboLib.sparseSpot.fromRaster(spotFN).values.astype(int)
+    codes = codes[(OLD_SPOTCODE <= codes) & (codes <= INIT_SPOTCODE)]
+    return numpy.bincount(codes, minlength=INIT_SPOTCODE + 1).tolist()
+
+
+def _maskCells(maskFN):
+    return bboLib.rasterStatistics(maskFN, True).firstcells
+
+
+def _spotCodeTable(aspotTemplate, us50MaskTemplate, yearFrom, yearTo):
+    # year: (cells per spot code, S50 mask cells), each raster read once and cached
+    reg = grass.region()
+    regionKey = [reg[k] for k in ["n", "s", "e", "w", "rows", "cols"]]
+    cache = _readSpotTableCache()
+    changed = False
+    table = dict()
+    for year in range(yearFrom, yearTo + 1):
+        codeCells, c = _cachedRasterCells(cache, bboLib.replaceYearParameter(aspotTemplate, year), regionKey, _spotCodeCells)
+        changed = changed or c
+        maskCells = None
+        if (codeCells is not None and us50MaskTemplate):
+            maskCells, c = _cachedRasterCells(cache, bboLib.replaceYearParameter(us50MaskTemplate, year), regionKey, _maskCells)
+            changed = changed or c
+        table[year] = (codeCells, maskCells)
+    if (changed):
+        _writeSpotTableCache(cache)
+    return table
+
+
 def _getSpotCells(targetMapset, aspotTemplate, yearFrom, yearTo):
-    actualSpotFN = "tmp_bboplib_gsc_actualspot"
     areaList = []
 
     bboLib.debugMessage("bboPrognosisLib.getSpotCells")
@@ -2249,27 +2315,17 @@ def _getSpotCells(targetMapset, aspotTemplate, yearFrom, yearTo):
     if (not (userMapset == targetMapset)):
         grass.run_command("g.mapset", mapset=targetMapset)
 
-    y0 = yearFrom
-    while (y0 <= yearTo):
-        spotFN = bboLib.replaceYearParameter(aspotTemplate, y0)
-        if (bboLib.validateRaster(spotFN)):
-            grass.mapcalc("$actualSpot = if($spotCode == $spot, 1, null())", actualSpot=actualSpotFN, spot=spotFN, spotCode=OLD_SPOTCODE, overwrite=True)
-            grass.run_command("r.null", map=actualSpotFN, setnull=0, quiet=True)
-            aOld = bboLib.getNotNullCellsNumber(actualSpotFN)
-            grass.mapcalc("$actualSpot = if($spotCode == $spot, 1, null())", actualSpot=actualSpotFN, spot=spotFN, spotCode=SPREAD_SPOTCODE, overwrite=True)
-            grass.run_command("r.null", map=actualSpotFN, setnull=0, quiet=True)
-            aEnlarge = bboLib.getNotNullCellsNumber(actualSpotFN)
-            grass.mapcalc("$actualSpot = if($spotCode == $spot, 1, null())", actualSpot=actualSpotFN, spot=spotFN, spotCode=INIT_SPOTCODE, overwrite=True)
-            grass.run_command("r.null", map=actualSpotFN, setnull=0, quiet=True)
-            aFly = bboLib.getNotNullCellsNumber(actualSpotFN)
-            aNew = aEnlarge + aFly
-            aAll = aOld + aEnlarge + aFly
-            areaList.append((y0, aOld, aEnlarge, aFly, aAll, aNew))
+    table = _spotCodeTable(aspotTemplate, None, yearFrom, yearTo)
+    for y0 in range(yearFrom, yearTo + 1):
+        codeCells = table[y0][0]
+        if (codeCells is not None):
+            aOld = codeCells[OLD_SPOTCODE]
+            aEnlarge = codeCells[SPREAD_SPOTCODE]
+            aFly = codeCells[INIT_SPOTCODE]
+            areaList.append((y0, aOld, aEnlarge, aFly, aOld + aEnlarge + aFly, aEnlarge + aFly))
         else:
             areaList.append((y0, None, None, None, None, None))
-        y0 = y0 + 1
 
-    bboLib.deleteRaster(actualSpotFN)
     if (not (userMapset == targetMapset)):
         grass.run_command("g.mapset", mapset=userMapset)
 
@@ -2277,7 +2333,6 @@ def _getSpotCells(targetMapset, aspotTemplate, yearFrom, yearTo):
 
 
 def _getSpotAreas(targetMapset, aspotTemplate, us50MaskTemplate, yearFrom, yearTo):
-    actualSpotFN = "tmp_bboplib_gsa_actualspot"
     areaList = []
 
     bboLib.debugMessage("bboPrognosisLib._getSpotAreas")
@@ -2286,33 +2341,25 @@ def _getSpotAreas(targetMapset, aspotTemplate, us50MaskTemplate, yearFrom, yearT
     if (not (userMapset == targetMapset)):
         grass.run_command("g.mapset", mapset=targetMapset)
 
-    y0 = yearFrom
-    while (y0 <= yearTo):
-        spotFN = bboLib.replaceYearParameter(aspotTemplate, y0)
-        us50MaskFN = bboLib.replaceYearParameter(us50MaskTemplate, y0)
-        bboLib.debugMessage(spotFN)
-        if (bboLib.validateRaster(spotFN)):
-            grass.mapcalc("$actualSpot = if($spotCode == $spot, 1, null())", actualSpot=actualSpotFN, spot=spotFN, spotCode=OLD_SPOTCODE, overwrite=True)
-            grass.run_command("r.null", map=actualSpotFN, setnull=0, quiet=True)
-            aOld = bboLib.getRasterArea(actualSpotFN)
-            grass.mapcalc("$actualSpot = if($spotCode == $spot, 1, null())", actualSpot=actualSpotFN, spot=spotFN, spotCode=SPREAD_SPOTCODE, overwrite=True)
-            grass.run_command("r.null", map=actualSpotFN, setnull=0, quiet=True)
-            aEnlarge = bboLib.getRasterArea(actualSpotFN)
-            grass.mapcalc("$actualSpot = if($spotCode == $spot, 1, null())", actualSpot=actualSpotFN, spot=spotFN, spotCode=INIT_SPOTCODE, overwrite=True)
-            grass.run_command("r.null", map=actualSpotFN, setnull=0, quiet=True)
-            aFly = bboLib.getRasterArea(actualSpotFN)
+    reg = grass.region()
+    cellArea = float(reg["ewres"]) * float(reg["nsres"])
+    table = _spotCodeTable(aspotTemplate, us50MaskTemplate, yearFrom, yearTo)
+    for y0 in range(yearFrom, yearTo + 1):
+        codeCells, maskCells = table[y0]
+        if (codeCells is not None):
+            aOld = codeCells[OLD_SPOTCODE] * cellArea
+            aEnlarge = codeCells[SPREAD_SPOTCODE] * cellArea
+            aFly = codeCells[INIT_SPOTCODE] * cellArea
             aNew = aEnlarge + aFly
             aAll = aOld + aEnlarge + aFly
-            if (bboLib.validateRaster(us50MaskFN)):
-                aS50 = bboLib.getRasterArea(us50MaskFN)
+            if (maskCells is not None):
+                aS50 = maskCells * cellArea
             else:
                 aS50 = -10000
             areaList.append((y0, aOld, aEnlarge, aFly, aAll, aNew, aS50))
         else:
             areaList.append((y0, None, None, None, None, None, None))
-        y0 = y0 + 1
 
-    bboLib.deleteRaster(actualSpotFN)
     if (not (userMapset == targetMapset)):
         grass.run_command("g.mapset", mapset=userMapset)
 
@@ -2340,6 +2387,87 @@ def _getSpotAreasHa(targetMapset, aspotTemplate, us50MaskTemplate, yearFrom, yea
 
 # #################### MASK ####################
 #region MASK
+def _readYearRaster(template, year, mapsetName=None):
+    # None for a missing raster, null as nan
+    rasterName = bboLib.replaceYearParameter(template, year, mapsetName)
+    if (bboLib.getRasterModificationTime(rasterName) is None):
+        return None
+    return bboLib.readRasterArray(rasterName, True)
+
+
+def _yearStackAggregate(years, readLayer):
+    # one pass over the yearly layers: first not null value in the years order, union,
+    # first and last occurrence year and occurrence count
+    nLayers = 0
+    value = None
+    for year in years:
+        layer = readLayer(year)
+        if (layer is None):
+            continue
+        if (value is None):
+            value = numpy.full(layer.shape, numpy.nan)
+            firstYear = numpy.full(layer.shape, numpy.nan)
+            lastYear = numpy.full(layer.shape, numpy.nan)
+            count = numpy.zeros(layer.shape, dtype=numpy.int32)
+        nLayers = nLayers + 1
+        present = ~numpy.isnan(layer)
+        fill = present & numpy.isnan(value)
+        value[fill] = layer[fill]
+        firstYear[present] = numpy.fmin(firstYear[present], year)
+        lastYear[present] = numpy.fmax(lastYear[present], year)
+        count += present
+
+    if (value is None):
+        return None
+    yearStack = collections.namedtuple("yearStack", "layers value union firstYear lastYear count")
+    union = numpy.where(0 < count, 1.0, numpy.nan)
+    return yearStack(nLayers, value, union, firstYear, lastYear, count)
+
+
+def _writeStackRaster(outputFN, values, isFloat=False):
+    if (isFloat):
+        bboLib.writeRasterArray(outputFN, values)
+    else:
+        values = numpy.where(numpy.isnan(values), bboLib.rasterNullValue, values).astype(numpy.int32)
+        bboLib.writeRasterArray(outputFN, values)
+
+
+def _spotCodeLayer(year, spotCode):
+    spot = _readYearRaster(bboLib.spotTemplate, year, bboLib.forestMapset)
+    if (spot is None):
+        return None
+    if ((spotCode == INIT_SPOTCODE) or (spotCode == SPREAD_SPOTCODE)):
+        mask = (spot == spotCode)
+    elif (spotCode == NEW_SPOTCODE):
+        mask = (1 < spot)
+    else: # ALLSPOTCODE
+        mask = (0 < spot)
+    return numpy.where(mask, 1.0, numpy.nan)
+
+
+def _samplesCodeLayer(year, spotCode, samplesTemplate):
+    samples = _readYearRaster(samplesTemplate, year, bboLib.forestMapset)
+    if (samples is None):
+        return None
+    if ((spotCode == INIT_SPOTCODE) or (spotCode == SPREAD_SPOTCODE)):
+        return numpy.where(samples == spotCode, 1.0, numpy.where(samples == -spotCode, 0.0, numpy.nan))
+    # NEWSPOTCODE
+    return numpy.where(0 < samples, 1.0, numpy.where(samples < 0, 0.0, numpy.nan))
+
+
+def _windowLayerReader(readLayer, trainingYears):
+    # yearly layers shared by the overlapping training windows of a series
+    layers = {}
+    def read(year):
+        if (year not in layers):
+            layers[year] = readLayer(year)
+        for y in list(layers.keys()):
+            if (year + trainingYears < y):
+                del layers[y]
+        return layers[year]
+    return read
+
+
 def _getSpotMaskSeries(yearFrom, yearTo, spotCode, outputTemplate, targetMapset=None, trainingYears=1):
     bboLib.debugMessage("bboPrognosisLib._calcSpotMaskSeries")
 
@@ -2348,45 +2476,31 @@ def _getSpotMaskSeries(yearFrom, yearTo, spotCode, outputTemplate, targetMapset=
         if (not (userMapset == targetMapset)):
             grass.run_command("g.mapset", mapset=targetMapset)
 
-    year = yearFrom
-    while (year <= yearTo):
-        _getSpotMask(year, spotCode, outputTemplate, trainingYears)
-        year = year + 1
+    readLayer = _windowLayerReader(lambda y: _spotCodeLayer(y, spotCode), trainingYears)
+    year = yearTo
+    while (yearFrom <= year):
+        _getSpotMask(year, spotCode, outputTemplate, trainingYears, readLayer)
+        year = year - 1
 
     if (targetMapset):
         if (not (userMapset == targetMapset)):
             grass.run_command("g.mapset", mapset=userMapset)
 
 
-def _getSpotMask(year, spotCode, outputTemplate, trainingYears=1):
+def _getSpotMask(year, spotCode, outputTemplate, trainingYears=1, readLayer=None):
     bboLib.debugMessage("bboPrognosisLib._getSpotMask")
 
-    tmp1 = "tmp_bboplib_cspm_2071"
-    tmp2 = "tmp_bboplib_cspm_2072"
+    if (readLayer is None):
+        readLayer = lambda y: _spotCodeLayer(y, spotCode)
 
     outputFN = bboLib.replaceYearParameter(outputTemplate, year)
-    grass.mapcalc("$outMask = null()", outMask=outputFN, overwrite=True)
+    stack = _yearStackAggregate(range(year, year - trainingYears, -1), readLayer)
+    if (stack is None):
+        grass.mapcalc("$outMask = null()", outMask=outputFN, overwrite=True)
+        return False
 
-    nLayers = 0
-    while (0 < trainingYears):
-        spotFN = bboLib.replaceYearParameter(bboLib.spotTemplate, year, bboLib.forestMapset)
-        if (bboLib.validateRaster(spotFN, None, True)):
-            nLayers = nLayers + 1
-            if ((spotCode == INIT_SPOTCODE) or (spotCode == SPREAD_SPOTCODE)):
-                grass.mapcalc("$tmp1 = if($code == $spot, 1, null())", tmp1=tmp1, spot=spotFN, code=spotCode, overwrite=True)
-            elif (spotCode == NEW_SPOTCODE):
-                grass.mapcalc("$tmp1 = if(1 < $spot, 1, null())", tmp1=tmp1, spot=spotFN, overwrite=True)
-            else: # ALLSPOTCODE
-                grass.mapcalc("$tmp1 = if(0 < $spot, 1, null())", tmp1=tmp1, spot=spotFN, overwrite=True)
-            grass.mapcalc("$tmp2 = if(isnull($outMask), if(isnull($tmp1), null(), $tmp1), $outMask)", tmp2=tmp2, outMask=outputFN, tmp1=tmp1, overwrite=True)
-            grass.mapcalc("$outMask = $tmp2", outMask=outputFN, tmp2=tmp2, overwrite=True)
-        year = year - 1
-        trainingYears = trainingYears - 1
-
-    bboLib.deleteRaster(tmp2)
-    bboLib.deleteRaster(tmp1)
-
-    return (0 < nLayers)
+    _writeStackRaster(outputFN, stack.union)
+    return True
 
 
 
@@ -2398,104 +2512,87 @@ def _getTrainingSamplesMaskSeries(yearFrom, yearTo, spotCode, outputTemplate, ta
         if (not (userMapset == targetMapset)):
             grass.run_command("g.mapset", mapset=targetMapset)
 
-    year = yearFrom
-    while (year <= yearTo):
-        _getTrainingSamplesMask(year, spotCode, outputTemplate, trainingYears, useAllSamples)
-        year = year + 1
+    if (useAllSamples):
+        samplesTemplate = SAMPLES_TEMPLATE
+    else:
+        samplesTemplate = RASTER_TRAINING_SAMPLES_TEMPLATE
+    readLayer = _windowLayerReader(lambda y: _samplesCodeLayer(y, spotCode, samplesTemplate), trainingYears)
+    year = yearTo
+    while (yearFrom <= year):
+        _getTrainingSamplesMask(year, spotCode, outputTemplate, trainingYears, useAllSamples, readLayer)
+        year = year - 1
 
     if (targetMapset):
         if (not (userMapset == targetMapset)):
             grass.run_command("g.mapset", mapset=userMapset)
 
 
-def _getTrainingSamplesMask(year, spotCode, outputTemplate, trainingYears=1, useAllSamples=False):
+def _getTrainingSamplesMask(year, spotCode, outputTemplate, trainingYears=1, useAllSamples=False, readLayer=None):
     bboLib.debugMessage("bboPrognosisLib._getTrainingSamplesMask")
 
-    tmp1 = "tmp_bboplib_csm_6841"
-    tmp2 = "tmp_bboplib_csm_6842"
-
-    outputFN = bboLib.replaceYearParameter(outputTemplate, year)
-    grass.mapcalc("$outMask = null()", outMask=outputFN, overwrite=True)
-
     if (useAllSamples):
         samplesTemplate = SAMPLES_TEMPLATE
     else:
         samplesTemplate = RASTER_TRAINING_SAMPLES_TEMPLATE
+    if (readLayer is None):
+        readLayer = lambda y: _samplesCodeLayer(y, spotCode, samplesTemplate)
 
-    nLayers = 0
-    while (0 < trainingYears):
-        samplesFN = bboLib.replaceYearParameter(samplesTemplate, year, bboLib.forestMapset)
-        if (bboLib.validateRaster(samplesFN, None, True)):
-            nLayers = nLayers + 1
-            if ((spotCode == INIT_SPOTCODE) or (spotCode == SPREAD_SPOTCODE)):
-                grass.mapcalc("$tmp1 = if($code == $samples, 1, if(-$code == $samples, 0, null()))", tmp1=tmp1, samples=samplesFN, code=spotCode, overwrite=True)
-            else: # NEWSPOTCODE
-                grass.mapcalc("$tmp1 = if(0 < $samples, 1, if($samples < 0, 0, null()))", tmp1=tmp1, samples=samplesFN, overwrite=True)
-            grass.mapcalc("$tmp2 = if(isnull($outMask), $tmp1, $outMask)", tmp2=tmp2, outMask=outputFN, tmp1=tmp1, overwrite=True)
-            grass.mapcalc("$outMask = $tmp2", outMask=outputFN, tmp2=tmp2, overwrite=True)
-        year = year - 1
-        trainingYears = trainingYears - 1
-
-    bboLib.deleteRaster(tmp2)
-    bboLib.deleteRaster(tmp1)
+    # the latest year sample wins
+    outputFN = bboLib.replaceYearParameter(outputTemplate, year)
+    stack = _yearStackAggregate(range(year, year - trainingYears, -1), readLayer)
+    if (stack is None):
+        grass.mapcalc("$outMask = null()", outMask=outputFN, overwrite=True)
+        return False
 
-    return (0 < nLayers)
+    _writeStackRaster(outputFN, stack.value)
+    return True
 
 
 
 def _aggregateRasters(valTemplate, maskTemplate, outputFN, year, targetMapset=None, trainingYears=1):
     bboLib.debugMessage("bboPrognosisLib._aggregateRasters")
 
-    tmpVal1 = "tmp_bboplib_aggraster1"
-
     if (targetMapset):
         userMapset = grass.gisenv()["MAPSET"]  
         if (not (userMapset == targetMapset)):
             grass.run_command("g.mapset", mapset=targetMapset)
-    
-    grass.mapcalc("$outVal = null()", outVal=outputFN, overwrite=True)
-    
-    nLayers = 0
-    while (0 < trainingYears):
-        valFN = bboLib.replaceYearParameter(valTemplate, year)
-        maskFN = bboLib.replaceYearParameter(maskTemplate, year)
-        if (bboLib.validateRaster(valFN) and bboLib.validateRaster(maskFN)):
-            nLayers = nLayers + 1
-            grass.mapcalc("$tmp1 = if(isnull($outVal), if(isnull($mask), null(), $value), $outVal)", tmp1=tmpVal1, outVal=outputFN, mask=maskFN, value=valFN, overwrite=True)
-            grass.mapcalc("$outVal = $tmp1", outVal=outputFN, tmp1=tmpVal1, overwrite=True)
-        year = year - 1
-        trainingYears = trainingYears - 1
 
-    bboLib.deleteRaster(tmpVal1)
+    def readLayer(y):
+        val = _readYearRaster(valTemplate, y)
+        mask = _readYearRaster(maskTemplate, y)
+        if (val is None or mask is None):
+            return None
+        return numpy.where(numpy.isnan(mask), numpy.nan, val)
+
+    # the latest year value wins
+    stack = _yearStackAggregate(range(year, year - trainingYears, -1), readLayer)
+    if (stack is None):
+        grass.mapcalc("$outVal = null()", outVal=outputFN, overwrite=True)
+    else:
+        isFloat = any([bboLib.isFloatRaster(bboLib.replaceYearParameter(valTemplate, y)) for y in range(year, year - trainingYears, -1)])
+        _writeStackRaster(outputFN, stack.value, isFloat)
 
     if (targetMapset):
         if (not (userMapset == targetMapset)):
             grass.run_command("g.mapset", mapset=userMapset)
 
-    return (0 < nLayers)
+    return (stack is not None)
 
 
 def _aggregateBBSpots(yearFrom, yearTo, outputFN, targetMapset=None):
     bboLib.debugMessage("bboPrognosisLib._aggregateBBSpots")
 
-    tmpVal1 = "tmp_bboplib_aggbbspot1"
-
     if (targetMapset):
         userMapset = grass.gisenv()["MAPSET"]  
         if (not (userMapset == targetMapset)):
             grass.run_command("g.mapset", mapset=targetMapset)
-    
-    grass.mapcalc("$outVal = null()", outVal=outputFN, overwrite=True)
-    
-    year = yearFrom
-    while (year <= yearTo):
-        bboFN = bboLib.replaceYearParameter(bboLib.spotTemplate, year, bboLib.forestMapset)
-        if (bboLib.validateRaster(bboFN)):
-            grass.run_command("r.patch", input=outputFN+ ',' + bboFN, output=tmpVal1, quiet=True, overwrite=True)            
-            grass.mapcalc("$outVal = $tmp", outVal=outputFN, tmp=tmpVal1, overwrite=True)
-        year = year + 1
 
-    bboLib.deleteRaster(tmpVal1)
+    # the earliest year spot wins as with r.patch
+    stack = _yearStackAggregate(range(yearFrom, yearTo + 1), lambda y: _readYearRaster(bboLib.spotTemplate, y, bboLib.forestMapset))
+    if (stack is None):
+        grass.mapcalc("$outVal = null()", outVal=outputFN, overwrite=True)
+    else:
+        _writeStackRaster(outputFN, stack.value)
 
     if (targetMapset):
         if (not (userMapset == targetMapset)):
@@ -2508,11 +2605,7 @@ def _aggregateBBSpots(yearFrom, yearTo, outputFN, targetMapset=None):
 
 # #################### MORTALITY INDEX ####################
 #region MORTALITY_INDEX
-def _calcMortalityIndex(spotMapset, spotTemplate, yearFrom, yearTo, spotCode):
-    bboLib.debugMessage("bboPrognosisLib._calcMortalityIndex")
-
-    areaList = _getSpotAreas(spotMapset, spotTemplate, bboLib.updatedS50MaskTemplate, yearFrom - 1, yearTo)
-
+def _mortalityIndexSeries(areaList, yearFrom, yearTo, spotCode):
     i = 0
     a0 = 0.0
     miList = []
@@ -2532,6 +2625,24 @@ def _calcMortalityIndex(spotMapset, spotTemplate, yearFrom, yearTo, spotCode):
     return miList
 
 
+def _calcMortalityIndexTable(spotMapset, spotTemplate, yearFrom, yearTo):
+    # mortality index series of all spot codes from one spot area table
+    bboLib.debugMessage("bboPrognosisLib._calcMortalityIndexTable")
+
+    areaList = _getSpotAreas(spotMapset, spotTemplate, bboLib.updatedS50MaskTemplate, yearFrom - 1, yearTo)
+    miTable = {}
+    for spotCode in [OLD_SPOTCODE, SPREAD_SPOTCODE, INIT_SPOTCODE, ALL_SPOTCODE, NEW_SPOTCODE]:
+        miTable[spotCode] = _mortalityIndexSeries(areaList, yearFrom, yearTo, spotCode)
+    return miTable
+
+
+def _calcMortalityIndex(spotMapset, spotTemplate, yearFrom, yearTo, spotCode):
+    bboLib.debugMessage("bboPrognosisLib._calcMortalityIndex")
+
+    areaList = _getSpotAreas(spotMapset, spotTemplate, bboLib.updatedS50MaskTemplate, yearFrom - 1, yearTo)
+    return _mortalityIndexSeries(areaList, yearFrom, yearTo, spotCode)
+
+
 def _calcMortalityIndexAll(spotMapset, aspotTemplate, yearFrom, yearTo):
     return _calcMortalityIndex(spotMapset, aspotTemplate, yearFrom, yearTo, ALL_SPOTCODE)
 
@@ -2545,11 +2656,7 @@ def _calcMortalityIndexNew(spotMapset, aspotTemplate, yearFrom, yearTo):
     return _calcMortalityIndex(spotMapset, aspotTemplate, yearFrom, yearTo, NEW_SPOTCODE)
 
 
-def _calcMISeries(yearFrom, yearTo, spotCode):
-    bboLib.debugMessage("bboPrognosisLib._calcMISeries")
-
-    miList = _calcMortalityIndex(bboLib.forestMapset, bboLib.spotTemplate, yearFrom, yearTo, spotCode)
-
+def _miListToSeries(miList, yearFrom, yearTo):
     valList = []
     y1 = yearFrom
     i = 0
@@ -2566,7 +2673,22 @@ def _calcMISeries(yearFrom, yearTo, spotCode):
     return valList
 
 
-def _calcMISeriesStatistics(yearFrom, yearTo, spotCode):
+def _calcMISeries(yearFrom, yearTo, spotCode):
+    bboLib.debugMessage("bboPrognosisLib._calcMISeries")
+
+    miList = _calcMortalityIndex(bboLib.forestMapset, bboLib.spotTemplate, yearFrom, yearTo, spotCode)
+    return _miListToSeries(miList, yearFrom, yearTo)
+
+
+def _calcMISeriesTable(yearFrom, yearTo):
+    # yearly mortality index series of all spot codes, None for years without index
+    bboLib.debugMessage("bboPrognosisLib._calcMISeriesTable")
+
+    miTable = _calcMortalityIndexTable(bboLib.forestMapset, bboLib.spotTemplate, yearFrom, yearTo)
+    return dict([(spotCode, _miListToSeries(miList, yearFrom, yearTo)) for spotCode, miList in miTable.items()])
+
+
+def _calcMISeriesStatistics(yearFrom, yearTo, spotCode, quantiles=None, mi=None):
     bboLib.debugMessage("bboPrognosisLib._calcMISeriesStatistics")
 
     intervalLength = 2
@@ -2578,7 +2700,8 @@ def _calcMISeriesStatistics(yearFrom, yearTo, spotCode):
     iMinLength = []
     iMaxLength = []
 
-    mi = _calcMISeries(yearFrom, yearTo, spotCode)
+    if (mi is None):
+        mi = _calcMISeries(yearFrom, yearTo, spotCode)
 
     y0 = 0
     while ((yearFrom + y0) <= yearTo):
@@ -2659,11 +2782,13 @@ def _calcMISeriesStatistics(yearFrom, yearTo, spotCode):
     sumVal = 0
     sumVal2 = 0
     countVal = 0
+    periodValues = []
 
     y0 = progYear - yearFrom
     while (0 <= y0):
         if ((yearFrom + y0) <= yearTo):
             if (mi[y0] is not None):
+                periodValues.append(mi[y0])
                 countVal = countVal + 1
                 sumVal = sumVal + mi[y0]
                 sumVal2 = sumVal2 + mi[y0] * mi[y0]
@@ -2685,15 +2810,44 @@ def _calcMISeriesStatistics(yearFrom, yearTo, spotCode):
       optMI = 0.0  
     pesMI = avgMI + stdMI
 
-    miStatistics = collections.namedtuple("miStatistics", "prognosisYear, periodBeginning, periodLength, periodYear, miMin, miMax, miAvg, miStd, miOptimistics, miPesimistics")
-    return miStatistics(progYear, lcYear, perLength, perY, minMI, maxMI, avgMI, stdMI, optMI, pesMI)
+    quantileMI = []
+    if (quantiles):
+        for q in quantiles:
+            if (0 < countVal):
+                quantileMI.append((q, float(numpy.quantile(periodValues, q))))
+            else:
+                quantileMI.append((q, 0))
+
+    miStatistics = collections.namedtuple("miStatistics", "prognosisYear, periodBeginning, periodLength, periodYear, miMin, miMax, miAvg, miStd, miOptimistics, miPesimistics, miQuantiles")
+    return miStatistics(progYear, lcYear, perLength, perY, minMI, maxMI, avgMI, stdMI, optMI, pesMI, quantileMI)
+
 
+def _calcMIScenarios(yearFrom, yearTo, quantiles=None):
+    # mortality index statistics of all spot codes from one spot area table
+    bboLib.debugMessage("bboPrognosisLib._calcMIScenarios")
 
-def printMISeriesStatistics(yearFrom, yearTo, spotCode=NEW_SPOTCODE):
+    miSeries = _calcMISeriesTable(yearFrom, yearTo)
+    return dict([(spotCode, _calcMISeriesStatistics(yearFrom, yearTo, spotCode, quantiles, mi)) for spotCode, mi in miSeries.items()])
+
+
+def printMISeriesStatistics(yearFrom, yearTo, spotCode=NEW_SPOTCODE, quantiles=None):
     bboLib.debugMessage("bboPrognosisLib.printMISeriesStatistics")
 
-    miStat = _calcMISeriesStatistics(yearFrom, yearTo, spotCode)
+    _printMIStatistics(_calcMISeriesStatistics(yearFrom, yearTo, spotCode, quantiles))
+
+
+def printMIScenarios(yearFrom, yearTo, spotCodes, quantiles=None):
+    # statistics of several spot codes from one spot area table
+    bboLib.debugMessage("bboPrognosisLib.printMIScenarios")
 
+    miScenarios = _calcMIScenarios(yearFrom, yearTo, quantiles)
+    for spotCode in spotCodes:
+        grass.message("***")
+        grass.message(str.format("spot code: {0}", spotCode))
+        _printMIStatistics(miScenarios[spotCode])
+
+
+def _printMIStatistics(miStat):
     grass.message("***")
     grass.message(str.format("prognosis year: {0}", miStat.prognosisYear))
     grass.message(str.format("period beginning: {0}", miStat.periodBeginning))
@@ -2707,6 +2861,8 @@ def printMISeriesStatistics(yearFrom, yearTo, spotCode=NEW_SPOTCODE):
     grass.message(str.format("standard deviation: {0}", miStat.miStd))
     grass.message(str.format("optimistics: {0}", miStat.miOptimistics))
     grass.message(str.format("pesimistics: {0}", miStat.miPesimistics))
+    for q, val in miStat.miQuantiles:
+        grass.message(str.format("quantile {0}: {1}", q, val))
 
 #endregion MORTALITY_INDEX
 
@@ -3159,8 +3315,9 @@ def spotPrognosisByMaxInitSpreadProb(project, yearFrom, yearTo, probOffset):
     spreadProbTemplate = project["spreadModel"]["outputFN"]
     initProbTemplate = project["initModel"]["outputFN"]
     
-    spreadMI = _calcMortalityIndexSpread(bboLib.forestMapset, bboLib.spotTemplate, yearFrom, yearTo)
-    initMI = _calcMortalityIndexInit(bboLib.forestMapset, bboLib.spotTemplate, yearFrom, yearTo)
+    miTable = _calcMortalityIndexTable(bboLib.forestMapset, bboLib.spotTemplate, yearFrom, yearTo)
+    spreadMI = miTable[SPREAD_SPOTCODE]
+    initMI = miTable[INIT_SPOTCODE]
     
     spreadSpotProgTemplate = "tmp_bboplib_spmisp_s%Y"
     initSpotProgTemplate = "tmp_bboplib_spmisp_i%Y"
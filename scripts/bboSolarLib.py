@@ -13,6 +13,10 @@
 
 import sys
 import os
+import shutil
+import hashlib
+import multiprocessing
+import numpy
 import grass.script as grass
 import atexit
 import string
@@ -20,67 +24,216 @@ sys.path.append(os.path.join(os.environ["GISBASE"], "scripts"))
 import bboLib
 
 
+monthDay = [31, 28, 31, 30, 31, 30, 31, 31, 30, 31, 30, 31]
+
+
 def sumMonth(mapsetName, solarDayPrefix, solarMonthPrefix, grassMessage):
-    solarTmp = "tmp_solar_m"
+    grass.message(grassMessage)
+    aggregateSeries(mapsetName, dayRasters(solarDayPrefix), monthWindows(solarMonthPrefix), ["sum"])
+
+
+def sumYear(mapsetName, solarMonthPrefix, solarYear, grassMessage):
+    grass.message(grassMessage)
+    monthRasters = dict()
+    for iMonth in range(1, 13):
+        monthRasters[iMonth] = bboLib.rasterMonth(solarMonthPrefix, iMonth)
+    aggregateSeries(mapsetName, monthRasters, [(solarYear, 1, 12)], ["sum"])
+
+
+def dayRasters(solarDayPrefix, dayFrom=1, dayTo=365):
+    rasters = dict()
+    for iDay in range(dayFrom, dayTo + 1):
+        rasters[iDay] = bboLib.rasterDay(solarDayPrefix, iDay)
+    return rasters
+
 
+def monthWindows(outputPrefix):
+    windows = list()
+    iDay = 1
+    for iMonth in range(len(monthDay)):
+        windows.append((bboLib.rasterMonth(outputPrefix, iMonth + 1), iDay, iDay + monthDay[iMonth] - 1))
+        iDay += monthDay[iMonth]
+    return windows
+
+
+def decadeWindows(outputPrefix):
+    # three decades per month, the last one to the end of the month
+    windows = list()
+    iDay = 1
+    for iMonth in range(len(monthDay)):
+        for i in range(3):
+            dayFrom = iDay + 10 * i
+            dayTo = iDay + 10 * i + 9
+            if (i == 2):
+                dayTo = iDay + monthDay[iMonth] - 1
+            windows.append((bboLib.rasterMonth(outputPrefix, 3 * iMonth + i + 1), dayFrom, dayTo))
+        iDay += monthDay[iMonth]
+    return windows
+
+
+def aggregateSeries(mapsetName, rasters, windows, methods):
+    # rasters {index: raster name}, windows [(output name, index from, index to)]
+    # every raster is read once, aggregates are written after the last raster of the window,
+    # sum keeps the window name, other methods are written as name_method
     userMapset = grass.gisenv()["MAPSET"]
     if not userMapset == mapsetName:
         grass.run_command("g.mapset", mapset = mapsetName)
 
-    monthDay = [31, 28, 31, 30, 31, 30, 31, 31, 30, 31, 30, 31]
-
-    iDay = 1
-    nMonths = len(monthDay)
-    iOut = 1
-    for iMonth in range(0, nMonths):
-        grass.message(grassMessage + " {0}".format(iMonth + 1))
-        monthName = bboLib.rasterMonth(solarMonthPrefix, iMonth + 1)
-        bboLib.deleteRaster(monthName)
-        strCmd = solarTmp + str(iOut) + " = " + bboLib.rasterDay(solarDayPrefix,  iDay)
-        iOut = 3 - iOut
-        grass.mapcalc(strCmd, overwrite=True)
-        iDay = iDay + 1
-        nDays = monthDay[iMonth]
-        for i in range(1, nDays):
-            strCmd = solarTmp + str(iOut) + " = " + solarTmp + str(3 - iOut) + " + " + bboLib.rasterDay(solarDayPrefix, iDay)
-            iOut = 3 - iOut
-            grass.mapcalc(strCmd, overwrite=True)
-            iDay = iDay + 1
-        strCmd = "$output = " + solarTmp + str(3 - iOut)
-        grass.mapcalc(strCmd, overwrite=True, output=monthName)
-    
-    bboLib.deleteRaster(solarTmp + "1")
-    bboLib.deleteRaster(solarTmp + "2")
+    indexFrom = min([w[1] for w in windows])
+    indexTo = max([w[2] for w in windows])
+    accumulators = dict()
+    for i in range(indexFrom, indexTo + 1):
+        active = [w for w in windows if w[1] <= i and i <= w[2]]
+        if (len(active) == 0):
+            continue
+        if ((i % 10) == 0):
+            grass.message("aggregation {0}".format(rasters[i]))
+        values = bboLib.readRasterArray(rasters[i], True)
+        for w in active:
+            acc = accumulators.get(w[0])
+            if (acc is None):
+                accumulators[w[0]] = {"sum": values.copy(), "min": values.copy(), "max": values.copy(), "n": 1}
+            else:
+                acc["sum"] += values
+                acc["min"] = numpy.minimum(acc["min"], values)
+                acc["max"] = numpy.maximum(acc["max"], values)
+                acc["n"] += 1
+            if (i == w[2]):
+                _writeAggregate(w[0], accumulators.pop(w[0]), methods)
 
     if not userMapset == mapsetName:
         grass.run_command("g.mapset", mapset=userMapset)
 
 
-def sumYear(mapsetName, solarMonthPrefix, solarYear, grassMessage):
-    solarTmp = "tmp_solar_y"
+def _writeAggregate(outputName, acc, methods):
+    for method in methods:
+        if (method == "sum"):
+            bboLib.writeRasterArray(outputName, acc["sum"])
+        elif (method == "mean"):
+            bboLib.writeRasterArray(outputName + "_mean", acc["sum"] / acc["n"])
+        else:
+            bboLib.writeRasterArray(outputName + "_" + method, acc[method])
+
+
+def solarDaySeries(mapsetName, solarDayPrefix, demName, slopeName, aspectName, latitudeName, longitudeName,
+                   dayFrom, dayTo, calcStep, nProcs=1, horizonStep=0.0, useCache=True):
+    # daily r.sun global radiation, days are cached in the location _data directory
+    # by the content of the inputs and region, missing days are calculated in parallel worker mapsets
+    horizonName = "tmp_solar_horizon"
 
     userMapset = grass.gisenv()["MAPSET"]
     if not userMapset == mapsetName:
         grass.run_command("g.mapset", mapset = mapsetName)
 
-    grass.message(grassMessage)
+    reg = grass.region()
+    inputNames = [demName, slopeName, aspectName, latitudeName, longitudeName]
+    cacheKey = _solarCacheKey(inputNames, reg, calcStep, horizonStep)
+    cacheDir = bboLib.getFullDataFileName(os.path.join("solar_cache", cacheKey))
+    if not os.path.exists(cacheDir):
+        os.makedirs(cacheDir)
+
+    missingDays = list()
+    for iDay in range(dayFrom, dayTo + 1):
+        if (not useCache) or (not os.path.exists(_solarCacheFile(cacheDir, iDay))):
+            missingDays.append(iDay)
+    grass.message("potential solar irradiation: {0} days cached, {1} days to calculate".format(dayTo - dayFrom + 1 - len(missingDays), len(missingDays)))
+
+    if (0 < len(missingDays)):
+        rsunParams = dict(elevation=_fullName(demName), slope=_fullName(slopeName), aspect=_fullName(aspectName),
+                          lat=_fullName(latitudeName), long=_fullName(longitudeName), step=calcStep)
+        if (0.0 < horizonStep):
+            grass.message("horizon step {0}".format(horizonStep))
+            grass.run_command("r.horizon", elevation=demName, step=horizonStep, output=horizonName, overwrite=True, quiet=True)
+            # r.sun appends the angle to the basename, horizon rasters are found in the solar mapset by the worker search path
+            rsunParams["horizon_basename"] = horizonName
+            rsunParams["horizon_step"] = horizonStep
 
-    bboLib.deleteRaster(solarYear)
+        nProcs = max(1, min(nProcs, len(missingDays)))
+        workerMapsets = list()
+        jobs = list()
+        for i in range(nProcs):
+            workerMapset = "tmp_solar_{0}_{1}".format(os.getpid(), i)
+            gisrc = _createWorkerMapset(workerMapset, reg, mapsetName)
+            workerMapsets.append((workerMapset, gisrc))
+            jobs.append((gisrc, cacheDir, missingDays[i::nProcs], rsunParams))
 
-    strCmd = solarTmp + "1 = " + bboLib.rasterMonth(solarMonthPrefix, 1) + " + " + bboLib.rasterMonth(solarMonthPrefix, 2)
-    grass.mapcalc(strCmd, overwrite=True)
-    iOut = 2
-    for iMonth in range(3, 13):
-        monthName = bboLib.rasterMonth(solarMonthPrefix, iMonth)
-        strCmd = solarTmp + str(iOut) + " = " + solarTmp + str(3 - iOut) + " + " + monthName
-        iOut = 3 - iOut
-        grass.message(strCmd)
-        grass.mapcalc(strCmd, overwrite=True)
+        try:
+            if (nProcs == 1):
+                _solarDayWorker(jobs[0])
+            else:
+                pool = multiprocessing.Pool(nProcs)
+                pool.map(_solarDayWorker, jobs)
+                pool.close()
+                pool.join()
+        finally:
+            for workerMapset, gisrc in workerMapsets:
+                _deleteWorkerMapset(workerMapset, gisrc)
+            if (0.0 < horizonStep):
+                grass.run_command("g.remove", flags="f", type="raster", pattern=horizonName + "*", quiet=True)
 
-    strCmd = solarYear + " = " + solarTmp + str(3 - iOut)
-    grass.mapcalc(strCmd, overwrite=True)
-    bboLib.deleteRaster(solarTmp + "1")
-    bboLib.deleteRaster(solarTmp + "2")
+    for iDay in range(dayFrom, dayTo + 1):
+        values = numpy.fromfile(_solarCacheFile(cacheDir, iDay), dtype=numpy.double).reshape((reg["rows"], reg["cols"]))
+        bboLib.writeRasterArray(bboLib.rasterDay(solarDayPrefix, iDay), values)
 
     if not userMapset == mapsetName:
         grass.run_command("g.mapset", mapset=userMapset)
+
+
+def _solarDayWorker(job):
+    gisrc, cacheDir, days, rsunParams = job
+    env = os.environ.copy()
+    env["GISRC"] = gisrc
+    tmpName = "tmp_solar_day"
+    for iDay in days:
+        grass.message("potential solar irradiation day {0}".format(iDay))
+        grass.run_command("r.sun", glob_rad=tmpName, day=iDay, overwrite=True, quiet=True, env=env, **rsunParams)
+        cacheFile = _solarCacheFile(cacheDir, iDay)
+        grass.run_command("r.out.bin", flags="f", input=tmpName, output=cacheFile + ".tmp", null=bboLib.rasterNullValue, bytes=8,
+                          overwrite=True, quiet=True, env=env)
+        os.rename(cacheFile + ".tmp", cacheFile)
+
+
+def _solarCacheKey(inputNames, reg, calcStep, horizonStep):
+    h = hashlib.sha1()
+    for name in inputNames:
+        h.update(bboLib.readRasterArray(name).tobytes())
+    for k in ["n", "s", "e", "w", "rows", "cols"]:
+        h.update(str(reg[k]).encode())
+    h.update("{0} {1}".format(calcStep, horizonStep).encode())
+    return h.hexdigest()
+
+
+def _solarCacheFile(cacheDir, iDay):
+    return os.path.join(cacheDir, bboLib.rasterDay(bboLib.psrdayPrefix, iDay) + ".bin")
+
+
+def _fullName(rasterName):
+    if ("@" in rasterName):
+        return rasterName
+    return rasterName + "@" + grass.gisenv()["MAPSET"]
+
+
+def _createWorkerMapset(workerMapset, reg, searchMapset):
+    env = grass.gisenv()
+    locationDir = os.path.join(env["GISDBASE"], env["LOCATION_NAME"])
+    mapsetDir = os.path.join(locationDir, workerMapset)
+    if not os.path.exists(mapsetDir):
+        os.makedirs(mapsetDir)
+    shutil.copyfile(os.path.join(locationDir, "PERMANENT", "DEFAULT_WIND"), os.path.join(mapsetDir, "WIND"))
+
+    gisrc = grass.tempfile()
+    gisrcFile = open(gisrc, "w")
+    gisrcFile.write("GISDBASE: {0}\nLOCATION_NAME: {1}\nMAPSET: {2}\n".format(env["GISDBASE"], env["LOCATION_NAME"], workerMapset))
+    gisrcFile.close()
+
+    workerEnv = os.environ.copy()
+    workerEnv["GISRC"] = gisrc
+    grass.run_command("g.region", n=reg["n"], s=reg["s"], e=reg["e"], w=reg["w"], rows=reg["rows"], cols=reg["cols"], quiet=True, env=workerEnv)
+    grass.run_command("g.mapsets", operation="add", mapset=searchMapset, quiet=True, env=workerEnv)
+    return gisrc
+
+
+def _deleteWorkerMapset(workerMapset, gisrc):
+    env = grass.gisenv()
+    shutil.rmtree(os.path.join(env["GISDBASE"], env["LOCATION_NAME"], workerMapset), ignore_errors=True)
+    grass.try_remove(gisrc)
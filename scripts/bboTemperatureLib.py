@@ -0,0 +1,370 @@
+#!/usr/bin/env python
+#
+############################################################################
+#
+# MODULE:       bboTemperatureLib
+# AUTHOR(S):	Miroslav Blazenec, Rastislav Jakus, Milan Koren
+# PURPOSE:      Air and bark temperature library
+# COPYRIGHT:	This program is free software under the GNU General Public
+#		License (>=v2). Read the file COPYING that comes with GRASS
+#		for details.
+#
+#############################################################################
+
+import sys
+import os
+import json
+import multiprocessing
+import numpy
+import grass.script as grass
+sys.path.append(os.path.join(os.environ["GISBASE"], "scripts"))
+import bboLib
+
+
+def stationElevation(meteostationName, demName):
+    values = bboLib.samplePointSeries([demName], bboLib.getVectorPoints(meteostationName)[:1])
+    if (values.size == 0 or numpy.isnan(values[0, 0])):
+        grass.fatal("Meteo station {0} is out of the DEM {1}".format(meteostationName, demName))
+    return float(values[0, 0])
+
+
+idwPower = 2.0
+atDaysChunk = 16
+btDaysChunk = 16
+
+
+# meteo stations ordered by category (column order of the station series) and their DEM elevation
+def stationNetwork(meteostationName, demName):
+    points = bboLib.getVectorPoints(meteostationName, True)
+    points = sorted(points, key=lambda p: p[2] if (2 < len(p)) else 0)
+    xy = [(p[0], p[1]) for p in points]
+    if (len(xy) == 0):
+        grass.fatal("Meteo station layer {0} has no points".format(meteostationName))
+    elevations = bboLib.samplePointSeries([demName], xy)[:, 0]
+    if (numpy.any(numpy.isnan(elevations))):
+        grass.fatal("Meteo station {0} is out of the DEM {1}".format(meteostationName, demName))
+    return numpy.array(xy), elevations
+
+
+# daily trend value = a + b*elevation, b fitted by least squares on the stations with values,
+# defaultRates for less than two stations or no elevation difference
+def lapseTrend(values, elevations, defaultRates, fitRates=True):
+    nDays = values.shape[0]
+    a = numpy.full(nDays, numpy.nan)
+    b = numpy.array(defaultRates, dtype=numpy.double)
+    zMean = numpy.full(nDays, numpy.nan)
+    for i in range(nDays):
+        known = ~numpy.isnan(values[i])
+        if (not numpy.any(known)):
+            continue
+        z = elevations[known]
+        v = values[i, known]
+        if (fitRates and 1 < z.size and 1.0 < numpy.ptp(z)):
+            b[i] = numpy.polyfit(z, v, 1)[0]
+        a[i] = numpy.mean(v - b[i]*z)
+        zMean[i] = numpy.mean(z)
+    return a, b, zMean
+
+
+def _distances(cells, stations):
+    return numpy.hypot(cells[:, :1] - stations[:, 0], cells[:, 1:] - stations[:, 1])
+
+
+def idwWeights(cells, stations):
+    d = _distances(cells, stations)
+    with numpy.errstate(divide="ignore"):
+        w = 1.0 / d**idwPower
+    # cells at a station take its value
+    exact = (d == 0)
+    atStation = numpy.any(exact, axis=1)
+    w[atStation] = exact[atStation]
+    return w / numpy.sum(w, axis=1, keepdims=True)
+
+
+def krigingWeights(cells, stations, rangeDistance):
+    # ordinary kriging, exponential variogram without nugget (weights do not depend on the sill)
+    n = stations.shape[0]
+    a = numpy.ones((n + 1, n + 1))
+    a[:n, :n] = 1.0 - numpy.exp(-3.0*_distances(stations, stations)/rangeDistance)
+    a[n, n] = 0.0
+    b = numpy.ones((cells.shape[0], n + 1))
+    b[:, :n] = 1.0 - numpy.exp(-3.0*_distances(cells, stations)/rangeDistance)
+    return numpy.dot(b, numpy.linalg.pinv(a).T)[:, :n]
+
+
+def residualSurface(cells, stations, residuals, method, rangeDistance):
+    # residuals (day, station) interpolated to the cells, weights computed once per set of stations with values
+    result = numpy.zeros((residuals.shape[0], cells.shape[0]), dtype=numpy.float32)
+    known = ~numpy.isnan(residuals)
+    for pattern in numpy.unique(known, axis=0):
+        if (not numpy.any(pattern)):
+            continue
+        days = numpy.all(known == pattern, axis=1)
+        if (method == "kriging"):
+            w = krigingWeights(cells, stations[pattern], rangeDistance)
+        else:
+            w = idwWeights(cells, stations[pattern])
+        result[days] = numpy.dot(residuals[days][:, pattern], w.T)
+    return result
+
+
+def _residualTileWorker(job):
+    cells, stations, residualMean, residualMax, method, rangeDistance = job
+    return (residualSurface(cells, stations, residualMean, method, rangeDistance),
+            residualSurface(cells, stations, residualMax, method, rangeDistance))
+
+
+def _regionCells(reg, rows):
+    r, c = numpy.mgrid[rows[0]:rows[1], 0:reg["cols"]]
+    x = float(reg["w"]) + (c.ravel() + 0.5)*float(reg["ewres"])
+    y = float(reg["n"]) - (r.ravel() + 0.5)*float(reg["nsres"])
+    return numpy.column_stack((x, y))
+
+
+# mean and maximal air temperature series from the meteo station network:
+# lapse   - first station shifted by the standard lapse rate (bbo.temperature_air formula)
+# idw     - daily lapse rate fitted on the stations, inverse distance weighted residuals
+# kriging - daily lapse rate fitted on the stations, ordinary kriging of residuals
+# residual surfaces are evaluated tile-wise in nProcs processes
+def networkTemperature(dayFrom, dayTo, demName, meteostationName, method,
+                       tmeanSeries, tmaxSeries, tgradSeries, srSeries, meanPrefix, maxPrefix,
+                       nProcs=1, rangeDistance=0.0, srPrefix=bboLib.srdayPrefix, srMapset=bboLib.solarMapset):
+    stations, elevations = stationNetwork(meteostationName, demName)
+    days = numpy.arange(dayFrom, dayTo + 1)
+    tmean = bboLib.seriesInterpolation(tmeanSeries, days, column=None)
+    tmax = bboLib.seriesInterpolation(tmaxSeries, days, column=None)
+    tgrad = bboLib.seriesInterpolation(tgradSeries, days)
+    msSR = bboLib.seriesInterpolation(srSeries, days)
+
+    if (method == "lapse"):
+        stations = stations[:1]
+        elevations = elevations[:1]
+        tmean = tmean[:, :1]
+        tmax = tmax[:, :1]
+    elif (tmean.shape[1] != stations.shape[0] or tmax.shape[1] != stations.shape[0]):
+        grass.fatal("Air temperature series must have one column per meteo station ({0})".format(stations.shape[0]))
+    fitRates = (method != "lapse")
+    meanA, meanB, meanZ = lapseTrend(tmean, elevations, tgrad, fitRates)
+    maxA, maxB, maxZ = lapseTrend(tmax, elevations, tgrad, fitRates)
+    residualMean = tmean - meanA[:, numpy.newaxis] - meanB[:, numpy.newaxis]*elevations
+    residualMax = tmax - maxA[:, numpy.newaxis] - maxB[:, numpy.newaxis]*elevations
+    grass.message("air temperature: {0} stations, method {1}".format(stations.shape[0], method))
+
+    reg = grass.region()
+    shape = (reg["rows"], reg["cols"])
+    dem = bboLib.readRasterArray(demName, True)
+    if (rangeDistance <= 0 and 1 < stations.shape[0]):
+        rangeDistance = numpy.max(_distances(stations, stations)) / 2.0
+    if (method == "kriging" and rangeDistance <= 0):
+        # one station location, the variogram is not defined
+        grass.warning("Kriging needs at least two station locations, IDW of residuals is used")
+        method = "idw"
+    tiles = [(t[0], t[-1] + 1) for t in numpy.array_split(numpy.arange(shape[0]), max(1, nProcs)) if (0 < t.size)]
+    tileCells = [_regionCells(reg, t) for t in tiles]
+
+    pool = None
+    if (1 < len(tiles) and method != "lapse"):
+        pool = multiprocessing.Pool(len(tiles))
+    try:
+        for i0 in range(0, days.size, atDaysChunk):
+            i1 = min(i0 + atDaysChunk, days.size)
+            if (method == "lapse"):
+                surfaces = None
+            else:
+                jobs = [(cells, stations, residualMean[i0:i1], residualMax[i0:i1], method, rangeDistance) for cells in tileCells]
+                results = pool.map(_residualTileWorker, jobs) if pool else [_residualTileWorker(j) for j in jobs]
+                surfaces = [numpy.concatenate([r[k] for r in results], axis=1).reshape((i1 - i0,) + shape) for k in range(2)]
+
+            for i in range(i0, i1):
+                iDay = int(days[i])
+                grass.message("air temperature day {0}".format(iDay))
+                meanName = bboLib.rasterDay(meanPrefix, iDay)
+                maxName = bboLib.rasterDay(maxPrefix, iDay)
+                bboLib.deleteRaster(meanName)
+                bboLib.deleteRaster(maxName)
+
+                if (not numpy.isnan(meanA[i]) and not numpy.isnan(meanB[i])):
+                    values = meanA[i] + meanB[i]*dem
+                    if (surfaces):
+                        values += surfaces[0][i - i0]
+                    bboLib.writeRasterArray(meanName, values)
+
+                if (not numpy.isnan(maxA[i]) and not numpy.isnan(maxB[i]) and not numpy.isnan(msSR[i])):
+                    sr = bboLib.readRasterArray(bboLib.rasterDayMapset(srPrefix, iDay, srMapset), True)
+                    # lapse rate scaled by the solar irradiation relative to the stations
+                    values = maxA[i] + maxB[i]*maxZ[i] + maxB[i]*(dem - maxZ[i])*(sr/msSR[i])
+                    if (surfaces):
+                        values += surfaces[1][i - i0]
+                    bboLib.writeRasterArray(maxName, values)
+    finally:
+        if (pool):
+            pool.close()
+            pool.join()
+
+
+# bark temperature coefficient sets {selector code or "default": (mean, max, eff)} from the parameter file
+# (location _data directory), {"1": {"mean": [a1, a2, a3], "max": [a1, a2, a3, a4], "eff": [a1, a2]}, ...},
+# missing products of a set use the default coefficients
+def barkCoefficients(parametersFN=None):
+    default = (bboLib.btMeanCoefficients, bboLib.btMaxCoefficients, bboLib.btEffCoefficients)
+    if (not parametersFN):
+        return {"default": default}
+    jsonFile = open(bboLib.getFullDataFileName(parametersFN), "r")
+    parameters = json.load(jsonFile)
+    jsonFile.close()
+    sets = dict()
+    for code, values in parameters.items():
+        coefficients = (values.get("mean", default[0]), values.get("max", default[1]), values.get("eff", default[2]))
+        for c, n in zip(coefficients, [3, 4, 2]):
+            if (len(c) != n):
+                grass.fatal("Bark temperature coefficients {0} set {1} must have {2} values".format(parametersFN, code, n))
+        sets[code] = tuple(numpy.array(c, dtype=numpy.double) for c in coefficients)
+    return sets
+
+
+def barkCoefficientGrids(sets, selector=None):
+    # coefficients of every cell (coefficient, row, col) by the selector raster codes, scalars without selector
+    if (selector is None):
+        if ("default" not in sets):
+            grass.fatal("Bark temperature coefficients without selector raster need the default set")
+        return tuple(numpy.array(c, dtype=numpy.double).reshape((-1, 1, 1)) for c in sets["default"])
+    grids = [numpy.full((n,) + selector.shape, numpy.nan) for n in [3, 4, 2]]
+    assigned = numpy.zeros(selector.shape, dtype=bool)
+    for code in sets:
+        if (code == "default"):
+            continue
+        cells = (selector == float(code))
+        assigned |= cells
+        for g, c in zip(grids, sets[code]):
+            g[:, cells] = numpy.reshape(c, (-1, 1))
+    if ("default" in sets):
+        for g, c in zip(grids, sets["default"]):
+            g[:, ~assigned] = numpy.reshape(c, (-1, 1))
+    return tuple(grids)
+
+
+def barkTemperature(atMean, atMax, sr, coefficients):
+    # bt mean, max and eff of air temperature and solar irradiation arrays (day, row, col) or (row, col)
+    cMean, cMax, cEff = coefficients
+    btMean = cMean[0] + cMean[1]*sr + cMean[2]*atMean
+    btMax = cMax[0] + cMax[1]*sr + cMax[2]*atMax + cMax[3]*atMean
+    btEff = (cEff[0] + cEff[1]*btMax) / 24.0
+    return btMean, btMax, btEff
+
+
+def barkTemperatureSeries(dayFrom, dayTo, coefficients, meanPrefix, maxPrefix, effPrefix,
+                          atMeanPrefix=bboLib.atMeanPrefix, atMaxPrefix=bboLib.atMaxPrefix):
+    # season of bark temperature in chunks of days, days without air temperature or solar rasters are skipped
+    days = list(range(dayFrom, dayTo + 1))
+    for i0 in range(0, len(days), btDaysChunk):
+        chunk = list()
+        for iDay in days[i0:i0 + btDaysChunk]:
+            names = [bboLib.rasterDayMapset(bboLib.srdayPrefix, iDay, bboLib.solarMapset),
+                     bboLib.rasterDayMapset(atMeanPrefix, iDay, bboLib.atMapset),
+                     bboLib.rasterDayMapset(atMaxPrefix, iDay, bboLib.atMapset)]
+            for prefix in [meanPrefix, maxPrefix, effPrefix]:
+                bboLib.deleteRaster(bboLib.rasterDay(prefix, iDay))
+            if (bboLib.validateRasters(names)):
+                chunk.append((iDay, names))
+        if (len(chunk) == 0):
+            continue
+
+        sr, atMean, atMax = [numpy.array([bboLib.readRasterArray(names[k], True) for iDay, names in chunk]) for k in range(3)]
+        products = barkTemperature(atMean, atMax, sr, coefficients)
+        for i, (iDay, names) in enumerate(chunk):
+            grass.message("bark temperature day {0}".format(iDay))
+            for prefix, values in zip([meanPrefix, maxPrefix, effPrefix], products):
+                bboLib.writeRasterArray(bboLib.rasterDay(prefix, iDay), values[i])
+
+
+# air and bark temperature computed from the DEM lapse rate and meteo station series on demand,
+# same formulas as bbo.temperature_air and bbo.temperature_bark
+class virtualTemperature:
+    def __init__(self, demName="dem@dem", meteostationName=None,
+                 tgradFN="tgrad_std.txt", tmeanFN="md_tmean_1.txt", tmaxFN="md_tmax_1.txt", gsrFN="md_gsr_1.txt",
+                 srPrefix=bboLib.srdayPrefix, srMapset=bboLib.solarMapset,
+                 coefficients=None, coefficientsFN=None, selectorName=None):
+        # coefficients from barkCoefficientGrids, coefficientsFN and selectorName only name their inputs
+        if (meteostationName is None):
+            meteostationName = bboLib.shpMeteostation + "@" + bboLib.shpMapset
+        self.demName = demName
+        self.dem = bboLib.readRasterArray(demName, True)
+        self.msElev = stationElevation(meteostationName, demName)
+        self.tgradSeries = bboLib.loadDataSeries(tgradFN)
+        self.tmeanSeries = bboLib.loadDataSeries(tmeanFN)
+        self.tmaxSeries = bboLib.loadDataSeries(tmaxFN)
+        self.srSeries = bboLib.loadDataSeries(gsrFN)
+        self.seriesNames = [tgradFN, tmeanFN, tmaxFN, gsrFN]
+        if (coefficients is None):
+            coefficients = barkCoefficientGrids(barkCoefficients())
+        self.coefficients = coefficients
+        if (coefficientsFN):
+            self.seriesNames.append(coefficientsFN)
+        self.selectorName = selectorName
+        self.srPrefix = srPrefix
+        self.srMapset = srMapset
+        self.srDay = None
+        self.sr = None
+
+    def inputs(self, dayFrom, dayTo):
+        # rasters and series the temperature of days dayFrom - dayTo is calculated from
+        rasterNames = [self.demName]
+        if (self.selectorName):
+            rasterNames.append(self.selectorName)
+        rasterNames += [bboLib.rasterDayMapset(self.srPrefix, iDay, self.srMapset) for iDay in range(dayFrom, dayTo + 1)]
+        return rasterNames, list(self.seriesNames)
+
+    def solar(self, iDay, rows=None):
+        if (self.srDay != iDay):
+            self.sr = bboLib.readRasterArray(bboLib.rasterDayMapset(self.srPrefix, iDay, self.srMapset), True)
+            self.srDay = iDay
+        return _tile(self.sr, rows)
+
+    def airMean(self, iDay, rows=None):
+        dt = bboLib.linearInterpolation(self.tmeanSeries, iDay)
+        dc = bboLib.linearInterpolation(self.tgradSeries, iDay)
+        if (dt is None or dc is None):
+            return None
+        return dc * (_tile(self.dem, rows) - self.msElev) + dt
+
+    def airMax(self, iDay, rows=None):
+        dc = bboLib.linearInterpolation(self.tgradSeries, iDay)
+        dm = bboLib.linearInterpolation(self.tmaxSeries, iDay)
+        msSR = bboLib.linearInterpolation(self.srSeries, iDay)
+        if (dc is None or dm is None or msSR is None):
+            return None
+        return dc * (_tile(self.dem, rows) - self.msElev) * (self.solar(iDay, rows) / msSR) + dm
+
+    def bark(self, iDay, rows=None):
+        # bt mean, max and eff as barkTemperature, None out of the meteo station series
+        atMean = self.airMean(iDay, rows)
+        atMax = self.airMax(iDay, rows)
+        if (atMean is None or atMax is None):
+            return None
+        coefficients = tuple(_tileCoefficients(c, rows) for c in self.coefficients)
+        return barkTemperature(atMean, atMax, self.solar(iDay, rows), coefficients)
+
+    def barkMean(self, iDay, rows=None):
+        bt = self.bark(iDay, rows)
+        return None if bt is None else bt[0]
+
+    def barkMax(self, iDay, rows=None):
+        bt = self.bark(iDay, rows)
+        return None if bt is None else bt[1]
+
+    def barkEff(self, iDay, rows=None):
+        bt = self.bark(iDay, rows)
+        return None if bt is None else bt[2]
+
+
+def _tile(values, rows):
+    if (rows is None):
+        return values
+    return values[rows[0]:rows[1]]
+
+
+def _tileCoefficients(values, rows):
+    # coefficient grids (coefficient, row, col), scalar coefficients (coefficient, 1, 1) are shared by all rows
+    if (rows is None or values.shape[1] == 1):
+        return values
+    return values[:, rows[0]:rows[1]]